@@ -19,8 +19,7 @@
 
 #include "32u4_ISP.h"
 #include "32u4_EEPROM.h"
-
-//#define DEBUG
+#include "32u4_Serial.h"
 
 // Status LED
 
@@ -39,12 +38,15 @@
 #define INFO_HWMAJ  "0"
 #define INFO_HWMIN  "1"
 #define INFO_SWMAJ  "0"
-#define INFO_SWMIN  "1"
+#define INFO_SWMIN  "5"
 #define INFO_DATE   "03/11/2019 12:16:00"
-#define INFO_STR    "Title: " INFO_TITLE "$Hardware Version: " INFO_HWMAJ "." INFO_HWMIN "$Software Version: " INFO_SWMAJ "." INFO_SWMIN "$Date: " INFO_DATE
+#define INFO_READ   "65536" // Supported bulk read rate, bytes per second
+#define INFO_CMDS   "VADTRrWwPCBFE" // Supported command characters
+#define INFO_STR    "Title: " INFO_TITLE "$Hardware Version: " INFO_HWMAJ "." INFO_HWMIN "$Software Version: " INFO_SWMAJ "." INFO_SWMIN "$Date: " INFO_DATE "$Read Rate: " INFO_READ \
+                    "$Buffer Size: " TOSTRING(BUFFERSIZE) "$Max Block: " TOSTRING(BUFFERSIZE) "$Window: " TOSTRING(RX_SLOTS) "$Baud Rate: " TOSTRING(BAUDRATE) "$Commands: " INFO_CMDS
 
-#define BUFFERSIZE  1024
-#define COMMANDSIZE 32
+#define STRINGIFY(x) #x
+#define TOSTRING(x)  STRINGIFY(x)
 
 // Command Structure and Buffers
 
@@ -62,22 +64,34 @@
 #define CMD_READ_HEX_CH     'R'
 #define CMD_READ_BIN        11
 #define CMD_READ_BIN_CH     'r'
+#define CMD_CHECKSUM        12
+#define CMD_CHECKSUM_CH     'C'
+#define CMD_BLANK_CHECK     13
+#define CMD_BLANK_CHECK_CH  'B'
 
 #define CMD_WRITE_HEX       20
 #define CMD_WRITE_HEX_CH    'W'
 #define CMD_WRITE_BIN       21
 #define CMD_WRITE_BIN_CH    'w'
+#define CMD_WRITE_PAGE      22
+#define CMD_WRITE_PAGE_CH   'P'
+#define CMD_FILL            23
+#define CMD_FILL_CH         'F'
+#define CMD_CHIP_ERASE      24
+#define CMD_CHIP_ERASE_CH   'E'
 
 typedef struct cmd {
   uint8_t code;
+  uint8_t opcode; // Command character, echoed in response frame
+  uint8_t sequence; // Echoed in response frame
+  uint8_t status;
   uint16_t startAddress;
   uint16_t dataLength;
   uint8_t lineLength;
+  uint8_t* data; // Input data following parameters in frame payload
+  uint16_t inputLength;
 } Command;
 
-uint8_t block_buffer[BUFFERSIZE]; // Block storage
-char cmd_buffer[COMMANDSIZE]; // Command line parsing buffer
-
 // Main
 
 void setup() {
@@ -96,105 +110,134 @@ void setup() {
   // Setup Programmers
   setupEEPROM();
   setupISP();
+
+  // Keep receiving the next block while waiting on EEPROM write cycles
+  eeprom_idle = rx_poll;
 }
 
 void loop() {
-  uint8_t i = 0;
   uint16_t index = 0;
+  uint32_t checksum = 0;
+  uint32_t length = 0;
 
   // Wait for command to come in
-  readCommand();
+  rx_poll();
+  Frame* frame = rx_next();
+  if (frame == NULL) return;
+
   setStatus(HIGH);
-  
-  Command command = parseCommand();
+  Command command = parseCommand(frame);
+
+  if (command.status != STATUS_OK) {
+    sendStatus(command.opcode, command.sequence, command.status);
+    rx_release();
+    setStatus(LOW);
+    return;
+  }
+
+  eeprom_fail_address = command.startAddress;
 
   // Filter command values
   uint16_t endAddress = command.startAddress + command.dataLength - 1;
-  if (command.dataLength > BUFFERSIZE) command.dataLength = BUFFERSIZE;
-  if (command.lineLength == 0) command.lineLength = 32;
+  if (command.code == CMD_READ_HEX && command.lineLength == 0) command.lineLength = 32;
+  if ((command.code == CMD_READ_HEX || command.code == CMD_READ_BIN || command.code == CMD_CHECKSUM || command.code == CMD_BLANK_CHECK || command.code == CMD_FILL) && command.dataLength == 0) command.code = CMD_NONE;
 
   switch (command.code) {
     case CMD_VERSION:
-      Serial.println(INFO_STR);
+      frame_begin(command.opcode, command.sequence, 1 + sizeof(INFO_STR) - 1);
+      tx_write(STATUS_OK);
+      tx_print(INFO_STR);
+      frame_end();
       break;
     case CMD_TONE:
       doTone();
+      sendStatus(command.opcode, command.sequence, STATUS_OK);
       break;
     case CMD_SET_ADDRESS:
-      #ifdef DEBUG
-      Serial.print("Setting address bus to 0x");
-      printAddress(command.startAddress);
-      Serial.println();
-      #endif
       set_address_bus(command.startAddress);
+      sendStatus(command.opcode, command.sequence, STATUS_OK);
       break;
     case CMD_SET_DATA:
-      #ifdef DEBUG
-      Serial.print("Setting data bus to 0x");
-      printByte(command.startAddress & 0x00FF);
-      Serial.println();
-      #endif
       write_data_bus(command.startAddress & 0x00FF);
+      sendStatus(command.opcode, command.sequence, STATUS_OK);
       break;
     case CMD_READ_HEX:
+      // Response length is only 16 bits
+      length = 1 + read_block_length(command.dataLength, command.lineLength);
+      if (length > 0xFFFF) {
+        sendStatus(command.opcode, command.sequence, STATUS_INVALID);
+        break;
+      }
+
+      frame_begin(command.opcode, command.sequence, length);
+      tx_write(STATUS_OK);
       read_block(command.startAddress, endAddress, command.lineLength);
-      Serial.println('%');
+      frame_end();
       break;
     case CMD_READ_BIN:
+      frame_begin(command.opcode, command.sequence, 1 + command.dataLength);
+      tx_write(STATUS_OK);
       read_binblock(command.startAddress, endAddress);
+      frame_end();
       break;
-    case CMD_WRITE_HEX:
-      #ifdef DEBUG
-      Serial.println("Waiting for ");
-      Serial.print(command.dataLength);
-      Serial.println(" bytes");
-      #endif
-      while (index / 2 < command.dataLength) {
-        if (Serial.available()) {
-          cmd_buffer[index++] = Serial.read();
-        }
+    case CMD_CHECKSUM:
+      checksum = crc32_block(command.startAddress, endAddress);
+      frame_begin(command.opcode, command.sequence, 5);
+      tx_write(STATUS_OK);
+      for (index = 0; index < 4; index++) {
+        tx_write(checksum & 0xFF);
+        checksum >>= 8;
       }
-      
-      #ifdef DEBUG
-      index = 0;
-      Serial.print("Received ");
-      while (index / 2 < command.dataLength) {
-        Serial.print(cmd_buffer[index++]);
+      frame_end();
+      break;
+    case CMD_BLANK_CHECK:
+      sendStatus(command.opcode, command.sequence, blank_check(command.startAddress, endAddress));
+      break;
+    case CMD_WRITE_HEX:
+      if (command.inputLength != (uint32_t)command.dataLength * 2) {
+        sendStatus(command.opcode, command.sequence, STATUS_INVALID);
+        break;
       }
-      Serial.println();
-      #endif
-      
-      index = 0;
+
+      // Convert hex characters to bytes in place
       while (index < command.dataLength) {
-        block_buffer[index] = hexByte(cmd_buffer + (index * 2));
+        command.data[index] = hexByte((char*)command.data + (index * 2));
         index++;
       }
 
-      #ifdef DEBUG
-      index = 0;
-      Serial.print("Interpretted ");
-      while (index < command.dataLength) {
-        printByte(block_buffer[index++]);
-      }
-      Serial.println();
-      #endif
-      
-      write_block(command.startAddress, block_buffer, command.dataLength);
-      
-      Serial.println('%');
+      sendStatus(command.opcode, command.sequence, write_block(command.startAddress, command.data, command.dataLength));
       break;
     case CMD_WRITE_BIN:
-      while (index < command.dataLength) {
-        if (Serial.available()) {
-          block_buffer[index++] = Serial.read();
-        }
+      if (command.inputLength != command.dataLength) {
+        sendStatus(command.opcode, command.sequence, STATUS_INVALID);
+        break;
+      }
+      sendStatus(command.opcode, command.sequence, write_block(command.startAddress, command.data, command.dataLength));
+      break;
+    case CMD_WRITE_PAGE:
+      if (command.inputLength != command.dataLength) {
+        sendStatus(command.opcode, command.sequence, STATUS_INVALID);
+        break;
+      }
+      sendStatus(command.opcode, command.sequence, write_pages(command.startAddress, command.data, command.dataLength, command.lineLength));
+      break;
+    case CMD_FILL:
+      // Single input byte is the fill value, the frame buffer is reused to write it in pages
+      if (command.inputLength != 1) {
+        sendStatus(command.opcode, command.sequence, STATUS_INVALID);
+        break;
       }
-      write_block(command.startAddress, block_buffer, command.dataLength);
-      
-      Serial.println('%');
+      sendStatus(command.opcode, command.sequence, fill_block(command.startAddress, command.data, command.dataLength, command.lineLength));
+      break;
+    case CMD_CHIP_ERASE:
+      sendStatus(command.opcode, command.sequence, chip_erase());
+      break;
+    default:
+      sendStatus(command.opcode, command.sequence, STATUS_INVALID);
       break;
   }
 
+  rx_release();
   setStatus(LOW);
 }
 
@@ -202,39 +245,30 @@ void loop() {
  * Command and Parsing Functions *
  *********************************/
 
-void readCommand() {
-  // Clear command buffer
-  for (uint8_t i = 0; i < COMMANDSIZE; i++) cmd_buffer[i] = 0;
-
-  char c = ' ';
-  uint16_t index = 0;
-
-  // Read serial data until linebreak or buffer is full
-  do {
-    if (Serial.available()) {
-      c = Serial.read();
-      cmd_buffer[index++] = c;
-    }
-  } while (c != '\n' && index < COMMANDSIZE); // Save room for termination char
-
-  // Change last new line to '\0' termination
-  cmd_buffer[index - 1] = 0;
-}
-
-Command parseCommand() {
+// Frame: SYNC, opcode, sequence, length (LE), payload, CRC16 (LE) of opcode through payload
+// Payload: start address (LE), data length (LE), line length, input data
+Command parseCommand(Frame* frame) {
   Command command;
-  
-  // Convert commas to '\0' terminator
-  cmd_buffer[1] = 0; // Command character
-  cmd_buffer[6] = 0; // Start address (4 bytes)
-  cmd_buffer[11] = 0; // End address length (4 bytes)
-  cmd_buffer[14] = 0; // Line Length (2 bytes)
-
-  command.startAddress = hexWord(cmd_buffer + 2);
-  command.dataLength = hexWord(cmd_buffer + 7);
-  command.lineLength = hexByte(cmd_buffer + 12);
+  command.code = CMD_NONE;
+  command.opcode = frame->opcode;
+  command.sequence = frame->sequence;
+  command.status = frame->status;
+  command.startAddress = 0;
+  command.dataLength = 0;
+  command.lineLength = 0;
+  command.data = frame->buffer + FRAME_PARAMS;
+  command.inputLength = 0;
+
+  if (command.status != STATUS_OK) return command;
+
+  if (frame->length >= FRAME_PARAMS) {
+    command.startAddress = frame->buffer[0] | (frame->buffer[1] << 8);
+    command.dataLength = frame->buffer[2] | (frame->buffer[3] << 8);
+    command.lineLength = frame->buffer[4];
+    command.inputLength = frame->length - FRAME_PARAMS;
+  }
 
-  switch (cmd_buffer[0]) {
+  switch (command.opcode) {
     case CMD_SET_ADDRESS_CH:
       command.code = CMD_SET_ADDRESS;
       break;
@@ -247,12 +281,27 @@ Command parseCommand() {
     case CMD_READ_BIN_CH:
       command.code = CMD_READ_BIN;
       break;
+    case CMD_CHECKSUM_CH:
+      command.code = CMD_CHECKSUM;
+      break;
+    case CMD_BLANK_CHECK_CH:
+      command.code = CMD_BLANK_CHECK;
+      break;
     case CMD_WRITE_HEX_CH:
       command.code = CMD_WRITE_HEX;
       break;
     case CMD_WRITE_BIN_CH:
       command.code = CMD_WRITE_BIN;
       break;
+    case CMD_WRITE_PAGE_CH:
+      command.code = CMD_WRITE_PAGE;
+      break;
+    case CMD_FILL_CH:
+      command.code = CMD_FILL;
+      break;
+    case CMD_CHIP_ERASE_CH:
+      command.code = CMD_CHIP_ERASE;
+      break;
     case CMD_VERSION_CH:
       command.code = CMD_VERSION;
       break;
@@ -282,17 +331,25 @@ uint8_t hexDigit(char c) {
 uint8_t hexByte(char* a) {
   return (hexDigit(a[0]) << 4) + hexDigit(a[1]);
 }
-uint16_t hexWord(char* data) {
-  return (hexDigit(data[0]) << 12) +
-         (hexDigit(data[1]) << 8) +
-         (hexDigit(data[2]) << 4) +
-          hexDigit(data[3]);
-}
 
 /*********************
  * Status Indication *
  *********************/
 
+// Status response frame, followed by the failed address (LE) if status is not OK
+void sendStatus(uint8_t opcode, uint8_t sequence, uint8_t status) {
+  if (status == STATUS_OK) {
+    frame_begin(opcode, sequence, 1);
+    tx_write(status);
+  } else {
+    frame_begin(opcode, sequence, 3);
+    tx_write(status);
+    tx_write(eeprom_fail_address & 0xFF);
+    tx_write(eeprom_fail_address >> 8);
+  }
+  frame_end();
+}
+
 void setStatus(uint8_t state) {
   digitalWrite(STATUS, state);
 }
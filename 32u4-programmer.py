@@ -7,14 +7,20 @@
 # Updated: 20/08/2019
 # https://dcooperdalrymple.com/
 #
-# Requires Python 2.7 or later; will not work with Python 3.0 or later
+# Requires Python 3
 
 import os
-
-from app.controller import AppController
-from app.view import AppView # wxPython UI
+import sys
 
 def main():
+    # Any arguments run the headless command line interface instead of the wxPython UI
+    if len(sys.argv) > 1:
+        from app import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
+    from app.controller import AppController
+    from app.view import AppView # wxPython UI
+
     AppController(AppView).run()
 
 if __name__ == '__main__':
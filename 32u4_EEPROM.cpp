@@ -5,11 +5,25 @@
  */
 
 #include "32u4_EEPROM.h"
+#include "32u4_Serial.h"
+
+#ifdef ADDRESS_SPI
+#include <SPI.h>
+#endif
+
+uint16_t eeprom_fail_address = 0; // Address of last failed write
+void (*eeprom_idle)() = NULL;
+
 
 void setupEEPROM() {
+  #ifdef ADDRESS_SPI
+  SPI.begin();
+  SPI.beginTransaction(SPISettings(ADDRESS_SPI_CLOCK, LSBFIRST, SPI_MODE0));
+  #else
   pinMode(DATA, OUTPUT);
-  pinMode(LATCH, OUTPUT);
   pinMode(CLOCK, OUTPUT);
+  #endif
+  pinMode(LATCH, OUTPUT);
 
   digitalWrite(OE, HIGH);
   pinMode(OE, OUTPUT);
@@ -20,95 +34,175 @@ void setupEEPROM() {
 }
 
 void data_bus_input() {
-  pinMode(D0, INPUT);
-  pinMode(D1, INPUT);
-  pinMode(D2, INPUT);
-  pinMode(D3, INPUT);
-  pinMode(D4, INPUT);
-  pinMode(D5, INPUT);
-  pinMode(D6, INPUT);
-  pinMode(D7, INPUT);
+  DDRB &= ~DATA_MASK_B;
+  DDRC &= ~DATA_MASK_C;
+  DDRD &= ~DATA_MASK_D;
+  DDRE &= ~DATA_MASK_E;
+
+  // Disable pull-ups
+  PORTB &= ~DATA_MASK_B;
+  PORTC &= ~DATA_MASK_C;
+  PORTD &= ~DATA_MASK_D;
+  PORTE &= ~DATA_MASK_E;
 }
 
 void data_bus_output() {
-  pinMode(D0, OUTPUT);
-  pinMode(D1, OUTPUT);
-  pinMode(D2, OUTPUT);
-  pinMode(D3, OUTPUT);
-  pinMode(D4, OUTPUT);
-  pinMode(D5, OUTPUT);
-  pinMode(D6, OUTPUT);
-  pinMode(D7, OUTPUT);
+  DDRB |= DATA_MASK_B;
+  DDRC |= DATA_MASK_C;
+  DDRD |= DATA_MASK_D;
+  DDRE |= DATA_MASK_E;
 }
 
 uint8_t read_data_bus() {
-  return ((digitalRead(D7) << 7) +
-          (digitalRead(D6) << 6) +
-          (digitalRead(D5) << 5) +
-          (digitalRead(D4) << 4) +
-          (digitalRead(D3) << 3) +
-          (digitalRead(D2) << 2) +
-          (digitalRead(D1) << 1) +
-          digitalRead(D0));
+  uint8_t b = PINB;
+  uint8_t c = PINC;
+  uint8_t d = PIND;
+  uint8_t e = PINE;
+
+  return ((d >> 2) & 0x03) | // D0, D1
+         ((d << 1) & 0x04) | // D2
+         ((d << 3) & 0x08) | // D3
+         ((c >> 2) & 0x10) | // D4
+         ((e >> 1) & 0x20) | // D5
+         ((b << 1) & 0xC0);  // D6, D7
 }
 
 void write_data_bus(uint8_t data) {
-  digitalWrite(D0, (data >> 0) & 0x01);
-  digitalWrite(D1, (data >> 1) & 0x01);
-  digitalWrite(D2, (data >> 2) & 0x01);
-  digitalWrite(D3, (data >> 3) & 0x01);
-  digitalWrite(D4, (data >> 4) & 0x01);
-  digitalWrite(D5, (data >> 5) & 0x01);
-  digitalWrite(D6, (data >> 6) & 0x01);
-  digitalWrite(D7, (data >> 7) & 0x01);
+  PORTB = (PORTB & ~DATA_MASK_B) | ((data >> 1) & 0x60); // D6, D7
+  PORTC = (PORTC & ~DATA_MASK_C) | ((data << 2) & 0x40); // D4
+  PORTD = (PORTD & ~DATA_MASK_D) |
+          ((data << 2) & 0x0C) | // D0, D1
+          ((data >> 1) & 0x02) | // D2
+          ((data >> 3) & 0x01);  // D3
+  PORTE = (PORTE & ~DATA_MASK_E) | ((data << 1) & 0x40); // D5
 }
 
+#ifdef ADDRESS_SPI
+// Hardware SPI shift, transfers a byte in 1us at 8MHz
+inline void shift_byte(uint8_t data) {
+  SPDR = data;
+  while (!(SPSR & _BV(SPIF))) { }
+}
+#else
+// Bit-banged shiftOut using direct port access, fast enough to stay within page load timing
+void shift_byte(uint8_t data) {
+  for (uint8_t i = 0; i < 8; i++) {
+    if (data & 0x01) {
+      SHIFT_PORT |= DATA_BIT;
+    } else {
+      SHIFT_PORT &= ~DATA_BIT;
+    }
+    SHIFT_PORT |= CLOCK_BIT;
+    SHIFT_PORT &= ~CLOCK_BIT;
+    data >>= 1;
+  }
+}
+#endif
+
 void set_address_bus(uint16_t address) {
   uint8_t hi = address >> 8;
   uint8_t lo = address & 0xff;
 
-  digitalWrite(LATCH, LOW);
+  SHIFT_PORT &= ~LATCH_BIT;
 
-  shiftOut(DATA, CLOCK, LSBFIRST, lo);
-  shiftOut(DATA, CLOCK, LSBFIRST, hi);
+  // Both registers are daisy chained, so the high byte must be shifted even if unchanged
+  shift_byte(lo);
+  shift_byte(hi);
 
-  digitalWrite(LATCH, HIGH);
+  SHIFT_PORT |= LATCH_BIT;
 }
 
 // Output Enable, LOW active
 void set_oe(uint8_t state) {
-  digitalWrite(OE, state);
+  if (state) {
+    CONTROL_PORT |= OE_BIT;
+  } else {
+    CONTROL_PORT &= ~OE_BIT;
+  }
 }
 
 // Chip Enable, LOW active
 void set_ce(uint8_t state) {
-  digitalWrite(CE, state);
+  if (state) {
+    CONTROL_PORT |= CE_BIT;
+  } else {
+    CONTROL_PORT &= ~CE_BIT;
+  }
 }
 
 // Write Enable, LOW active
 void set_we(uint8_t state) {
-  digitalWrite(WE, state);
+  if (state) {
+    CONTROL_PORT |= WE_BIT;
+  } else {
+    CONTROL_PORT &= ~WE_BIT;
+  }
 }
 
-uint8_t read_byte(uint16_t address) {
+// Bulk reads set up the bus once, then only change the address for each byte
+void read_begin() {
   data_bus_input();
 
   set_oe(HIGH); // Disable Output
-  set_ce(LOW); // Enable Chip Select
   set_we(HIGH); // Disable Write
+  set_ce(LOW); // Enable Chip Select
+}
 
+uint8_t read_next(uint16_t address) {
   set_address_bus(address); // Set Address
 
   set_oe(LOW); // Enable Output
-  delay(1);
+  READ_DELAY();
   uint8_t data = read_data_bus();
   set_oe(HIGH); // Disable Output
 
-  delay(1);
   return data;
 }
 
-void write_byte(uint16_t address, uint8_t data) {
+void read_end() {
+  set_ce(HIGH); // Disable Chip Select
+}
+
+uint8_t read_byte(uint16_t address) {
+  read_begin();
+  uint8_t data = read_next(address);
+  read_end();
+  return data;
+}
+
+// DATA polling, bit 7 reads as the complement of the written data until the write cycle completes
+// The bus still holds the charge of the written data, so a poll is only trusted after the output access time and a second matching poll
+uint8_t wait_write(uint16_t address, uint8_t data) {
+  data_bus_input();
+
+  unsigned long start = millis();
+  uint8_t status = STATUS_TIMEOUT;
+  uint8_t matched = 0;
+  do {
+    set_oe(LOW); // Enable Output
+    READ_DELAY();
+    uint8_t polled = read_data_bus();
+    set_oe(HIGH); // Disable Output
+
+    if ((polled & 0x80) == (data & 0x80)) {
+      if (++matched >= 2) {
+        status = STATUS_OK;
+        break;
+      }
+    } else {
+      matched = 0;
+    }
+
+    if (eeprom_idle != NULL) eeprom_idle();
+  } while (millis() - start < WRITE_TIMEOUT);
+
+  set_ce(HIGH); // Disable Chip Select
+
+  if (status != STATUS_OK) eeprom_fail_address = address;
+  return status;
+}
+
+uint8_t write_byte(uint16_t address, uint8_t data) {
   set_oe(HIGH); // Disable Output
   set_we(HIGH); // Disable Write
 
@@ -125,58 +219,178 @@ void write_byte(uint16_t address, uint8_t data) {
   delayMicroseconds(20);
   set_we(HIGH); // Disable Write
 
-  // Wait until data is correct
-  data_bus_input();
-  set_oe(LOW); // Enable Output
-  while (data != read_data_bus()) { }
+  return wait_write(address, data);
+}
+
+// Loads up to one page of bytes and waits for a single write cycle. All bytes must be within the same page.
+uint8_t write_page(uint16_t address, uint8_t* buffer, uint8_t len) {
+  if (len == 0) return STATUS_OK;
 
   set_oe(HIGH); // Disable Output
-  set_ce(HIGH); // Disable Chip Select
+  set_we(HIGH); // Disable Write
 
-  delay(3);
+  data_bus_output();
+  set_ce(LOW); // Enable Chip Select
+
+  // Load page, each byte must follow the last within the byte load cycle time (150us)
+  for (uint8_t i = 0; i < len; i++) {
+    set_address_bus(address + i);
+    write_data_bus(buffer[i]);
+
+    set_we(LOW); // Enable Write
+    delayMicroseconds(1);
+    set_we(HIGH); // Disable Write
+  }
+
+  // Poll last byte of page, address is still latched from the load
+  return wait_write(address + len - 1, buffer[len - 1]);
 }
 
 // Input / Output
 
+// Number of characters output by read_block
+// Computed in 32 bits as dumps of more than about 21 KB don't fit in a frame
+uint32_t read_block_length(uint16_t len, uint16_t linelength) {
+  uint32_t lines = ((uint32_t)len + linelength - 1) / linelength;
+  return lines * 11 + (uint32_t)len * 3 + 2;
+}
+
 void read_block(uint16_t from, uint16_t to, uint16_t linelength) {
   uint16_t count = 0;
-  for (uint16_t address = from; address <= to; address++) {
+  uint16_t address = from;
+  read_begin();
+  for (uint32_t remaining = range_length(from, to); remaining > 0; remaining--, address++) {
     if (count == 0) {
-      Serial.println();
-      Serial.print("0x");
-      printAddress(address);
-      Serial.print(" : ");
+      tx_println();
+      tx_print("0x");
+      tx_hex_word(address);
+      tx_print(" : ");
     }
 
-    uint8_t data = read_byte(address);
-    printByte(data);
-    Serial.print(" ");
+    uint8_t data = read_next(address);
+    tx_hex_byte(data);
+    tx_write(' ');
     count = (++count % linelength);
   }
-  Serial.println();
+  read_end();
+  tx_println();
 }
 
 void read_binblock(uint16_t from, uint16_t to) {
-  for (uint16_t address = from; address <= to; address++) {
-    Serial.write(read_byte(address));
+  uint16_t address = from;
+  read_begin();
+  for (uint32_t remaining = range_length(from, to); remaining > 0; remaining--) {
+    tx_write(read_next(address++));
+  }
+  read_end();
+}
+
+// Bytes from through to inclusive, counted in 32 bits so a range ending at 0xFFFF doesn't wrap to 0
+uint32_t range_length(uint16_t from, uint16_t to) {
+  return (uint32_t)(uint16_t)(to - from) + 1;
+}
+
+// CRC-32 (reflected 0xEDB88320, as zlib) of a range, so blocks can be verified without reading them back
+uint32_t crc32_block(uint16_t from, uint16_t to) {
+  uint32_t crc = 0xFFFFFFFF;
+  uint16_t address = from;
+  read_begin();
+  for (uint32_t remaining = range_length(from, to); remaining > 0; remaining--) {
+    crc ^= read_next(address++);
+    for (uint8_t i = 0; i < 8; i++) {
+      crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 0x01));
+    }
+  }
+  read_end();
+  return ~crc;
+}
+
+// First address in range not holding 0xFF is reported as the fail address
+uint8_t blank_check(uint16_t from, uint16_t to) {
+  uint8_t status = STATUS_OK;
+  uint16_t address = from;
+  read_begin();
+  for (uint32_t remaining = range_length(from, to); remaining > 0; remaining--, address++) {
+    if (read_next(address) != 0xFF) {
+      eeprom_fail_address = address;
+      status = STATUS_NOT_BLANK;
+      break;
+    }
   }
-  Serial.print('\0');
+  read_end();
+  return status;
 }
 
-void write_block(uint16_t address, uint8_t* buffer, uint16_t len) {
+uint8_t write_block(uint16_t address, uint8_t* buffer, uint16_t len) {
   for (uint16_t i = 0; i < len; i++) {
-    write_byte(address+i, buffer[i]);
+    uint8_t status = write_byte(address+i, buffer[i]);
+    if (status != STATUS_OK) return status;
+  }
+  return STATUS_OK;
+}
+
+uint8_t write_pages(uint16_t address, uint8_t* buffer, uint16_t len, uint8_t pagesize) {
+  if (pagesize == 0) {
+    return write_block(address, buffer, len);
+  }
+
+  uint16_t i = 0;
+  while (i < len) {
+    // Split writes on page boundaries
+    uint16_t count = pagesize - ((address + i) % pagesize);
+    if (count > len - i) count = len - i;
+
+    uint8_t status = write_page(address + i, buffer + i, count);
+    if (status != STATUS_OK) return status;
+    i += count;
   }
+  return STATUS_OK;
 }
 
-void printAddress(uint16_t address) {
-  if (address < 0x0010) Serial.print("0");
-  if (address < 0x0100) Serial.print("0");
-  if (address < 0x1000) Serial.print("0");
-  Serial.print(address, HEX);
+// Buffer holds the fill value in its first byte and must have room for BUFFERSIZE bytes
+uint8_t fill_block(uint16_t address, uint8_t* buffer, uint16_t len, uint8_t pagesize) {
+  memset(buffer, buffer[0], BUFFERSIZE);
+
+  uint16_t i = 0;
+  while (i < len) {
+    uint16_t count = BUFFERSIZE;
+    if (count > len - i) count = len - i;
+
+    uint8_t status = write_pages(address + i, buffer, count, pagesize);
+    if (status != STATUS_OK) return status;
+    i += count;
+  }
+  return STATUS_OK;
 }
 
-void printByte(uint8_t data) {
-  if (data < 0x10) Serial.print("0");
-  Serial.print(data, HEX);
+// Software chip erase sequence, only supported by some parts (ie: AT28C256)
+uint8_t chip_erase() {
+  const uint16_t addresses[] = { 0x5555, 0x2AAA, 0x5555, 0x5555, 0x2AAA, 0x5555 };
+  const uint8_t values[] = { 0xAA, 0x55, 0x80, 0xAA, 0x55, 0x10 };
+
+  set_oe(HIGH); // Disable Output
+  set_we(HIGH); // Disable Write
+
+  data_bus_output();
+  set_ce(LOW); // Enable Chip Select
+
+  for (uint8_t i = 0; i < 6; i++) {
+    set_address_bus(addresses[i]);
+    write_data_bus(values[i]);
+
+    set_we(LOW); // Enable Write
+    delayMicroseconds(1);
+    set_we(HIGH); // Disable Write
+  }
+
+  set_ce(HIGH); // Disable Chip Select
+  data_bus_input();
+
+  // No completion polling during erase, keep receiving while waiting out the erase time
+  unsigned long start = millis();
+  while (millis() - start < ERASE_TIME) {
+    if (eeprom_idle != NULL) eeprom_idle();
+  }
+
+  return STATUS_OK;
 }
@@ -11,10 +11,21 @@
 
 // Shift Registers
 
+// Uncomment if the shift register chain is wired to hardware SPI (MOSI, SCK) instead of DATA and CLOCK
+// MOSI and SCK are shared with the ISP header (PIN_MOSI, PIN_SCK in 32u4_ISP.h), so nothing may be connected there while programming EEPROMs
+//#define ADDRESS_SPI
+#define ADDRESS_SPI_CLOCK 8000000
+
 #define DATA        A2
 #define LATCH       A1
 #define CLOCK       A0
 
+// Direct port access to shift register pins (A0 = PF7, A1 = PF6, A2 = PF5)
+#define SHIFT_PORT  PORTF
+#define DATA_BIT    _BV(PORTF5)
+#define LATCH_BIT   _BV(PORTF6)
+#define CLOCK_BIT   _BV(PORTF7)
+
 // EEPROM
 
 #define D0          0
@@ -30,6 +41,37 @@
 #define OE          A4
 #define WE          A5
 
+// Direct port access to data bus pins
+// D0 = PD2, D1 = PD3, D2 = PD1, D3 = PD0, D4 = PC6, D5 = PE6, D6 = PB5, D7 = PB6
+#define DATA_MASK_B 0x60
+#define DATA_MASK_C 0x40
+#define DATA_MASK_D 0x0F
+#define DATA_MASK_E 0x40
+
+// Direct port access to control pins (A3 = PF4, A4 = PF1, A5 = PF0)
+#define CONTROL_PORT  PORTF
+#define CE_BIT        _BV(PORTF4)
+#define OE_BIT        _BV(PORTF1)
+#define WE_BIT        _BV(PORTF0)
+
+// Read access time, 4 cycles at 16MHz (250ns) covers the 150ns tACC of the AT28C256
+#define READ_DELAY()  __builtin_avr_delay_cycles(4)
+
+// Write Completion
+
+#define WRITE_TIMEOUT   20 // ms, double the maximum write cycle time
+#define ERASE_TIME      20 // ms, chip erase cycle time (tEC) of the AT28C256
+
+#define STATUS_OK       0x00
+#define STATUS_TIMEOUT  0x01
+#define STATUS_OVERFLOW 0x02
+#define STATUS_CRC      0x03
+#define STATUS_INVALID  0x04
+#define STATUS_NOT_BLANK 0x05
+
+extern uint16_t eeprom_fail_address;
+extern void (*eeprom_idle)(); // Called while waiting on write cycles
+
 // Function Definitions
 
 void setupEEPROM();
@@ -38,13 +80,18 @@ void set_address_bus(uint16_t address);
 void write_data_bus(uint8_t data);
 
 uint8_t read_byte(uint16_t address);
-void write_byte(uint16_t address, uint8_t data);
+uint8_t write_byte(uint16_t address, uint8_t data);
 
+uint32_t read_block_length(uint16_t len, uint16_t linelength);
 void read_block(uint16_t from, uint16_t to, uint16_t linelength);
 void read_binblock(uint16_t from, uint16_t to);
-void write_block(uint16_t address, uint8_t* buffer, uint16_t len);
-
-void printAddress(uint16_t address);
-void printByte(uint8_t data);
+uint32_t range_length(uint16_t from, uint16_t to);
+uint32_t crc32_block(uint16_t from, uint16_t to);
+uint8_t blank_check(uint16_t from, uint16_t to);
+uint8_t write_block(uint16_t address, uint8_t* buffer, uint16_t len);
+uint8_t write_page(uint16_t address, uint8_t* buffer, uint8_t len);
+uint8_t write_pages(uint16_t address, uint8_t* buffer, uint16_t len, uint8_t pagesize);
+uint8_t fill_block(uint16_t address, uint8_t* buffer, uint16_t len, uint8_t pagesize);
+uint8_t chip_erase();
 
 #endif // H_32U4_EEPROM
@@ -0,0 +1,177 @@
+/**
+ * File: 32u4_Serial.cpp
+ * Created: 18/10/2026
+ * Updated: 18/10/2026
+ */
+
+#include "32u4_Serial.h"
+#include "32u4_EEPROM.h"
+
+#define RX_HUNT     0
+#define RX_HEADER   1
+#define RX_PAYLOAD  2
+#define RX_CRC      3
+#define RX_DISCARD  4
+
+const char hex_digits[] = "0123456789ABCDEF";
+
+Frame rx_frames[RX_SLOTS];
+uint8_t rx_slot = 0; // Slot being received
+uint8_t rx_process = 0; // Oldest slot waiting to be processed
+uint8_t rx_state = RX_HUNT;
+uint16_t rx_index = 0;
+uint16_t rx_crc = 0xFFFF;
+uint8_t rx_header[FRAME_HEADER];
+unsigned long rx_last = 0;
+
+uint8_t tx_buffer[TX_BUFFERSIZE];
+uint8_t tx_length = 0;
+uint16_t tx_crc = 0xFFFF; // Running CRC of current frame
+
+void rx_complete(uint8_t status) {
+  Frame* frame = &rx_frames[rx_slot];
+  frame->status = status;
+  frame->ready = true;
+
+  rx_slot = (rx_slot + 1) % RX_SLOTS;
+  rx_state = RX_HUNT;
+}
+
+// Receives available bytes into the next free slot without blocking, safe to call while waiting on the EEPROM
+void rx_poll() {
+  Frame* frame = &rx_frames[rx_slot];
+
+  // Drop partial frames if the host stops sending
+  if (rx_state != RX_HUNT && !Serial.available() && millis() - rx_last > FRAME_TIMEOUT) {
+    if (rx_state == RX_HEADER) {
+      rx_state = RX_HUNT;
+    } else {
+      frame->length = 0;
+      rx_complete(STATUS_CRC);
+    }
+    return;
+  }
+
+  while (!frame->ready && Serial.available()) {
+    uint8_t c = Serial.read();
+    rx_last = millis();
+
+    switch (rx_state) {
+      case RX_HUNT:
+        if (c == FRAME_SYNC) {
+          rx_state = RX_HEADER;
+          rx_index = 0;
+          rx_crc = 0xFFFF;
+        }
+        break;
+      case RX_HEADER:
+        rx_header[rx_index++] = c;
+        rx_crc = _crc_ccitt_update(rx_crc, c);
+        if (rx_index < FRAME_HEADER) break;
+
+        frame->opcode = rx_header[0];
+        frame->sequence = rx_header[1];
+        frame->length = rx_header[2] | (rx_header[3] << 8);
+        rx_index = 0;
+
+        // Reject frames larger than the buffer rather than truncating them
+        if (frame->length > sizeof(frame->buffer)) {
+          rx_state = RX_DISCARD;
+        } else if (frame->length > 0) {
+          rx_state = RX_PAYLOAD;
+        } else {
+          rx_state = RX_CRC;
+        }
+        break;
+      case RX_PAYLOAD:
+        frame->buffer[rx_index++] = c;
+        rx_crc = _crc_ccitt_update(rx_crc, c);
+        if (rx_index >= frame->length) {
+          rx_state = RX_CRC;
+          rx_index = 0;
+        }
+        break;
+      case RX_CRC:
+        rx_header[rx_index++] = c;
+        if (rx_index < 2) break;
+
+        if (frame->length > sizeof(frame->buffer)) {
+          frame->length = 0;
+          rx_complete(STATUS_OVERFLOW);
+        } else {
+          rx_complete((uint16_t)(rx_header[0] | (rx_header[1] << 8)) == rx_crc ? STATUS_OK : STATUS_CRC);
+        }
+        break;
+      case RX_DISCARD:
+        if (++rx_index >= frame->length) {
+          rx_state = RX_CRC;
+          rx_index = 0;
+        }
+        break;
+    }
+
+    frame = &rx_frames[rx_slot];
+  }
+}
+
+// Oldest received frame or NULL if none are ready
+Frame* rx_next() {
+  if (!rx_frames[rx_process].ready) return NULL;
+  return &rx_frames[rx_process];
+}
+
+void rx_release() {
+  rx_frames[rx_process].ready = false;
+  rx_process = (rx_process + 1) % RX_SLOTS;
+
+  // Time spent processing without polling doesn't count towards the frame timeout
+  rx_last = millis();
+}
+
+void tx_write(uint8_t data) {
+  tx_crc = _crc_ccitt_update(tx_crc, data);
+  tx_buffer[tx_length++] = data;
+  if (tx_length >= TX_BUFFERSIZE) tx_flush();
+}
+
+void tx_print(const char* str) {
+  while (*str) tx_write(*str++);
+}
+
+void tx_println() {
+  tx_write('\r');
+  tx_write('\n');
+}
+
+void tx_hex_byte(uint8_t data) {
+  tx_write(hex_digits[data >> 4]);
+  tx_write(hex_digits[data & 0x0F]);
+}
+
+void tx_hex_word(uint16_t data) {
+  tx_hex_byte(data >> 8);
+  tx_hex_byte(data & 0xFF);
+}
+
+void tx_flush() {
+  if (tx_length == 0) return;
+  Serial.write(tx_buffer, tx_length);
+  tx_length = 0;
+}
+
+// Starts a response frame, everything written until frame_end is the payload
+void frame_begin(uint8_t opcode, uint8_t sequence, uint16_t length) {
+  tx_write(FRAME_SYNC);
+  tx_crc = 0xFFFF;
+  tx_write(opcode);
+  tx_write(sequence);
+  tx_write(length & 0xFF);
+  tx_write(length >> 8);
+}
+
+void frame_end() {
+  uint16_t crc = tx_crc;
+  tx_write(crc & 0xFF);
+  tx_write(crc >> 8);
+  tx_flush();
+}
@@ -0,0 +1,54 @@
+/**
+ * File: 32u4_Serial.h
+ * Created: 18/10/2026
+ * Updated: 18/10/2026
+ */
+
+#ifndef H_32U4_SERIAL
+#define H_32U4_SERIAL
+
+#include <Arduino.h>
+#include <util/crc16.h>
+
+// Framing
+
+#define FRAME_SYNC      0xA5
+#define FRAME_HEADER    4 // Opcode, sequence and length following sync byte
+#define FRAME_PARAMS    5 // Start address, data length and line length
+#define FRAME_TIMEOUT   100 // ms between bytes before a partial frame is dropped
+
+// Receive Buffers
+
+#define BUFFERSIZE  512 // Block data per receive slot
+#define RX_SLOTS    2 // Frames received while the previous one is processed
+
+typedef struct frame {
+  bool ready;
+  uint8_t opcode;
+  uint8_t sequence; // Echoed in the response so the host can match it to its command
+  uint8_t status;
+  uint16_t length;
+  uint8_t buffer[FRAME_PARAMS + BUFFERSIZE];
+} Frame;
+
+// Transmit Buffer
+
+#define TX_BUFFERSIZE 64 // USB CDC bulk endpoint size, flushed in full packets
+
+// Function Definitions
+
+void rx_poll();
+Frame* rx_next();
+void rx_release();
+
+void tx_write(uint8_t data);
+void tx_print(const char* str);
+void tx_println();
+void tx_hex_byte(uint8_t data);
+void tx_hex_word(uint16_t data);
+void tx_flush();
+
+void frame_begin(uint8_t opcode, uint8_t sequence, uint16_t length);
+void frame_end();
+
+#endif // H_32U4_SERIAL
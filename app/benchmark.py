@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from app import progress
+
+# Peak memory is traced where available (Python 3.4+)
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CONTENTS = ["random", "blank", "similar"]
+BLOCK_SIZES = [64, 128, 256, 512]
+SIMILAR_CHANGES = 1024 # Image bytes per changed byte of similar content
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '32u4-programmer.py')
+
+class Benchmark():
+
+    # Times the transfer path against an emulated programmer for every device, block size and content combination
+    def __init__(self, controller, timing = 0.0, memory = True):
+        self.controller = controller
+        self.view = controller.view
+        self.timing = timing # Emulated programmer delay scale, 0 measures only the host side
+        self.memory = memory and tracemalloc is not None
+        self.seed = 0x32
+        self.results = []
+
+        # The hex view is only measured if wxPython is installed
+        self.app = None
+        self.frame = None
+        self.panel = None
+
+    def createImage(self, dataLength, content):
+        # Returns (image to write, image on the device beforehand)
+        generator = random.Random(self.seed)
+        if content == "blank":
+            return bytearray([0xFF] * dataLength), bytearray([0xFF] * dataLength)
+
+        data = bytearray(generator.getrandbits(8) for i in range(dataLength))
+        if content == "random":
+            return data, bytearray([0xFF] * dataLength)
+
+        current = bytearray(data)
+        for address in range(0, dataLength, SIMILAR_CHANGES):
+            current[address + generator.randrange(SIMILAR_CHANGES)] ^= 0xFF
+        return data, current
+
+    def startEmulator(self, device, pathname):
+        # Runs the emulator in its own process so it doesn't compete with the host for the interpreter
+        process = subprocess.Popen([sys.executable, SCRIPT, '-q', 'emulate', '-d', device, '--timing', str(self.timing), '--image', pathname], stdout = subprocess.PIPE)
+        portname = process.stdout.readline().decode('utf-8').strip()
+        if len(portname) <= 0:
+            process.wait()
+            return process, False
+        return process, portname
+
+    def stopEmulator(self, process):
+        process.terminate()
+        process.wait()
+        process.stdout.close()
+
+    def measure(self, case, operation, length, function, *args):
+        if self.memory:
+            tracemalloc.start()
+
+        start = progress.clock()
+        result = function(*args)
+        elapsed = progress.clock() - start
+
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        record = dict(case)
+        record.update({
+            "operation": operation,
+            "success": result is not False,
+            "bytes": length,
+            "seconds": elapsed,
+            "rate": length / elapsed if elapsed > 0 else None,
+            "peak_memory": peak,
+        })
+        self.results.append(record)
+        return result
+
+    def runCase(self, device, blockSize, content):
+        dataLength = self.controller.devices[device]["dataLength"]
+        case = {
+            "device": device,
+            "block_size": blockSize,
+            "content": content,
+        }
+        self.view.Log("Benchmarking {} with {} byte blocks and {} content.".format(device, blockSize, content))
+
+        data, current = self.createImage(dataLength, content)
+        handle, imagePath = tempfile.mkstemp(suffix = '.bin')
+        os.close(handle)
+        handle, currentPath = tempfile.mkstemp(suffix = '.bin')
+        os.close(handle)
+        process = None
+        try:
+            with open(imagePath, 'wb') as file:
+                file.write(data)
+            with open(currentPath, 'wb') as file:
+                file.write(current)
+
+            process, portname = self.startEmulator(device, currentPath)
+            if portname == False:
+                self.view.LogError("Unable to start emulated programmer.", "Benchmark Error")
+                return False
+
+            if self.controller.setDevice(device) == False or self.controller.checkProgrammer(portname) == False:
+                return False
+
+            # Blocks larger than the programmer's receive buffer would only measure overflow errors
+            if blockSize > self.controller.block_size:
+                self.view.LogError("Block size of {} bytes is larger than the {} bytes advertised by the programmer.".format(blockSize, self.controller.block_size), "Benchmark Error")
+                return False
+            self.controller.block_size = blockSize
+
+            data = self.measure(case, "importFile", dataLength, self.controller.importFile, imagePath)
+            if data is False:
+                return False
+            self.measure(case, "writeDevice", dataLength, self.controller.writeDevice, data, content == "similar")
+            readback = self.measure(case, "readDevice", dataLength, self.controller.readDevice)
+            self.measure(case, "verifyDevice", dataLength, self.controller.verifyDevice, data)
+            if readback is not False:
+                self.measure(case, "compareData", dataLength, self.controller.compareData, data, readback)
+            if self.createPanel():
+                self.measure(case, "loadContents", dataLength, self.panel.loadContents, data)
+        finally:
+            self.controller.closeProgrammer()
+            if process is not None:
+                self.stopEmulator(process)
+            os.remove(imagePath)
+            os.remove(currentPath)
+
+        return True
+
+    def createPanel(self):
+        if self.panel is not None:
+            return True
+
+        try:
+            import wx
+            from app.view import HexPanel
+        except ImportError:
+            return False
+
+        self.app = wx.App(False)
+        self.frame = wx.Frame(None)
+        self.panel = HexPanel(self.frame, self.view, self.controller)
+        return True
+
+    def run(self, devices, blockSizes = BLOCK_SIZES, contents = CONTENTS):
+        self.results = []
+        cache = self.controller.cache_programmer
+        self.controller.cache_programmer = False
+        try:
+            for device in devices:
+                for blockSize in blockSizes:
+                    for content in contents:
+                        if self.runCase(device, blockSize, content) == False:
+                            self.view.LogError("Failed to benchmark {} with {} byte blocks and {} content.".format(device, blockSize, content), "Benchmark Error")
+                            return False
+        finally:
+            self.controller.cache_programmer = cache
+            if self.frame is not None:
+                self.frame.Destroy()
+
+        return self.results
+
+    def getFailures(self):
+        return [result for result in self.results if result["success"] != True]
+
+    def getReport(self):
+        return {
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timing": self.timing,
+            "memory": self.memory,
+            "results": self.results,
+        }
+
+    def saveReport(self, pathname):
+        # Appends the run as a line of JSON so runs can be compared over time
+        with open(pathname, 'a') as file:
+            file.write(json.dumps(self.getReport(), sort_keys = True) + '\n')
+
+    def logResults(self):
+        self.view.LogSuccess("{:<9} {:>5} {:<8} {:<13} {:>8} {:>12} {:>10}".format("Device", "Block", "Content", "Operation", "Time", "Rate", "Peak"))
+        for result in self.results:
+            self.view.LogSuccess("{:<9} {:>5} {:<8} {:<13} {:>7.3f}s {:>12} {:>10}".format(
+                result["device"],
+                result["block_size"],
+                result["content"],
+                result["operation"] + ("" if result["success"] else "!"),
+                result["seconds"],
+                progress.formatRate(result["rate"]) if result["rate"] is not None else "-",
+                "{:.1f} KB".format(result["peak_memory"] / 1024.0) if result["peak_memory"] is not None else "-",
+            ))
+        return True
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import time
+
+from app.controller import AppController
+from app.gang import GangController
+from app import progress
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_NO_PROGRAMMER = 3
+
+def addressPair(text):
+    # ADDRESS=VALUE argument, either may be hexadecimal
+    try:
+        address, value = text.split('=', 1)
+        return int(address, 0), int(value, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected ADDRESS=VALUE, got {}".format(text))
+
+class CliView():
+
+    def __init__(self, controller, stream = None):
+        self.controller = controller
+        self.stream = stream if stream is not None else sys.stderr
+
+        self.verbose = False
+        self.quiet = False
+
+    def run(self):
+        return
+
+    def update(self):
+        return
+
+    def destroy(self):
+        return
+
+    def _log(self, message):
+        self.stream.write(message + '\n')
+        self.stream.flush()
+        return True
+
+    def Log(self, message):
+        if self.verbose == False or self.quiet == True:
+            return True
+        return self._log(message)
+
+    def LogError(self, message, title = "Error"):
+        return self._log(title + ": " + message)
+
+    def LogWarning(self, message, title = "Warning"):
+        if self.quiet == True:
+            return True
+        return self._log(title + ": " + message)
+
+    def LogSuccess(self, message):
+        if self.quiet == True:
+            return True
+        return self._log(message)
+
+class CliApp():
+
+    def __init__(self, view = CliView):
+        self.controller = AppController(view)
+        self.view = self.controller.view
+
+    def createParser(self):
+        parser = argparse.ArgumentParser(prog = '32u4-programmer', description = "Headless interface for the 32u4 Programmer.")
+        parser.add_argument('-v', '--verbose', action = 'store_true', help = "log every programmer command")
+        parser.add_argument('-q', '--quiet', action = 'store_true', help = "only log errors")
+        parser.add_argument('--events', metavar = 'FILE', default = None, help = "append progress and timing events to FILE as JSON lines")
+        parser.add_argument('--summary', action = 'store_true', help = "log a table of throughput and block timing per operation")
+        parser.add_argument('--record', metavar = 'FILE', default = None, help = "record all programmer traffic to a trace FILE")
+        parser.add_argument('--replay', metavar = 'FILE', default = None, help = "replay a trace FILE instead of connecting to a programmer")
+        parser.add_argument('--replay-fast', action = 'store_true', help = "replay without the recorded programmer delays")
+
+        subparsers = parser.add_subparsers(dest = 'command', metavar = 'command')
+        subparsers.required = True
+
+        probe = subparsers.add_parser('probe', help = "list connected programmers")
+        probe.add_argument('-a', '--all', action = 'store_true', help = "probe every serial port, not only known USB vendors")
+
+        read = subparsers.add_parser('read', help = "read device contents into a binary file")
+        self.addDeviceArguments(read)
+        read.add_argument('output', help = "binary file to save device contents to")
+
+        write = subparsers.add_parser('write', help = "write a binary file to the device")
+        self.addDeviceArguments(write)
+        write.add_argument('input', help = "binary file to write to device")
+        write.add_argument('--diff', action = 'store_true', help = "read the device first and only write bytes that changed")
+
+        verify = subparsers.add_parser('verify', help = "compare device contents against a binary file")
+        self.addDeviceArguments(verify)
+        verify.add_argument('input', help = "binary file to compare device contents against")
+
+        gang = subparsers.add_parser('gang', help = "write to the devices on several programmers in parallel")
+        gang.add_argument('-d', '--device', required = True, choices = sorted(self.controller.getDevices()), help = "EEPROM device in every programmer socket")
+        gang.add_argument('-p', '--port', action = 'append', default = None, help = "serial port of a programmer, may be repeated; every programmer found is used if omitted")
+        gang.add_argument('input', nargs = '+', help = "binary file to write to every device, or one file per port in the same order")
+        gang.add_argument('--diff', action = 'store_true', help = "read each device first and only write bytes that changed")
+
+        blank = subparsers.add_parser('blank', help = "check that the device is erased")
+        self.addDeviceArguments(blank)
+
+        erase = subparsers.add_parser('erase', help = "erase the device to 0xFF")
+        self.addDeviceArguments(erase)
+
+        emulate = subparsers.add_parser('emulate', help = "serve an emulated programmer on a pseudo-terminal until interrupted")
+        emulate.add_argument('-d', '--device', required = True, choices = sorted(self.controller.getDevices()), help = "EEPROM device to emulate")
+        emulate.add_argument('--image', metavar = 'FILE', default = None, help = "binary file to preload the device with, erased if omitted")
+        emulate.add_argument('--timing', type = float, default = 1.0, help = "scale of the emulated programmer delays, 0 answers immediately")
+        emulate.add_argument('--stuck', metavar = 'ADDRESS=VALUE', type = addressPair, action = 'append', default = [], help = "cell which always reads VALUE and ignores writes, may be repeated")
+        emulate.add_argument('--flaky', metavar = 'ADDRESS=COUNT', type = addressPair, action = 'append', default = [], help = "cell whose next COUNT writes store a corrupted value, may be repeated")
+        emulate.add_argument('--protect', action = 'store_true', help = "ignore all writes as if the device were write protected")
+        emulate.add_argument('--corrupt', metavar = 'N', type = int, action = 'append', default = [], help = "send the Nth response with a bad CRC, may be repeated")
+        emulate.add_argument('--drop', metavar = 'N', type = int, action = 'append', default = [], help = "never send the Nth response, may be repeated")
+
+        benchmark = subparsers.add_parser('benchmark', help = "measure read, write and verify throughput against emulated programmers")
+        benchmark.add_argument('-d', '--device', action = 'append', default = None, choices = sorted(self.controller.getDevices()), help = "EEPROM device to benchmark, may be repeated; every device if omitted")
+        benchmark.add_argument('-b', '--block-size', type = int, action = 'append', default = None, help = "block size in bytes, may be repeated; defaults to 64, 128, 256 and 512")
+        benchmark.add_argument('-c', '--content', action = 'append', default = None, choices = ['random', 'blank', 'similar'], help = "image content, may be repeated; every content if omitted")
+        benchmark.add_argument('--timing', type = float, default = 0.0, help = "scale of the emulated programmer delays, 0 only measures the host")
+        benchmark.add_argument('--no-memory', action = 'store_true', help = "don't trace peak memory, which slows the host down")
+        benchmark.add_argument('-o', '--output', metavar = 'FILE', default = None, help = "append the results to FILE as a line of JSON")
+
+        return parser
+
+    def addDeviceArguments(self, parser):
+        parser.add_argument('-d', '--device', required = True, choices = sorted(self.controller.getDevices()), help = "EEPROM device in the programmer socket")
+        parser.add_argument('-p', '--port', default = None, help = "serial port of the programmer; the first programmer found is used if omitted")
+
+    def run(self, argv):
+        parser = self.createParser()
+        args = parser.parse_args(argv)
+
+        self.view.verbose = args.verbose
+        self.view.quiet = args.quiet
+
+        events = None
+        if args.events is not None:
+            try:
+                events = progress.JsonLinesSink(args.events)
+            except IOError as e:
+                self.view.LogError(str(e), "Usage Error")
+                return EXIT_USAGE
+            self.controller.addSink(events)
+
+        summary = None
+        if args.summary:
+            summary = progress.SummarySink(self.view)
+            self.controller.addSink(summary)
+
+        if args.record is not None and args.replay is not None:
+            self.view.LogError("Cannot record and replay at once.", "Usage Error")
+            return EXIT_USAGE
+
+        if args.record is not None and self.controller.recordTraffic(args.record) == False:
+            return EXIT_USAGE
+
+        if args.replay is not None:
+            if args.command in ['probe', 'gang', 'emulate', 'benchmark']:
+                self.view.LogError("Replay is not supported by {}.".format(args.command), "Usage Error")
+                return EXIT_USAGE
+
+            portname = self.controller.replayTraffic(args.replay, not args.replay_fast)
+            if portname == False:
+                return EXIT_USAGE
+            if args.port is None:
+                args.port = portname
+
+        try:
+            if args.command == 'probe':
+                return self.probe(args.all)
+
+            if args.command == 'emulate':
+                return self.emulate(args)
+
+            if args.command == 'benchmark':
+                return self.benchmark(args)
+
+            if self.controller.setDevice(args.device) == False:
+                return EXIT_USAGE
+
+            if args.command == 'gang':
+                return self.gang(args.port, args.input, args.diff)
+
+            if self.connect(args.port) == False:
+                return EXIT_NO_PROGRAMMER
+
+            if args.command == 'read':
+                return self.read(args.output)
+            elif args.command == 'write':
+                return self.write(args.input, args.diff)
+            elif args.command == 'verify':
+                return self.verify(args.input)
+            elif args.command == 'blank':
+                return self.blank()
+            elif args.command == 'erase':
+                return self.erase()
+        finally:
+            self.controller.closeProgrammer()
+            self.controller.stopTraffic()
+            if summary is not None:
+                summary.logSummary()
+            if events is not None:
+                events.close()
+
+        return EXIT_USAGE
+
+    def connect(self, portname):
+        if portname is None and self.controller.reconnectProgrammer() != False:
+            return True
+
+        if portname is None:
+            programmers = self.controller.getProgrammerPorts()
+            if len(programmers) <= 0:
+                self.view.LogError("No programmer found.", "Connection Error")
+                return False
+            portname = programmers[0]
+
+        if self.controller.checkProgrammer(portname) == False:
+            self.view.LogError("No programmer found on {}.".format(portname), "Connection Error")
+            return False
+
+        return True
+
+    def probe(self, allPorts = False):
+        programmers = self.controller.getProgrammers(not allPorts)
+        for programmer in programmers:
+            sys.stdout.write(programmer + '\n')
+        sys.stdout.flush()
+
+        return EXIT_OK if len(programmers) > 0 else EXIT_NO_PROGRAMMER
+
+    def read(self, pathname):
+        data = self.controller.readDevice()
+        if data == False:
+            return EXIT_FAILURE
+
+        if self.controller.exportFile(pathname, data) == False:
+            return EXIT_FAILURE
+
+        self.view.LogSuccess("Read {} bytes from device into {}.".format(len(data), pathname))
+        return EXIT_OK
+
+    def write(self, pathname, diff = False):
+        if self.controller.writeFile(pathname, diff) == False:
+            return EXIT_FAILURE
+
+        self.view.LogSuccess("Wrote and verified {} on device.".format(pathname))
+        return EXIT_OK
+
+    def verify(self, pathname):
+        if self.controller.verifyFile(pathname) == False:
+            return EXIT_FAILURE
+
+        self.view.LogSuccess("Device contents match {}.".format(pathname))
+        return EXIT_OK
+
+    def gang(self, portnames, pathnames, diff = False):
+        if portnames is None:
+            portnames = self.controller.getProgrammerPorts()
+            self.controller.closeProgrammer()
+            if len(portnames) <= 0:
+                self.view.LogError("No programmer found.", "Connection Error")
+                return EXIT_NO_PROGRAMMER
+
+        if len(pathnames) == 1:
+            pathnames = pathnames * len(portnames)
+        elif len(pathnames) != len(portnames):
+            self.view.LogError("Expected one file or one file per port, got {} files for {} ports.".format(len(pathnames), len(portnames)), "Usage Error")
+            return EXIT_USAGE
+
+        gang = GangController(self.controller)
+        try:
+            if gang.openSessions(portnames) == False:
+                self.view.LogError("No programmer found on {}.".format(", ".join(portnames)), "Connection Error")
+                return EXIT_NO_PROGRAMMER
+
+            missing = [portname for portname in portnames if not portname in gang.sessions]
+            if len(missing) > 0:
+                self.view.LogError("No programmer found on {}.".format(", ".join(missing)), "Connection Error")
+                return EXIT_NO_PROGRAMMER
+
+            results = gang.writeFiles(dict(zip(portnames, pathnames)), diff)
+        finally:
+            gang.closeSessions()
+
+        if results == False:
+            return EXIT_FAILURE
+
+        return EXIT_OK if all([result["success"] for result in results.values()]) else EXIT_FAILURE
+
+    def emulate(self, args):
+        from app import emulator # Requires a POSIX pty
+
+        programmer = emulator.ProgrammerEmulator(args.device, args.timing)
+        if args.image is not None:
+            data = self.controller.importFile(args.image)
+            if data == False:
+                self.view.LogError("Unable to read hex data from file, {}.".format(args.image), "Usage Error")
+                return EXIT_USAGE
+            programmer.loadImage(data)
+        programmer.stuck = dict(args.stuck)
+        programmer.flaky = dict(args.flaky)
+        programmer.protect = args.protect
+        programmer.corrupt = set(args.corrupt)
+        programmer.drop = set(args.drop)
+
+        sys.stdout.write(programmer.open() + '\n')
+        sys.stdout.flush()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            programmer.close()
+
+        self.view.LogSuccess("Emulated programmer received {} commands.".format(sum(programmer.commands.values())))
+        return EXIT_OK
+
+    def benchmark(self, args):
+        from app.benchmark import Benchmark, BLOCK_SIZES, CONTENTS
+
+        devices = args.device or sorted(self.controller.getDevices(), key = lambda name: self.controller.devices[name]["dataLength"])
+        blockSizes = args.block_size or BLOCK_SIZES
+        if min(blockSizes) < 1 or max(blockSizes) > 0xffff:
+            self.view.LogError("Block sizes must be between 1 and 65535 bytes.", "Usage Error")
+            return EXIT_USAGE
+
+        benchmark = Benchmark(self.controller, args.timing, not args.no_memory)
+        if benchmark.run(devices, blockSizes, args.content or CONTENTS) == False:
+            return EXIT_FAILURE
+        benchmark.logResults()
+
+        if args.output is not None:
+            try:
+                benchmark.saveReport(args.output)
+            except IOError as e:
+                self.view.LogError(str(e), "Benchmark Error")
+                return EXIT_FAILURE
+
+        failures = benchmark.getFailures()
+        if len(failures) > 0:
+            self.view.LogError("{} of {} measured operations failed.".format(len(failures), len(benchmark.results)), "Benchmark Error")
+            return EXIT_FAILURE
+
+        return EXIT_OK
+
+    def blank(self):
+        if self.controller.blankCheckDevice() == False:
+            return EXIT_FAILURE
+
+        self.view.LogSuccess("Device is blank.")
+        return EXIT_OK
+
+    def erase(self):
+        if self.controller.eraseDevice() == False:
+            return EXIT_FAILURE
+
+        self.view.LogSuccess("Erased device.")
+        return EXIT_OK
+
+def main(argv = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    return CliApp().run(argv)
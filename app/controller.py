@@ -2,36 +2,77 @@
 
 import serial
 import serial.tools.list_ports
+import threading
 import time
-import math
 import os
+import json
+
+from app import protocol
+from app import diff
+from app import hexfile
+from app import progress
+from app import trace
 
 class AppController:
     def __init__(self, view):
         self.default_timeout = 0.25
         self.block_timeout = 10
-        self.block_size = 0x0400
-        self.write_cycles = 3
+        self.default_block_size = 0x0400
+        self.block_size = self.default_block_size
+        self.window = 1 # Blocks streamed before waiting on a response
+        self.write_cycles = 3 # Write attempts per block before giving up on verification
+        self.diff_gap = 16 # Unchanged bytes bridged between changed ranges to save commands
+        self.blank_run = 64 # Minimum run of 0xFF bytes blank checked on the device instead of written
+
+        # Last connected programmer, reconnected at startup before scanning every port
+        self.cache_path = os.path.join(os.path.expanduser('~'), '.32u4-programmer.json')
+        self.cache_programmer = True
+
+        # USB vendor IDs of 32u4 boards, other ports are skipped during discovery
+        self.programmer_vids = [
+            0x239A, # Adafruit
+            0x2341, # Arduino
+            0x2A03, # Arduino
+            0x1B4F, # SparkFun
+            0x03EB, # Atmel
+        ]
 
         self.devices = {
             "AT28C16": {
                 "name": "AT28C16",
                 "startAddress": 0x0000,
                 "dataLength": 0x0800,
+                "pageSize": 0,
+                "chipErase": False,
             },
             "AT28C64": {
                 "name": "AT28C64",
                 "startAddress": 0x0000,
                 "dataLength": 0x2000,
+                "pageSize": 64,
+                "chipErase": False,
             },
             "AT28C256": {
                 "name": "AT28C256",
                 "startAddress": 0x0000,
                 "dataLength": 0x8000,
+                "pageSize": 64,
+                "chipErase": True,
             },
         }
         self.device = False
 
+        self.mismatches = [] # Image offset ranges which failed the last write or verify
+
+        # Progress event sinks and the stack of operations in progress
+        self.sinks = []
+        self.operations = []
+        self.last_send_time = 0.0
+        self.last_frame_time = (0.0, 0.0) # Time waiting for the programmer and receiving the response of the last command
+        self.sequences = {} # Sequence number of the last command sent on each port
+        self.info = False
+        self.programmer_commands = None # Command characters advertised by programmer, all assumed if None
+
         self.commands = {
             "V": {
                 "code": "V",
@@ -41,7 +82,7 @@ class AppController:
                 "dataLength": False,
                 "lineLength": False,
                 "input": False,
-                "return": "\n",
+                "return": True,
             },
             "A": {
                 "code": "A",
@@ -81,7 +122,7 @@ class AppController:
                 "dataLength": True,
                 "lineLength": True,
                 "input": False,
-                "return": "lineLength",
+                "return": True,
             },
 #            "r": {
 #                "code": "r",
@@ -91,7 +132,7 @@ class AppController:
 #                "dataLength": True,
 #                "lineLength": False,
 #                "input": False,
-#                "return": "\0",
+#                "return": True,
 #            },
             "W": {
                 "code": "W",
@@ -101,7 +142,7 @@ class AppController:
                 "dataLength": True,
                 "lineLength": False,
                 "input": "dataLength",
-                "return": "%",
+                "return": True,
             },
 #            "w": {
 #                "code": "w",
@@ -111,11 +152,16 @@ class AppController:
 #                "dataLength": True,
 #                "lineLength": False,
 #                "input": "dataLength",
-#                "return": "%",
+#                "return": True,
 #            },
         }
 
-        self.serial = serial.Serial(
+        self.serial = self.createSerial()
+
+        self.view = view(self)
+
+    def createSerial(self):
+        return serial.Serial(
             baudrate = 19200,
             bytesize = 8,
             parity = 'N',
@@ -126,8 +172,6 @@ class AppController:
             write_timeout = self.default_timeout
         )
 
-        self.view = view(self)
-
     def run(self):
         self.view.run()
 
@@ -169,31 +213,103 @@ class AppController:
             self.view.LogSuccess('Programmer configured to use ' + self.devices[name]["name"])
             return self.devices[name]
 
-    def getProgrammers(self):
+    def getProgrammers(self, filterPorts = True):
+        return [self.formatProgrammer(programmer) for programmer in self.findProgrammers(filterPorts)]
+
+    def getProgrammerPorts(self, filterPorts = True):
+        return [programmer["port"] for programmer in self.findProgrammers(filterPorts)]
+
+    def formatProgrammer(self, programmer):
+        return "{} v{} [{}]".format(programmer["info"].get('Title'), programmer["info"].get('Software Version'), programmer["port"])
+
+    def getCandidatePorts(self, filterPorts = True):
+        # Only ports of known USB vendors are probed unless filtering is disabled
+        candidates = []
+        for port in sorted(serial.tools.list_ports.comports(), key = lambda port: port.device):
+            if filterPorts == True and not port.vid in self.programmer_vids:
+                continue
+            candidates.append(port)
+        return candidates
+
+    def findProgrammers(self, filterPorts = True):
+        # Returns list of dicts with port, description, hwid, serial number and info of each programmer found
+        # Ports of known USB vendors are queried first, every port if none of them has a programmer
         self.view.Log("Querying serial COM ports for programming devices.")
 
-        choices = []
-        for n, (portname, desc, hwid) in enumerate(sorted(serial.tools.list_ports.comports())):
-            if self.checkProgrammer(portname) == True:
-                info = self.getInfo()
-                choices.append("{} v{} [{}]".format(info['Title'], info['Software Version'], portname))
+        candidates = self.getCandidatePorts(filterPorts)
+        results = {}
+
+        def probe(port):
+            results[port.device] = self.probeProgrammer(port.device)
+
+        # Probe every candidate on its own serial handle so timeouts overlap
+        threads = [threading.Thread(target = probe, args = (port,)) for port in candidates]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        programmers = []
+        for port in candidates:
+            info = results.get(port.device, False)
+            if info == False:
+                continue
+            programmers.append({
+                "port": port.device,
+                "description": port.description,
+                "hwid": port.hwid,
+                "serial_number": port.serial_number,
+                "info": info,
+            })
 
         plural = ""
-        if len(choices) > 1: plural = "s"
+        if len(programmers) != 1: plural = "s"
 
-        self.view.Log("Done querying COM ports. {} device{} found.".format(len(choices), plural))
-        return choices
+        ports = len(serial.tools.list_ports.comports())
+        self.view.Log("Done querying {} of {} COM ports. {} device{} found.".format(len(candidates), ports, len(programmers), plural))
 
-    def checkProgrammer(self, portname):
+        # Programmers built on boards of unlisted vendors are still found, only more slowly
+        if len(programmers) <= 0 and filterPorts == True and len(candidates) < ports:
+            self.view.Log("No programmer found on ports of known USB vendors, querying every port.")
+            return self.findProgrammers(False)
+
+        return programmers
+
+    def probeProgrammer(self, portname):
+        # Returns info of programmer on port or False, without touching the active connection
+        port = self.createSerial()
+        port.port = portname
+        try:
+            port.open()
+        except serial.SerialException as e:
+            self.view.Log("Unable to open {}, {}".format(portname, str(e)))
+            return False
+
+        try:
+            info = self.getInfo(port, quiet = True)
+        finally:
+            port.close()
+
+        if info != False and info.get('Title') == '32u4 Programmer':
+            self.view.Log("Found programmer on {}.".format(portname))
+            return info
+
+        self.view.Log("No programmer on {}.".format(portname))
+        return False
+
+    def checkProgrammer(self, portname, cache = True):
+        # Remembered for reconnecting only once identified, unless cache is False
         self.view.Log("Checking device on {}.".format(portname))
 
         if self.setProgrammer(portname) == False:
             return False
 
-        info = self.getInfo()
+        info = self.info
 
-        if info != False and len(info) > 0 and info['Title'] == '32u4 Programmer':
+        if info != False and len(info) > 0 and info.get('Title') == '32u4 Programmer':
             self.view.LogSuccess("Successfully identified programmer on {}".format(portname))
+            if cache == True:
+                self.saveProgrammerCache(portname, info)
             return True
         else:
             self.view.LogWarning("Invalid device on {}".format(portname))
@@ -219,120 +335,394 @@ class AppController:
             ' Xon/Xoff' if self.serial.xonxoff else '',
         ))
 
+        self.info = self.getInfo()
+        self.configureProgrammer(self.info)
+
+        return True
+
+    def getPortInfo(self, portname):
+        for port in serial.tools.list_ports.comports():
+            if port.device == portname:
+                return port
+        return None
+
+    def loadProgrammerCache(self):
+        if not os.path.isfile(self.cache_path):
+            return False
+
+        try:
+            with open(self.cache_path, 'r') as file:
+                cache = json.load(file)
+        except (IOError, ValueError):
+            self.view.LogWarning("Unable to read programmer cache, {}.".format(self.cache_path))
+            return False
+
+        if not isinstance(cache, dict) or not "port" in cache:
+            return False
+
+        return cache
+
+    def saveProgrammerCache(self, portname, info):
+        if self.cache_programmer == False:
+            return False
+
+        port = self.getPortInfo(portname)
+        cache = {
+            "port": portname,
+            "hwid": port.hwid if port is not None else None,
+            "serial_number": port.serial_number if port is not None else None,
+            "version": info.get('Software Version'),
+        }
+
+        try:
+            with open(self.cache_path, 'w') as file:
+                json.dump(cache, file)
+        except IOError:
+            self.view.LogWarning("Unable to save programmer cache, {}.".format(self.cache_path))
+            return False
+
+        return True
+
+    def clearProgrammerCache(self):
+        if not os.path.isfile(self.cache_path):
+            return False
+
+        try:
+            os.remove(self.cache_path)
+        except OSError:
+            return False
+
+        return True
+
+    def reconnectProgrammer(self):
+        # Connect to the cached programmer, returns programmer dict like findProgrammers or False to fall back to a scan
+        cache = self.loadProgrammerCache()
+        if cache == False:
+            return False
+
+        # Programmer may have been assigned a new port name, so find it by USB serial number first
+        port = None
+        for candidate in serial.tools.list_ports.comports():
+            if cache.get("serial_number") is not None and candidate.serial_number == cache["serial_number"]:
+                port = candidate
+                break
+            if cache.get("serial_number") is None and candidate.device == cache["port"]:
+                port = candidate
+                break
+
+        if port is None:
+            self.view.Log("Cached programmer on {} not found.".format(cache["port"]))
+            return False
+
+        if port.hwid != cache.get("hwid"):
+            self.view.Log("Hardware of cached programmer on {} changed, clearing cache.".format(port.device))
+            self.clearProgrammerCache()
+            return False
+
+        self.view.Log("Reconnecting to cached programmer on {}.".format(port.device))
+        if self.checkProgrammer(port.device, False) == False:
+            self.closeProgrammer()
+            return False
+
+        if self.info.get('Software Version') != cache.get("version"):
+            self.view.Log("Firmware of cached programmer on {} changed, clearing cache.".format(port.device))
+            self.closeProgrammer()
+            self.clearProgrammerCache()
+            return False
+
+        self.saveProgrammerCache(port.device, self.info)
+        return {
+            "port": port.device,
+            "description": port.description,
+            "hwid": port.hwid,
+            "serial_number": port.serial_number,
+            "info": self.info,
+        }
+
+    def configureProgrammer(self, info):
+        # Size transfers from the programmer's advertised link parameters
+        self.block_size = self.default_block_size
+        self.window = 1
+        self.programmer_commands = None
+
+        if info == False:
+            return False
+
+        if 'Max Block' in info:
+            try:
+                self.block_size = max(1, min(int(info['Max Block']), 0xffff))
+            except ValueError:
+                self.view.LogWarning("Invalid block size advertised by programmer, using {} bytes.".format(self.block_size))
+
+        if 'Window' in info:
+            try:
+                self.window = max(1, int(info['Window']))
+            except ValueError:
+                self.view.LogWarning("Invalid window advertised by programmer, sending one block at a time.")
+
+        if 'Commands' in info:
+            self.programmer_commands = info['Commands']
+
+        self.view.Log("Programmer configured for {} byte blocks with {} in flight.".format(self.block_size, self.window))
         return True
 
+    def supportsCommand(self, code):
+        return self.programmer_commands is None or code in self.programmer_commands
+
     def closeProgrammer(self):
+        self.info = False
         if self.serial.is_open == True:
             self.serial.close()
             return True
         else:
             return False
 
-    def sendCommand(self, code, startAddress = None, dataLength = None, lineLength = None):
-        if len(code) < 1 or self.serial.is_open == False:
+    def recordTraffic(self, pathname):
+        # Log all traffic of the programmer connection to a trace file until stopTraffic
+        self.stopTraffic()
+        try:
+            self.serial = trace.RecordingSerial(self.serial, pathname)
+        except IOError as e:
+            self.view.LogError(str(e), "Trace Error")
             return False
 
-        # Build Command
-        command = code[:1]
-        if startAddress is not None:
-            if startAddress > 0xffff:
-                startAddress = 0xffff
-            command += ',' + "{0:0{1}x}".format(startAddress, 4)
-
-            if dataLength is not None:
-                if dataLength > 0xffff:
-                    dataLength = 0xffff
-                command += ',' + "{0:0{1}x}".format(dataLength, 4)
-
-                if lineLength is not None:
-                    if lineLength > 0xff:
-                        lineLength = 0xff
-                    command += ',' + "{0:0{1}x}".format(lineLength, 2)
-        command += '\n'
+        self.view.Log("Recording programmer traffic to {}.".format(pathname))
+        return True
 
+    def replayTraffic(self, pathname, timed = True):
+        # Replace the programmer connection with a recorded trace, returns port name of the recorded programmer or False
+        self.stopTraffic()
         try:
-            command = command.encode('utf-8')
-        except UnicodeEncodeError:
-            self.view.LogError("Failed to encode data as UTF-8.", "Serial Command Error")
+            replay = trace.ReplaySerial(pathname, timed)
+        except (IOError, ValueError) as e:
+            self.view.LogError(str(e), "Trace Error")
+            return False
+
+        self.closeProgrammer()
+        self.serial = replay
+        self.cache_programmer = False
+
+        self.view.Log("Replaying programmer traffic from {}{}.".format(pathname, "" if timed else " without delays"))
+        return replay.portname
+
+    def stopTraffic(self):
+        if isinstance(self.serial, trace.RecordingSerial):
+            self.serial = self.serial.stop()
+            return True
+
+        if isinstance(self.serial, trace.ReplaySerial):
+            self.serial = self.createSerial()
+            self.cache_programmer = True
+            return True
+
+        return False
+
+    def addSink(self, sink):
+        # Sinks receive every progress event through handleEvent(event)
+        self.sinks.append(sink)
+        return True
+
+    def removeSink(self, sink):
+        if not sink in self.sinks:
+            return False
+        self.sinks.remove(sink)
+        return True
+
+    def emitEvent(self, event):
+        event["time"] = time.time()
+        for sink in self.sinks:
+            sink.handleEvent(event)
+
+    def beginOperation(self, operation, total):
+        self.operations.append({
+            "operation": operation,
+            "total": total,
+            "done": 0,
+            "start": progress.clock(),
+        })
+        self.emitEvent({"event": "start", "operation": operation, "bytes": total})
+
+    def blockProgress(self, address, length, send, device, receive):
+        if len(self.operations) <= 0:
+            return
+
+        operation = self.operations[-1]
+        operation["done"] += length
+        self.emitEvent({
+            "event": "block",
+            "operation": operation["operation"],
+            "address": address,
+            "bytes": length,
+            "send": send,
+            "device": device,
+            "receive": receive,
+            "done": operation["done"],
+            "total": operation["total"],
+            "elapsed": progress.clock() - operation["start"],
+        })
+
+    def retryProgress(self, cycle, blocks):
+        if len(self.operations) <= 0:
+            return
+
+        operation = self.operations[-1]
+        operation["total"] += sum([length for address, length in blocks])
+        self.emitEvent({"event": "retry", "operation": operation["operation"], "cycle": cycle, "blocks": len(blocks)})
+
+    def endOperation(self, success):
+        # Returns success so it can end a method
+        if len(self.operations) <= 0:
+            return success
+
+        operation = self.operations.pop()
+        elapsed = progress.clock() - operation["start"]
+        self.emitEvent({
+            "event": "end",
+            "operation": operation["operation"],
+            "success": success == True,
+            "bytes": operation["done"],
+            "elapsed": elapsed,
+            "rate": operation["done"] / elapsed if elapsed > 0 else 0.0,
+        })
+        return success
+
+    def sendCommand(self, code, startAddress = None, dataLength = None, lineLength = None, data = None, port = None, quiet = False, pipelined = False):
+        # Unless more responses are still expected, anything already received is a late reply to an earlier command
+        port = port if port is not None else self.serial
+        if len(code) < 1 or port.is_open == False:
             return False
 
-        self.view.Log("Sending Command: {}".format(command[:-1]))
+        # Build Command
+        if startAddress is not None and startAddress > 0xffff:
+            startAddress = 0xffff
+        if dataLength is not None and dataLength > 0xffff:
+            dataLength = 0xffff
+        if lineLength is not None and lineLength > 0xff:
+            lineLength = 0xff
+
+        if data is not None and not isinstance(data, (bytes, bytearray, memoryview)):
+            try:
+                data = data.encode('utf-8')
+            except UnicodeEncodeError:
+                self.view.LogError("Failed to encode data as UTF-8.", "Serial Command Error")
+                return False
+
+        sequence = (self.sequences.get(port, 0) + 1) & 0xFF
+        frame = protocol.packCommand(code[:1], startAddress, dataLength, lineLength, data, sequence)
+
+        self.view.Log("Sending Command: {}".format(", ".join([code[:1]] + ["{0:0{1}x}".format(x, width) for x, width in [(startAddress, 4), (dataLength, 4), (lineLength, 2)] if x is not None])))
+        start = progress.clock()
         try:
-            self.serial.write(command)
-            self.serial.flush()
+            if pipelined == False:
+                port.reset_input_buffer()
+            port.write(frame)
+            port.flush()
         except serial.SerialException as e:
-            self.view.LogError(str(e), "Serial Command Error")
+            self.logError(str(e), "Serial Command Error", quiet)
             return False
+        self.sequences[port] = sequence
+        self.last_send_time = progress.clock() - start
 
         return True
 
+    def readFrame(self, code, timeout = None, title = "Serial Read Error", port = None, buffer = None, quiet = False, sequence = None):
+        # Returns response payload starting with status byte or False
+        # Response must echo the sequence number, of the last command sent on the port if not given
+        # Failures aren't logged if quiet, ie: while probing ports which may not have a programmer
+        # Data following the status byte is read into buffer instead if it is the expected length, leaving only the status in the payload
+        port = port if port is not None else self.serial
+        if sequence is None:
+            sequence = self.sequences.get(port, 0)
+        port.timeout = timeout if timeout is not None else self.block_timeout
+        start = progress.clock()
+        try:
+            # Skip anything before sync byte
+            while True:
+                sync = bytearray(port.read(1))
+                if len(sync) < 1:
+                    port.timeout = self.default_timeout
+                    return self.dropFrame(port, "Timed out waiting for response from programmer.", title, quiet)
+                if sync[0] == protocol.FRAME_SYNC:
+                    break
+            synced = progress.clock()
+
+            header = bytearray(port.read(protocol.FRAME_HEADER))
+            length = 0
+            if len(header) == protocol.FRAME_HEADER:
+                length = header[2] | (header[3] << 8)
+            if buffer is not None and length == len(buffer) + 1:
+                payload = bytearray(port.read(1))
+                received = port.readinto(buffer) if len(payload) == 1 else 0
+                crc = bytearray(port.read(protocol.FRAME_CRC))
+            else:
+                buffer = None
+                payload = bytearray(port.read(length))
+                crc = bytearray(port.read(protocol.FRAME_CRC))
+        except serial.SerialException as e:
+            port.timeout = self.default_timeout
+            return self.dropFrame(port, str(e), title, quiet)
+        port.timeout = self.default_timeout
+        self.last_frame_time = (synced - start, progress.clock() - synced)
+
+        if buffer is not None and (len(payload) < 1 or received < len(buffer)):
+            return self.dropFrame(port, "Incomplete response from programmer.", title, quiet)
+
+        if len(header) < protocol.FRAME_HEADER or (buffer is None and len(payload) < length) or len(crc) < protocol.FRAME_CRC:
+            return self.dropFrame(port, "Incomplete response from programmer.", title, quiet)
+
+        checksum = protocol.crc16(header + payload)
+        if buffer is not None:
+            checksum = protocol.crc16(buffer, checksum)
+
+        if checksum != crc[0] | (crc[1] << 8):
+            return self.dropFrame(port, "Response from programmer failed CRC check.", title, quiet)
+
+        if header[0] != ord(code[:1]) or header[1] != sequence or length < 1:
+            return self.dropFrame(port, "Unexpected response from programmer.", title, quiet)
+
+        return payload
+
+    def dropFrame(self, port, message, title = "Serial Read Error", quiet = False):
+        # Discards the rest of a failed response and anything following it so it isn't read as the next one
+        try:
+            port.reset_input_buffer()
+        except serial.SerialException:
+            pass
+        self.logError(message, title, quiet)
+        return False
+
+    def logError(self, message, title = "Error", quiet = False):
+        if quiet:
+            return False
+        return self.view.LogError(message, title)
+
     def readCommand(self, commandInfo, dataLength = None, lineLength = None):
-        if commandInfo["return"] == False:
+        payload = self.readFrame(commandInfo["code"], self.block_timeout, "Command Read Error")
+        if payload == False or not self.checkStatus(payload, "Command Read Error"):
             return False
 
-        if isinstance(commandInfo["return"], str):
-            read = False
-
-            if len(commandInfo["return"]) == 1:
-                self.serial.timeout = self.block_timeout
-                try:
-                    read = str(self.serial.read_until(commandInfo["return"]))
-                except serial.SerialException as e:
-                    self.view.LogError(str(e), "Command Read Error")
-                    self.serial.timeout = self.default_timeout
-                    return False
-
-            elif commandInfo["return"] == "lineLength":
-                if dataLength is None or not isinstance(dataLength, int) or dataLength <= 0 or lineLength is None or not isinstance(lineLength, int) or lineLength <= 0:
-                    return False
-
-                lines = int(math.ceil(float(dataLength) / float(lineLength)))
-
-                read = ""
-                self.serial.timeout = self.block_timeout
-                try:
-                    for line in range(lines):
-                        read += str(self.serial.read_until('\n')) + '\n'
-                except serial.SerialException as e:
-                    self.view.LogError(str(e), "Command Read Error")
-                    self.serial.timeout = self.default_timeout
-                    return False
-
-            elif commandInfo["return"] == "dataLength":
-                if dataLength is None or not isinstance(dataLength, int) or dataLength <= 0:
-                    return False
-
-                self.serial.timeout = self.block_timeout
-                try:
-                    read = str(self.serial.read(dataLength))
-                    terminator = self.serial.read(1)
-                except serial.SerialException as e:
-                    self.view.LogError(str(e), "Command Read Error")
-                    self.serial.timeout = self.default_timeout
-                    return False
-
-            self.serial.timeout = self.default_timeout
-            if read == False or len(read) <= 0:
-                return False
-            else:
-                return read
+        if commandInfo["return"] == False:
+            return True
 
-        return False
+        if len(payload) <= 1:
+            return protocol.STATUSES[protocol.STATUS_OK]
 
-    def getInfo(self):
-        if self.serial.is_open == False:
+        return payload[1:].decode('utf-8', 'replace')
+
+    def getInfo(self, port = None, quiet = False):
+        port = port if port is not None else self.serial
+        if port.is_open == False:
             return False
 
-        if self.sendCommand(u'V') == False:
+        if self.sendCommand(u'V', port = port, quiet = quiet) == False:
             return False
 
-        info_str = False
-        try:
-            info_str = str(self.serial.read_until('\n'))
-        except serial.SerialException as e:
-            self.view.LogError(str(e), "Serial Read Error")
+        payload = self.readFrame(u'V', self.default_timeout, port = port, quiet = quiet)
+        if payload == False or payload[0] != protocol.STATUS_OK:
             return False
-        if info_str == False or len(info_str) <= 0 or '$' in info_str == False:
+
+        info_str = payload[1:].decode('utf-8', 'replace')
+        if len(info_str) <= 0 or '$' in info_str == False:
             return False
 
         info_arr = info_str.split("$")
@@ -341,7 +731,7 @@ class AppController:
             if len(info_line_str) <= 1 or ':' in info_line_str == False:
                 continue
 
-            info_line_arr = info_line_str.split(':')
+            info_line_arr = info_line_str.split(':', 1)
             if len(info_line_arr) < 2:
                 continue
 
@@ -350,7 +740,11 @@ class AppController:
         return info_data
 
     def playTone(self):
-        return self.serial.is_open != False and self.sendCommand(u'T') != False
+        if self.serial.is_open == False or self.sendCommand(u'T') == False:
+            return False
+
+        payload = self.readFrame(u'T')
+        return payload != False and payload[0] == protocol.STATUS_OK
 
     def readDevice(self):
         if not self.device or not self.device in self.devices:
@@ -361,54 +755,197 @@ class AppController:
             self.view.LogError("Programmer not connected.", "Device Read Error")
             return False
 
-        startAddress = self.devices[self.device]["startAddress"]
         dataLength = self.devices[self.device]["dataLength"]
-        endAddress = dataLength + startAddress
 
-        data = []
-        address = startAddress
-        while address < endAddress:
-            block_size = min(self.block_size, endAddress - address)
+        data = bytearray(dataLength)
+        received = self.readRanges(data, [(0, dataLength)])
+        if received != dataLength:
+            self.view.LogError("Failed to read all {} bytes from ROM. Only received {}.".format(dataLength, received), "Device Read Error")
+            return False
 
-            block = self.readBlock(address, block_size)
-            if block == False or len(block) <= 0:
-                break
+        # Play tone on programmer to indicate read completion, an unacknowledged tone means it stopped responding
+        if not self.playTone():
+            return False
+        return data
 
-            data = data + block
-            address += block_size
+    def readRanges(self, data, ranges):
+        # Reads (start, end) offset ranges of the device straight into the image data, returns the number of bytes received
+        startAddress = self.devices[self.device]["startAddress"]
+        blocks = self.splitBlocks([(startAddress + start, startAddress + end) for start, end in ranges])
 
-        if len(data) != dataLength:
-            self.view.LogError("Failed to read all {} bytes from ROM. Only received {}.".format(dataLength, len(data)), "Device Read Error")
-            return False
+        view = memoryview(data)
+        received = 0
+        self.beginOperation(u'read', sum([length for address, length in blocks]))
+        for address, length in blocks:
+            block = self.readBlock(address, length, view[address - startAddress:address - startAddress + length])
+            if block is False:
+                self.endOperation(False)
+                return received
+            self.blockProgress(address, length, self.last_send_time, *self.last_frame_time)
 
-        self.playTone() # Play tone on programmer to indicate read completion
-        return data
+            received += length
 
-    def readBlock(self, startAddress, dataLength):
+        self.endOperation(True)
+        return received
+
+    def readBlock(self, startAddress, dataLength, buffer = None):
+        # Returns buffer, or a new bytearray if not provided, filled with the block or False
         if self.serial.is_open == False:
             return False
 
+        if buffer is None:
+            buffer = bytearray(dataLength)
+
         if not self.sendCommand(u'r', startAddress, dataLength):
             return False
 
-        time.sleep(0.1) # Wait for programmer to start working
+        payload = self.readFrame(u'r', self.block_timeout, "Block Read Error", buffer = buffer)
+        if payload == False or not self.checkStatus(payload, "Block Read Error"):
+            return False
 
-        self.serial.timeout = self.block_timeout
-        try:
-            block = self.serial.read(dataLength)
-            terminator = self.serial.read(1)
-        except serial.SerialException as e:
-            self.view.LogError(str(e), "Block Read Error")
-            self.serial.timeout = self.default_timeout
+        if len(payload) != 1:
+            self.view.LogError("Block length does not match request.", "Block Read Error")
             return False
-        self.serial.timeout = self.default_timeout
 
-        # Convert bytes to array of ints
-        block = [ord(x) for x in block]
+        return buffer
 
-        return block
+    def readChecksum(self, startAddress, dataLength):
+        # Returns CRC-32 of device range computed by the programmer or False
+        if self.serial.is_open == False:
+            return False
+
+        if not self.sendCommand(u'C', startAddress, dataLength):
+            return False
 
-    def writeDevice(self, data):
+        payload = self.readFrame(u'C', self.block_timeout, "Checksum Error")
+        if payload == False or not self.checkStatus(payload, "Checksum Error"):
+            return False
+
+        if len(payload) < 5:
+            self.view.LogError("Incomplete checksum from programmer.", "Checksum Error")
+            return False
+
+        return payload[1] | (payload[2] << 8) | (payload[3] << 16) | (payload[4] << 24)
+
+    def findNonBlank(self, startAddress, dataLength):
+        # Returns first address in range not holding 0xFF, None if range is blank, or False
+        if self.serial.is_open == False:
+            return False
+
+        if not self.sendCommand(u'B', startAddress, dataLength):
+            return False
+
+        payload = self.readFrame(u'B', self.block_timeout, "Blank Check Error")
+        if payload == False:
+            return False
+
+        if payload[0] == protocol.STATUS_NOT_BLANK and len(payload) >= 3:
+            return payload[1] | (payload[2] << 8)
+
+        if not self.checkStatus(payload, "Blank Check Error"):
+            return False
+
+        return None
+
+    def blankCheckDevice(self):
+        if not self.device or not self.device in self.devices:
+            self.view.LogError("Device not selected.", "Blank Check Error")
+            return False
+
+        if self.serial.is_open == False:
+            self.view.LogError("Programmer not connected.", "Blank Check Error")
+            return False
+
+        startAddress = self.devices[self.device]["startAddress"]
+        dataLength = self.devices[self.device]["dataLength"]
+
+        if self.supportsCommand(u'B'):
+            address = self.findNonBlank(startAddress, dataLength)
+            if address is False:
+                return False
+        else:
+            readData = self.readDevice()
+            if readData == False:
+                return False
+
+            address = None
+            for i, val in enumerate(readData):
+                if val != 0xFF:
+                    address = startAddress + i
+                    break
+
+        if address is not None:
+            self.view.LogWarning("Device is not blank at {}.".format("0x{0:0{1}x}".format(address, 4)))
+            return False
+
+        return True
+
+    def eraseDevice(self):
+        if not self.device or not self.device in self.devices:
+            self.view.LogError("Device not selected.", "Device Erase Error")
+            return False
+
+        if self.serial.is_open == False:
+            self.view.LogError("Programmer not connected.", "Device Erase Error")
+            return False
+
+        device = self.devices[self.device]
+        startAddress = device["startAddress"]
+        endAddress = device["dataLength"] + startAddress
+
+        erased = False
+        if device.get("chipErase", False) and self.supportsCommand(u'E'):
+            self.view.Log("Erasing device with software chip erase.")
+            if not self.sendCommand(u'E'):
+                return False
+
+            payload = self.readFrame(u'E', self.block_timeout, "Device Erase Error")
+            if payload == False or not self.checkStatus(payload, "Device Erase Error"):
+                return False
+
+            erased = self.blankCheckDevice()
+            if not erased:
+                self.view.LogWarning("Chip erase not accepted by device, filling with 0xFF instead.")
+
+        if not erased:
+            self.view.Log("Filling device with 0xFF.")
+            blocks = self.splitBlocks([(startAddress, endAddress)])
+            if self.supportsCommand(u'F'):
+                for address, length in blocks:
+                    if not self.fillBlock(address, length, 0xFF):
+                        self.view.LogError("Failed to fill device.", "Device Erase Error")
+                        return False
+            elif not self.writeBlocks([(address, bytearray(b'\xff') * length) for address, length in blocks]):
+                self.view.LogError("Failed to fill device.", "Device Erase Error")
+                return False
+
+            if not self.blankCheckDevice():
+                self.view.LogError("Device failed blank check after erase.", "Device Erase Error")
+                return False
+
+        # Play tone on programmer to indicate erase completion, an unacknowledged tone means it stopped responding
+        if not self.playTone():
+            return False
+        return True
+
+    def fillBlock(self, startAddress, dataLength, value):
+        if self.serial.is_open == False:
+            return False
+
+        pageSize = 0
+        if self.device and self.device in self.devices:
+            pageSize = self.devices[self.device].get("pageSize", 0)
+
+        self.view.Log("Filling {} bytes starting at {} with {}.".format(dataLength, "0x{0:0{1}x}".format(startAddress, 4), "0x{0:0{1}x}".format(value, 2)))
+
+        if not self.sendCommand(u'F', startAddress, dataLength, pageSize, bytearray([value])):
+            return False
+
+        payload = self.readFrame(u'F', self.block_timeout, "Block Fill Error")
+        return payload != False and self.checkStatus(payload, "Block Fill Error")
+
+    def writeDevice(self, data, diffOnly = False, current = None, ranges = None):
+        # Only the (start, end) offset ranges of data are written if given
         if not self.device or not self.device in self.devices:
             self.view.LogError("Device not selected.", "Device Write Error")
             return False
@@ -419,145 +956,432 @@ class AppController:
 
         startAddress = self.devices[self.device]["startAddress"]
         dataLength = self.devices[self.device]["dataLength"]
-        endAddress = dataLength + startAddress
 
         if len(data) != dataLength:
             self.view.LogError("ROM data not the appropriate length for device. Must be {} bytes.".format(dataLength), "Device Write Error")
             return False
 
+        # Read current device contents to only write changed bytes
+        if diffOnly == True and current is None:
+            self.view.Log("Reading device contents to find changed bytes.")
+            current = self.readDevice()
+            if current == False:
+                self.view.LogError("Unable to read current device contents.", "Device Write Error")
+                return False
 
-        # Write data and verify results for a number of write cycles until device is fully written
+        if current is not None and len(current) != dataLength:
+            self.view.LogError("Current device contents not the appropriate length for device. Must be {} bytes.".format(dataLength), "Device Write Error")
+            return False
+
+        if current is not None:
+            ranges = self.getChangedRanges(data, current)
+            changed = sum([end - start for start, end in ranges])
+            self.view.Log("Writing {} changed bytes in {} ranges, skipping {} unchanged bytes.".format(changed, len(ranges), dataLength - changed))
+        elif ranges is None:
+            ranges = [(0, dataLength)]
+
+        # Skip runs of padding which are already erased on the device
+        if current is None and self.supportsCommand(u'B'):
+            ranges = self.skipBlankRanges(data, ranges, startAddress)
+            if ranges == False:
+                self.view.LogError("Unable to blank check device.", "Device Write Error")
+                return False
+
+        # Stream all blocks, then verify each block and rewrite only the ranges that failed
+        image = memoryview(data)
+        blocks = self.splitBlocks([(startAddress + start, startAddress + end) for start, end in ranges])
+        self.mismatches = []
+        badRanges = []
+        badCount = 0
         cycle = 0
-        verified = False
-        error = False
-        while error == False and verified == False and cycle < self.write_cycles:
+        self.beginOperation(u'write', sum([length for address, length in blocks]))
+        while len(blocks) > 0 and cycle < self.write_cycles:
+            if cycle > 0:
+                self.view.LogWarning("{} ranges failed verification, rewriting.".format(len(blocks)))
+                self.retryProgress(cycle, blocks)
+
+            if not self.writeBlocks([(address, image[address - startAddress:address - startAddress + length]) for address, length in blocks]):
+                self.view.LogError("Failed to write all blocks to device.", "Device Write Error")
+                return self.endOperation(False)
+
+            result = self.verifyBlocks(blocks, data, startAddress)
+            if result == False:
+                self.view.LogError("Failed to read back blocks from device.", "Device Write Error")
+                return self.endOperation(False)
+            blocks, badRanges, badCount = result
 
-            # Write blocks
-            address = startAddress
-            while address < endAddress:
-                block_size = min(self.block_size, endAddress - address)
+            cycle += 1
 
-                relAddr = address - startAddress
-                block = data[slice(relAddr, relAddr + block_size)]
+        if badCount > 0:
+            self.mismatches = diff.offsetRanges(badRanges, -startAddress)
+            self.view.LogError("Unable to verify {} bytes in {} ranges written to Eeprom device at {}.".format(badCount, len(badRanges), self.formatRanges(badRanges)), "Device Write Error")
+            return self.endOperation(False)
 
-                if not self.writeBlock(address, block):
-                    error = True
-                    break
+        self.endOperation(True)
+        # Play tone on programmer to indicate write completion, an unacknowledged tone means it stopped responding
+        if not self.playTone():
+            return False
+        return True
 
-                address += block_size
+    def skipBlankRanges(self, data, ranges, startAddress):
+        # Remove runs of 0xFF in data from (start, end) offset ranges where the device is already blank
+        result = []
+        skipped = 0
+        for start, end in ranges:
+            offset = start
+            for runStart, runEnd in self.getBlankRuns(data, start, end):
+                position = runStart
+                while position < runEnd:
+                    address = self.findNonBlank(startAddress + position, runEnd - position)
+                    if address is False:
+                        return False
+
+                    # Device is blank up to the first byte that isn't erased, check again past the bytes written
+                    blankEnd = runEnd if address is None else address - startAddress
+                    if blankEnd > position:
+                        if position > offset:
+                            result.append((offset, position))
+                        offset = blankEnd
+                        skipped += blankEnd - position
+
+                    position = blankEnd + self.blank_run
+
+            if end > offset:
+                result.append((offset, end))
+
+        if skipped > 0:
+            self.view.Log("Skipping {} bytes of padding already erased on device.".format(skipped))
+
+        return result
+
+    def getBlankRuns(self, data, start, end):
+        # Returns list of (start, end) offsets of 0xFF runs at least blank_run bytes long
+        runs = []
+        runStart = None
+        for i in range(start, end):
+            if data[i] == 0xFF:
+                if runStart is None:
+                    runStart = i
+                continue
 
-            if error == True:
-                break
+            if runStart is not None and i - runStart >= self.blank_run:
+                runs.append((runStart, i))
+            runStart = None
+
+        if runStart is not None and end - runStart >= self.blank_run:
+            runs.append((runStart, end))
+
+        return runs
+
+    def splitBlocks(self, ranges):
+        # Split (start, end) address ranges into (address, length) blocks no larger than block size
+        blocks = []
+        for start, end in ranges:
+            address = start
+            while address < end:
+                length = min(self.block_size, end - address)
+                blocks.append((address, length))
+                address += length
+        return blocks
+
+    def verifyBlocks(self, blocks, data, startAddress):
+        # Returns blocks which need to be rewritten, the (start, end) address ranges that failed and their byte count, or False on communication failure
+        retry = []
+        badRanges = []
+        badCount = 0
+        image = memoryview(data)
+        self.beginOperation(u'verify', sum([length for address, length in blocks]))
+        for address, length in blocks:
+            relAddr = address - startAddress
+            expected = image[relAddr:relAddr + length]
+            send, device, receive = (0.0, 0.0, 0.0)
+
+            # Only read back blocks whose checksum on the device doesn't match
+            if self.supportsCommand(u'C'):
+                checksum = self.readChecksum(address, length)
+                if checksum is False:
+                    return self.endOperation(False)
+                send, device, receive = (self.last_send_time, ) + self.last_frame_time
+                if checksum == protocol.crc32(expected):
+                    self.blockProgress(address, length, send, device, receive)
+                    continue
+
+            readData = self.readBlock(address, length)
+            if readData is False:
+                return self.endOperation(False)
+            self.blockProgress(address, length, send + self.last_send_time, device + self.last_frame_time[0], receive + self.last_frame_time[1])
+
+            ranges, count = diff.compareImages(expected, readData)
+            for start, end in diff.mergeRanges(ranges, self.diff_gap):
+                retry.append((address + start, end - start))
+            badRanges += diff.offsetRanges(ranges, address)
+            badCount += count
+
+        self.endOperation(True)
+        return retry, diff.mergeRanges(sorted(badRanges)), badCount
+
+    def formatRanges(self, ranges, limit = 8):
+        # Inclusive hex addresses of the first (start, end) ranges
+        text = ", ".join(["0x{0:0{1}x}".format(start, 4) if end - start == 1 else "0x{0:0{2}x}-0x{1:0{2}x}".format(start, end - 1, 4) for start, end in ranges[:limit]])
+        if len(ranges) > limit:
+            text += " and {} more ranges".format(len(ranges) - limit)
+        return text
+
+    def getChangedRanges(self, a, b):
+        # Returns list of (start, end) offsets where a differs from b, joining ranges separated by small gaps
+        return diff.mergeRanges(diff.compareImages(a, b)[0], self.diff_gap)
 
-            # Verify data
-            readData = self.readDevice()
-            if self.compareData(data, readData) == True:
-                verified = True
+    def writeBlock(self, startAddress, data):
+        return self.writeBlocks([(startAddress, data)])
+
+    def writeBlocks(self, blocks):
+        # Stream (address, data) blocks keeping up to the programmer's window of blocks in flight
+        if self.serial.is_open == False:
+            return False
+
+        self.serial.write_timeout = self.block_timeout # Programmer may hold off input while burning
+
+        success = True
+        pending = [] # Commands awaiting status response with their sequence number, address, length and send time
+        for address, data in blocks:
+            if len(pending) >= self.window:
+                if not self.readBlockStatus(*pending.pop(0)):
+                    success = False
+                    break
+
+            command = self.sendBlock(address, data, len(pending) > 0)
+            if command == False:
+                success = False
                 break
+            pending.append((command, self.sequences[self.serial], address, len(data), self.last_send_time))
 
-            cycle += 1
+        # Collect remaining responses to keep stream in sync, even after a failure
+        for block in pending:
+            if not self.readBlockStatus(*block):
+                success = False
 
-        if error == True:
-            self.view.LogError("Failed to write all blocks to device.", "Device Write Error")
+        self.serial.write_timeout = self.default_timeout
+        return success
+
+    def sendBlock(self, startAddress, data, pipelined = False):
+        # Returns command sent or False
+        if len(data) > self.block_size:
             return False
 
-        if verified == False:
-            self.view.LogError("Unable to verify data was written to Eeprom device.", "Device Write Error")
+        # Use page write mode if supported by device
+        pageSize = 0
+        if self.device and self.device in self.devices:
+            pageSize = self.devices[self.device].get("pageSize", 0)
+
+        if pageSize > 0 and self.supportsCommand(u'P'):
+            command = u'P'
+        else:
+            command = u'w'
+            pageSize = None
+
+        self.view.Log("Writing {} bytes to programmer starting at {}.".format(len(data), "0x{0:0{1}x}".format(startAddress, 4)))
+
+        if not self.sendCommand(command, startAddress, len(data), pageSize, data, pipelined = pipelined):
             return False
 
-        self.playTone() # Play tone on programmer to indicate write completion
+        return command
+
+    def readBlockStatus(self, command, sequence = None, address = None, length = 0, send = 0.0):
+        payload = self.readFrame(command, self.block_timeout, "Block Write Error", sequence = sequence)
+        if payload == False or not self.checkStatus(payload, "Block Write Error"):
+            return False
+
+        # Device time includes the write cycle, overlapped with sending the next block when streaming
+        self.blockProgress(address, length, send, *self.last_frame_time)
         return True
 
-    def writeBlock(self, startAddress, data):
-        if self.serial.is_open == False:
+    def checkStatus(self, payload, title = "Error"):
+        # Status byte at start of response payload, followed by failed address if not OK
+        status = payload[0]
+        if status == protocol.STATUS_OK:
+            return True
+
+        message = protocol.STATUSES.get(status, "Unknown programmer error {}".format("0x{0:0{1}x}".format(status, 2)))
+        if len(payload) >= 3:
+            message += " at 0x{0:0{1}x}".format(payload[1] | (payload[2] << 8), 4)
+        self.view.LogError(message + ".", title)
+        return False
+
+    def writeSegments(self, segments, diffOnly = False):
+        # Writes only the address ranges defined by (address, data) segments, leaving the rest of the device untouched
+        result = self.getSegmentImage(segments, "Device Write Error")
+        if result == False:
             return False
+        data, ranges = result
 
-        if len(data) > self.block_size:
+        self.view.Log("Writing {} bytes in {} segments.".format(sum([end - start for start, end in ranges]), len(ranges)))
+
+        # Bytes outside the segments match the image so only changes within them are written
+        if diffOnly == True:
+            self.view.Log("Reading device contents of segments to find changed bytes.")
+            current = bytearray(data)
+            if self.readRanges(current, ranges) != sum([end - start for start, end in ranges]):
+                self.view.LogError("Unable to read current device contents.", "Device Write Error")
+                return False
+            return self.writeDevice(data, current = current)
+
+        return self.writeDevice(data, ranges = ranges)
+
+    def verifySegments(self, segments):
+        result = self.getSegmentImage(segments, "Device Verify Error")
+        if result == False:
             return False
+        data, ranges = result
 
-        if not self.sendCommand(u'w', startAddress, len(data)):
+        return self.verifyDevice(data, ranges)
+
+    def getSegmentImage(self, segments, title = "Error"):
+        # Returns device image holding the segments and their (start, end) offset ranges, or False if they don't fit the device
+        if not self.device or not self.device in self.devices:
+            self.view.LogError("Device not selected.", title)
             return False
 
-        self.view.Log("Writing {} bytes to programmer starting at {}.".format(len(data), "0x{0:0{1}x}".format(startAddress, 4)))
+        if len(segments) <= 0:
+            self.view.LogError("File doesn't define any data.", title)
+            return False
 
-        self.serial.timeout = self.block_timeout
-        try:
-            # Write Data
-            self.serial.write(bytearray(data))
-            self.serial.flush()
+        startAddress = self.devices[self.device]["startAddress"]
+        dataLength = self.devices[self.device]["dataLength"]
+        endAddress = dataLength + startAddress
 
-            # Wait for completion
-            self.serial.read_until('%')
-            self.serial.reset_input_buffer() # Clears newline
+        for address, data in segments:
+            if address < startAddress or address + len(data) > endAddress:
+                self.view.LogError("Data at 0x{0:0{2}x}-0x{1:0{2}x} is outside of the device's address range.".format(address, address + len(data) - 1, 4), title)
+                return False
 
-        except serial.SerialException as e:
-            self.serial.timeout = self.default_timeout
-            self.view.LogError(str(e), "Block Write Error")
+        return hexfile.flattenSegments(segments, startAddress, dataLength), [(address - startAddress, address - startAddress + len(data)) for address, data in segments]
+
+    def writeFile(self, pathname, diffOnly = False):
+        segments = self.importSegments(pathname)
+        if segments is False:
             return False
-        self.serial.timeout = self.default_timeout
+        if segments is not None:
+            return self.writeSegments(segments, diffOnly)
 
-        return True
+        data = self.importFile(pathname)
+        if data is False:
+            self.view.LogError("Unable to read hex data from file, {}.".format(pathname))
+            return False
+
+        return self.writeDevice(data, diffOnly)
+
+    def verifyDevice(self, data, ranges = None):
+        # Only the (start, end) offset ranges of data are compared if given
+        if not self.device or not self.device in self.devices:
+            self.view.LogError("Device not selected.", "Device Verify Error")
+            return False
+
+        dataLength = self.devices[self.device]["dataLength"]
+        if len(data) != dataLength:
+            self.view.LogError("ROM data not the appropriate length for device. Must be {} bytes.".format(dataLength), "Device Verify Error")
+            return False
 
-    def writeString(self, data):
         if self.serial.is_open == False:
+            self.view.LogError("Programmer not connected.", "Device Verify Error")
             return False
 
-        self.view.Log("Writing {} bytes to programmer.".format(len(data)))
+        startAddress = self.devices[self.device]["startAddress"]
 
-        try:
-            data = data.encode('utf-8')
-        except UnicodeEncodeError:
-            self.view.LogError("Failed to encode data as UTF-8.", "Serial Write Error")
+        if ranges is None:
+            ranges = [(0, dataLength)]
+
+        self.mismatches = []
+        result = self.verifyBlocks(self.splitBlocks([(startAddress + start, startAddress + end) for start, end in ranges]), data, startAddress)
+        if result == False:
+            self.view.LogError("Failed to verify device contents.", "Device Verify Error")
             return False
 
-        try:
-            # Write Data
-            self.serial.write(data)
-            self.serial.flush()
-        except serial.SerialException as e:
-            self.view.LogError(str(e), "Serial Write Error")
+        badRanges, badCount = result[1:]
+        if badCount > 0:
+            self.mismatches = diff.offsetRanges(badRanges, -startAddress)
+            self.view.LogError("Device contents do not match ROM data in {} bytes at {}.".format(badCount, self.formatRanges(badRanges)), "Device Verify Error")
             return False
 
         return True
 
-    def writeFile(self, pathname):
+    def verifyFile(self, pathname):
+        segments = self.importSegments(pathname)
+        if segments is False:
+            return False
+        if segments is not None:
+            return self.verifySegments(segments)
+
         data = self.importFile(pathname)
-        if data == False or not isinstance(data, list):
+        if data is False:
             self.view.LogError("Unable to read hex data from file, {}.".format(pathname))
             return False
 
-        return self.writeDevice(data)
+        return self.verifyDevice(data)
 
     def compareData(self, a, b):
-        if not isinstance(a, list) or not isinstance(b, list):
-            return False
-
         if len(a) != len(b):
             return False
 
-        diff = 0
-        for i, val in enumerate(a):
-            if val != b[i]:
-                diff += 1
+        return self.compareRanges(a, b)[1] == 0
+
+    def compareRanges(self, a, b):
+        # Returns list of (start, end) offsets where a and b differ and the number of differing bytes
+        return diff.compareImages(a, b)
+
+    def importSegments(self, pathname):
+        # Returns sorted list of (address, data) segments of an Intel HEX or S-record file, None for binary files or False
+        try:
+            with open(pathname, 'rb') as file:
+                format = hexfile.detectFormat(file)
+                if format is None:
+                    return None
+
+                self.view.Log("Reading {} file, {}.".format("Intel HEX" if format == "ihex" else "S-record", pathname))
+                segments = hexfile.loadSegments(file, format)
+        except IOError:
+            self.view.LogError("Cannot open data in file, {}.".format(pathname))
+            return False
+        except ValueError as e:
+            self.view.LogError("{} {}".format(pathname, str(e)), "Hex File Error")
+            return False
 
-        return diff == 0
+        self.view.Log("Read {} bytes in {} segments.".format(sum([len(data) for address, data in segments]), len(segments)))
+        return segments
 
     def importFile(self, pathname):
+        # Intel HEX and S-record files are returned as an image of the device, or up to their last address if no device is selected
+        segments = self.importSegments(pathname)
+        if segments is False:
+            return False
+        if segments is not None:
+            if self.device in self.devices:
+                startAddress = self.devices[self.device]["startAddress"]
+                dataLength = self.devices[self.device]["dataLength"]
+                inside = [(address, data) for address, data in segments if address >= startAddress and address + len(data) <= startAddress + dataLength]
+                if len(inside) < len(segments):
+                    self.view.LogWarning("Ignoring {} segments outside of the device's address range.".format(len(segments) - len(inside)))
+                segments = inside
+            else:
+                startAddress = 0
+                dataLength = max([address + len(data) for address, data in segments] + [0])
+            return hexfile.flattenSegments(segments, startAddress, dataLength)
+
         self.view.Log("Reading contents of binary file, {}.".format(pathname))
 
         contents = False
         try:
             with open(pathname, 'rb') as file:
                 if file.mode == 'rb':
-                    contents = bytearray(file.read())
+                    contents = bytearray(os.path.getsize(pathname))
+                    del contents[file.readinto(contents):]
                 file.close()
         except IOError:
-            wx.LogError("Cannot open data in file '%s'." % pathname)
+            self.view.LogError("Cannot open data in file, {}.".format(pathname))
 
-        if contents == False or not isinstance(contents, bytearray):
+        if contents is False:
             return False
 
-        return [x for x in contents]
+        return contents
 
     def exportFile(self, pathname, data):
         self.view.Log("Writing data with {} bytes to binary file, {}.".format(len(data), pathname))
@@ -565,7 +1389,10 @@ class AppController:
         try:
             with open(pathname, 'wb') as file:
                 if file.mode == 'wb':
-                    file.write(bytearray(data))
+                    file.write(data)
                 file.close()
         except IOError:
             self.view.LogError("Unable to save data to hex file, {}.".format(pathname))
+            return False
+
+        return True
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# NumPy is optional, large images are compared in chunks without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CHUNK_SIZE = 256 # Bytes compared at once before searching a chunk for the differing bytes
+
+def compareImages(a, b):
+    # Returns list of (start, end) offsets where a and b differ and the number of differing bytes
+    a = memoryview(a)
+    b = memoryview(b)
+    length = min(len(a), len(b))
+
+    if numpy is not None:
+        ranges, count = _compareNumpy(a[:length], b[:length])
+    else:
+        ranges, count = _comparePython(a[:length], b[:length])
+
+    # Bytes past the end of the shorter image always differ
+    if len(a) != len(b):
+        ranges = mergeRanges(ranges + [(length, max(len(a), len(b)))])
+        count += abs(len(a) - len(b))
+
+    return ranges, count
+
+def _compareNumpy(a, b):
+    changed = numpy.flatnonzero(numpy.frombuffer(a, dtype = numpy.uint8) != numpy.frombuffer(b, dtype = numpy.uint8))
+    if len(changed) == 0:
+        return [], 0
+
+    # Ranges break wherever consecutive differing offsets aren't adjacent
+    breaks = numpy.flatnonzero(numpy.diff(changed) > 1)
+    starts = numpy.concatenate(([changed[0]], changed[breaks + 1]))
+    ends = numpy.concatenate((changed[breaks], [changed[-1]])) + 1
+
+    return list(zip(starts.tolist(), ends.tolist())), len(changed)
+
+def _comparePython(a, b):
+    ranges = []
+    count = 0
+    for offset in range(0, len(a), CHUNK_SIZE):
+        end = min(offset + CHUNK_SIZE, len(a))
+        if a[offset:end] == b[offset:end]:
+            continue
+
+        for i in range(offset, end):
+            if a[i] == b[i]:
+                continue
+
+            count += 1
+            if len(ranges) > 0 and ranges[-1][1] == i:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+
+    return [(start, end) for start, end in ranges], count
+
+def mergeRanges(ranges, gap = 0):
+    # Joins sorted (start, end) ranges separated by no more than gap bytes
+    merged = []
+    for start, end in ranges:
+        if len(merged) > 0 and start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [(start, end) for start, end in merged]
+
+def offsetRanges(ranges, offset):
+    return [(start + offset, end + offset) for start, end in ranges]
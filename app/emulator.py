@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+import os
+import pty
+import select
+import struct
+import threading
+import time
+import tty
+
+from app import protocol
+
+# Mirrors the firmware's info string and buffers so the host negotiates exactly as it would with real hardware
+INFO_TITLE = "32u4 Programmer"
+INFO_HARDWARE = "0.1"
+INFO_SOFTWARE = "0.5"
+INFO_DATE = "03/11/2019 12:16:00"
+INFO_READ = 65536 # Supported bulk read rate, bytes per second
+INFO_CMDS = "VADTRrWwPCBFE"
+BUFFERSIZE = 512
+RX_SLOTS = 2
+BAUDRATE = 19200
+
+INFO_STR = "Title: {}$Hardware Version: {}$Software Version: {}$Date: {}$Read Rate: {}$Buffer Size: {}$Max Block: {}$Window: {}$Baud Rate: {}$Commands: {}".format(
+    INFO_TITLE, INFO_HARDWARE, INFO_SOFTWARE, INFO_DATE, INFO_READ, BUFFERSIZE, BUFFERSIZE, RX_SLOTS, BAUDRATE, INFO_CMDS)
+
+FRAME_TIMEOUT = 0.1 # Between bytes before a partial frame is dropped
+WRITE_TIMEOUT = 0.02 # DATA polling gives up after double the maximum write cycle time
+ERASE_TIME = 0.02
+TONE_TIME = 0.25
+
+# Memory arrays, write cycle is the datasheet maximum as DATA polling waits it out
+DEVICES = {
+    "AT28C16": {
+        "dataLength": 0x0800,
+        "pageSize": 0,
+        "chipErase": False,
+        "writeCycle": 0.001,
+    },
+    "AT28C64": {
+        "dataLength": 0x2000,
+        "pageSize": 64,
+        "chipErase": False,
+        "writeCycle": 0.001,
+    },
+    "AT28C256": {
+        "dataLength": 0x8000,
+        "pageSize": 64,
+        "chipErase": True,
+        "writeCycle": 0.01,
+    },
+}
+
+class ProgrammerEmulator():
+
+    # Answers the firmware's framed command set on a pseudo-terminal, delaying each response by the time the programmer would take
+    def __init__(self, device = "AT28C256", timing = 1.0):
+        self.device = DEVICES[device]
+        self.memory = bytearray([0xFF] * self.device["dataLength"])
+        self.mask = self.device["dataLength"] - 1 # Higher address lines aren't connected
+
+        # Firmware time per byte, scaled by timing (0 answers immediately)
+        self.timing = timing
+        self.read_time = 1.0 / INFO_READ
+        self.load_time = 0.00001 # Page byte load, address shift and WE pulse
+        self.byte_time = 0.00005 # Byte write setup before the write cycle starts
+        self.write_cycle = self.device["writeCycle"]
+        self.transfer_rate = 1000000 # USB CDC bytes per second in either direction
+
+        # Fault injection
+        self.stuck = {} # Address: value of cells which ignore writes
+        self.flaky = {} # Address: number of writes which store the value with bit 0 flipped, passing DATA polling
+        self.protect = False # Ignore all writes as if write protected, DATA polling times out
+        self.corrupt = set() # Response numbers (from 1) sent with a bad CRC
+        self.drop = set() # Response numbers never sent
+
+        self.fail_address = 0
+        self.responses = 0
+        self.commands = {} # Count of frames received by opcode
+
+        self.master = None
+        self.slave = None
+        self.portname = None
+        self.thread = None
+        self.running = False
+
+    def open(self):
+        # Returns the name of the pty to connect to
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.portname = os.ttyname(self.slave)
+
+        self.running = True
+        self.thread = threading.Thread(target = self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.portname
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for fd in [self.master, self.slave]:
+            if fd is not None:
+                os.close(fd)
+        self.master = None
+        self.slave = None
+
+    def loadImage(self, data):
+        length = min(len(data), len(self.memory))
+        self.memory[:length] = bytearray(data[:length])
+
+    # Host Side
+
+    def serve(self):
+        buffer = bytearray()
+        last = time.time()
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if len(ready) > 0:
+                try:
+                    chunk = os.read(self.master, 65536)
+                except OSError:
+                    chunk = b''
+                if len(chunk) > 0:
+                    buffer += bytearray(chunk)
+                    last = time.time()
+
+            while True:
+                frame = self.parseFrame(buffer)
+                if frame is None:
+                    break
+                consumed, opcode, sequence, status, payload = frame
+                del buffer[:consumed]
+                self.process(opcode, sequence, status, payload)
+
+            # Drop partial frames if the host stops sending
+            if len(buffer) > 0 and time.time() - last > FRAME_TIMEOUT:
+                if len(buffer) > 1 + protocol.FRAME_HEADER:
+                    self.sendStatus(buffer[1], buffer[2], protocol.STATUS_CRC)
+                del buffer[:]
+
+    def parseFrame(self, buffer):
+        # Returns (bytes consumed, opcode, sequence, status, payload) of the first complete frame or None
+        start = buffer.find(bytearray([protocol.FRAME_SYNC]))
+        if start < 0:
+            del buffer[:]
+            return None
+        del buffer[:start]
+
+        if len(buffer) < 1 + protocol.FRAME_HEADER:
+            return None
+        opcode = buffer[1]
+        sequence = buffer[2]
+        length = buffer[3] | (buffer[4] << 8)
+        end = 1 + protocol.FRAME_HEADER + length + protocol.FRAME_CRC
+        if len(buffer) < end:
+            return None
+
+        # Frames larger than a receive slot are discarded rather than truncated
+        if length > protocol.FRAME_PARAMS.size + BUFFERSIZE:
+            return end, opcode, sequence, protocol.STATUS_OVERFLOW, bytearray()
+
+        body = buffer[1:end - protocol.FRAME_CRC]
+        crc = buffer[end - 2] | (buffer[end - 1] << 8)
+        if protocol.crc16(body) != crc:
+            return end, opcode, sequence, protocol.STATUS_CRC, bytearray()
+
+        return end, opcode, sequence, protocol.STATUS_OK, bytearray(body[protocol.FRAME_HEADER:])
+
+    def sendFrame(self, opcode, sequence, payload, elapsed = 0.0):
+        frame = protocol.packFrame(opcode, payload, sequence)
+        elapsed += float(len(frame)) / self.transfer_rate
+        if self.timing > 0 and elapsed > 0:
+            time.sleep(elapsed * self.timing)
+
+        self.responses += 1
+        if self.responses in self.drop:
+            return
+        if self.responses in self.corrupt:
+            frame[-1] ^= 0xFF
+        os.write(self.master, bytes(frame))
+
+    def sendStatus(self, opcode, sequence, status, elapsed = 0.0):
+        payload = bytearray([status])
+        if status != protocol.STATUS_OK:
+            payload += bytearray(struct.pack('<H', self.fail_address))
+        self.sendFrame(opcode, sequence, payload, elapsed)
+
+    # Firmware Side
+
+    def process(self, opcode, sequence, status, payload):
+        code = chr(opcode)
+        self.commands[code] = self.commands.get(code, 0) + 1
+        elapsed = float(len(payload) + 7) / self.transfer_rate
+
+        if status != protocol.STATUS_OK:
+            return self.sendStatus(opcode, sequence, status, elapsed)
+
+        startAddress, dataLength, lineLength = 0, 0, 0
+        data = bytearray()
+        if len(payload) >= protocol.FRAME_PARAMS.size:
+            startAddress, dataLength, lineLength = protocol.FRAME_PARAMS.unpack_from(bytes(payload))
+            data = payload[protocol.FRAME_PARAMS.size:]
+        self.fail_address = startAddress
+
+        if code == 'R' and lineLength == 0:
+            lineLength = 32
+        if code in "RrCBF" and dataLength == 0:
+            code = None
+
+        if code == 'V':
+            return self.sendFrame(opcode, sequence, bytearray([protocol.STATUS_OK]) + bytearray(INFO_STR.encode('ascii')), elapsed)
+        elif code == 'T':
+            return self.sendStatus(opcode, sequence, protocol.STATUS_OK, elapsed + TONE_TIME)
+        elif code in ['A', 'D']:
+            return self.sendStatus(opcode, sequence, protocol.STATUS_OK, elapsed + self.load_time)
+        elif code == 'R':
+            # Response length is only 16 bits
+            if protocol.hexReadLength(dataLength, lineLength) > protocol.FRAME_MAX_LENGTH:
+                return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+
+            output = bytearray()
+            for i in range(dataLength):
+                address = (startAddress + i) & 0xFFFF
+                if i % lineLength == 0:
+                    output += bytearray("\r\n0x{:04X} : ".format(address).encode('ascii'))
+                output += bytearray("{:02X} ".format(self.readByte(address)).encode('ascii'))
+            output += bytearray(b"\r\n")
+            return self.sendFrame(opcode, sequence, bytearray([protocol.STATUS_OK]) + output, elapsed + dataLength * self.read_time)
+        elif code == 'r':
+            output = self.readRange(startAddress, dataLength)
+            return self.sendFrame(opcode, sequence, bytearray([protocol.STATUS_OK]) + output, elapsed + dataLength * self.read_time)
+        elif code == 'C':
+            checksum = protocol.crc32(self.readRange(startAddress, dataLength))
+            return self.sendFrame(opcode, sequence, bytearray([protocol.STATUS_OK]) + bytearray(struct.pack('<I', checksum)), elapsed + dataLength * self.read_time)
+        elif code == 'B':
+            for i in range(dataLength):
+                address = (startAddress + i) & 0xFFFF
+                if self.readByte(address) != 0xFF:
+                    self.fail_address = address
+                    return self.sendStatus(opcode, sequence, protocol.STATUS_NOT_BLANK, elapsed + (i + 1) * self.read_time)
+            return self.sendStatus(opcode, sequence, protocol.STATUS_OK, elapsed + dataLength * self.read_time)
+        elif code == 'W':
+            if len(data) != dataLength * 2:
+                return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+            data = bytearray([(self.hexDigit(data[i * 2]) << 4) + self.hexDigit(data[i * 2 + 1]) for i in range(dataLength)])
+            status, cost = self.writeBlock(startAddress, data)
+            return self.sendStatus(opcode, sequence, status, elapsed + cost)
+        elif code == 'w':
+            if len(data) != dataLength:
+                return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+            status, cost = self.writeBlock(startAddress, data)
+            return self.sendStatus(opcode, sequence, status, elapsed + cost)
+        elif code == 'P':
+            if len(data) != dataLength:
+                return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+            status, cost = self.writePages(startAddress, data, lineLength)
+            return self.sendStatus(opcode, sequence, status, elapsed + cost)
+        elif code == 'F':
+            if len(data) != 1:
+                return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+            status, cost = self.writePages(startAddress, bytearray([data[0]] * dataLength), lineLength)
+            return self.sendStatus(opcode, sequence, status, elapsed + cost)
+        elif code == 'E':
+            # Devices without the software chip erase sequence just see six page loads
+            if self.device["chipErase"] and not self.protect:
+                for address in range(len(self.memory)):
+                    if not address in self.stuck:
+                        self.memory[address] = 0xFF
+            return self.sendStatus(opcode, sequence, protocol.STATUS_OK, elapsed + 6 * self.load_time + ERASE_TIME)
+
+        return self.sendStatus(opcode, sequence, protocol.STATUS_INVALID, elapsed)
+
+    def hexDigit(self, c):
+        c = chr(c)
+        if c >= '0' and c <= '9':
+            return ord(c) - ord('0')
+        if c >= 'a' and c <= 'f':
+            return ord(c) - ord('a') + 10
+        if c >= 'A' and c <= 'F':
+            return ord(c) - ord('A') + 10
+        return 0 # Invalid character
+
+    def readByte(self, address):
+        address &= self.mask
+        if address in self.stuck:
+            return self.stuck[address]
+        return self.memory[address]
+
+    def readRange(self, startAddress, dataLength):
+        start = startAddress & self.mask
+        if len(self.stuck) <= 0 and start + dataLength <= len(self.memory):
+            return self.memory[start:start + dataLength]
+        return bytearray([self.readByte(startAddress + i) for i in range(dataLength)])
+
+    def storeByte(self, address, value):
+        address &= self.mask
+        if self.protect or address in self.stuck:
+            return
+
+        if self.flaky.get(address, 0) > 0:
+            self.flaky[address] -= 1
+            value ^= 0x01
+        self.memory[address] = value
+
+    def pollWrite(self, address, value):
+        # DATA polling on bit 7, returns (status, time until the write cycle completed or polling gave up)
+        if (self.readByte(address) ^ value) & 0x80:
+            self.fail_address = address
+            return protocol.STATUS_TIMEOUT, WRITE_TIMEOUT
+        return protocol.STATUS_OK, self.write_cycle
+
+    def writeBlock(self, startAddress, data):
+        # Byte writes, returns (status, elapsed time)
+        elapsed = 0.0
+        for i in range(len(data)):
+            address = (startAddress + i) & 0xFFFF
+            self.storeByte(address, data[i])
+            status, cost = self.pollWrite(address, data[i])
+            elapsed += self.byte_time + cost
+            if status != protocol.STATUS_OK:
+                return status, elapsed
+        return protocol.STATUS_OK, elapsed
+
+    def writePages(self, startAddress, data, pageSize):
+        if pageSize == 0:
+            return self.writeBlock(startAddress, data)
+
+        elapsed = 0.0
+        i = 0
+        while i < len(data):
+            # Split writes on page boundaries as the firmware does
+            address = (startAddress + i) & 0xFFFF
+            count = min(pageSize - (address % pageSize), len(data) - i)
+
+            status, cost = self.writePage(address, data[i:i + count])
+            elapsed += cost
+            if status != protocol.STATUS_OK:
+                return status, elapsed
+            i += count
+        return protocol.STATUS_OK, elapsed
+
+    def writePage(self, address, data):
+        # Parts without page mode start a write cycle on the first byte load and ignore the rest
+        # Otherwise the page is latched from the first address, so bytes past the device page wrap within it
+        devicePage = self.device["pageSize"]
+        elapsed = len(data) * self.load_time
+        if devicePage == 0:
+            self.storeByte(address, data[0])
+        else:
+            base = address & ~(devicePage - 1)
+            for i in range(len(data)):
+                self.storeByte(base | ((address + i) & (devicePage - 1)), data[i])
+
+        last = (address + len(data) - 1) & 0xFFFF
+        status, cost = self.pollWrite(last, data[-1])
+        return status, elapsed + cost
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import threading
+import time
+
+from app.controller import AppController
+
+class GangView():
+
+    # Forwards the log of one programmer session to the shared view, tagged with its port
+    def __init__(self, controller, gang, portname):
+        self.controller = controller
+        self.gang = gang
+        self.portname = portname
+
+    def run(self):
+        return
+
+    def update(self):
+        return
+
+    def destroy(self):
+        return
+
+    def Log(self, message):
+        with self.gang.lock:
+            return self.gang.view.Log("[{}] {}".format(self.portname, message))
+
+    def LogError(self, message, title = "Error"):
+        with self.gang.lock:
+            return self.gang.view.LogError("[{}] {}".format(self.portname, message), title)
+
+    def LogWarning(self, message, title = "Warning"):
+        with self.gang.lock:
+            return self.gang.view.LogWarning("[{}] {}".format(self.portname, message), title)
+
+    def LogSuccess(self, message):
+        with self.gang.lock:
+            return self.gang.view.LogSuccess("[{}] {}".format(self.portname, message))
+
+class GangController():
+
+    # Drives one AppController session per programmer port concurrently
+    def __init__(self, controller):
+        self.controller = controller
+        self.view = controller.view
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def openSessions(self, portnames):
+        self.closeSessions()
+
+        for portname in portnames:
+            session = AppController(lambda controller, portname = portname: GangView(controller, self, portname))
+            session.cache_programmer = False
+            session.setDevice(self.controller.device)
+            self.sessions[portname] = session
+
+        # Connect in parallel as each programmer may need to time out
+        results = self.runSessions([(portname, session.checkProgrammer, (portname,)) for portname, session in self.sessions.items()])
+
+        for portname, result in results.items():
+            if result["success"] != True:
+                self.sessions.pop(portname).closeProgrammer()
+
+        return len(self.sessions) > 0
+
+    def closeSessions(self):
+        for portname in self.sessions:
+            self.sessions[portname].closeProgrammer()
+        self.sessions = {}
+
+    def runSessions(self, jobs):
+        # Runs (portname, function, args) jobs in a thread each, returns results by port
+        results = {}
+
+        def run(portname, function, args):
+            start = time.time()
+            try:
+                success = function(*args) != False
+            except Exception as e:
+                with self.lock:
+                    self.view.LogError("[{}] {}".format(portname, str(e)), "Gang Error")
+                success = False
+            results[portname] = {
+                "success": success,
+                "time": time.time() - start,
+            }
+
+        threads = [threading.Thread(target = run, args = job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def writeDevices(self, images, diff = False):
+        # Writes an image to each port, images maps portname to data or a list of (address, data) segments
+        jobs = []
+        for portname, data in images.items():
+            if not portname in self.sessions:
+                self.view.LogError("No programmer session open on {}.".format(portname), "Gang Write Error")
+                return False
+            session = self.sessions[portname]
+            jobs.append((portname, session.writeSegments if isinstance(data, list) else session.writeDevice, (data, diff)))
+
+        self.view.Log("Writing {} devices in parallel.".format(len(jobs)))
+
+        start = time.time()
+        results = self.runSessions(jobs)
+        self.logResults(results, time.time() - start)
+
+        return results
+
+    def writeFiles(self, pathnames, diff = False):
+        # Writes a file to each port, pathnames maps portname to file, each file is only read once
+        files = {}
+        images = {}
+        for portname, pathname in pathnames.items():
+            if not pathname in files:
+                files[pathname] = self.controller.importSegments(pathname)
+                if files[pathname] is None:
+                    files[pathname] = self.controller.importFile(pathname)
+                if files[pathname] is False:
+                    self.view.LogError("Unable to read hex data from file, {}.".format(pathname), "Gang Write Error")
+                    return False
+            images[portname] = files[pathname]
+
+        return self.writeDevices(images, diff)
+
+    def logResults(self, results, elapsed):
+        failed = sorted([portname for portname in results if results[portname]["success"] != True])
+
+        for portname in sorted(results):
+            if results[portname]["success"] == True:
+                self.view.LogSuccess("{}: OK in {:.2f}s.".format(portname, results[portname]["time"]))
+            else:
+                self.view.LogWarning("{}: FAILED in {:.2f}s.".format(portname, results[portname]["time"]))
+
+        if len(failed) > 0:
+            self.view.LogError("Failed to program {} of {} devices on {}.".format(len(failed), len(results), ", ".join(failed)), "Gang Write Error")
+        else:
+            self.view.LogSuccess("Programmed {} devices in {:.2f}s.".format(len(results), elapsed))
+
+        return len(failed) == 0
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import binascii
+import bisect
+import re
+
+# Intel HEX record types
+IHEX_DATA = 0x00
+IHEX_EOF = 0x01
+IHEX_SEGMENT = 0x02 # Extended segment address, base is value * 16
+IHEX_START_SEGMENT = 0x03
+IHEX_LINEAR = 0x04 # Extended linear address, base is value << 16
+IHEX_START_LINEAR = 0x05
+
+# S-record address bytes by type, data records are S1-S3 and S7-S9 terminate S3-S1
+SREC_ADDRESS = {
+    '0': 2,
+    '1': 2,
+    '2': 3,
+    '3': 4,
+    '5': 2,
+    '6': 3,
+    '7': 4,
+    '8': 3,
+    '9': 2,
+}
+
+IHEX_LINE = re.compile(br'^:[0-9A-Fa-f]+\s*$')
+SREC_LINE = re.compile(br'^S[0-9][0-9A-Fa-f]+\s*$')
+SNIFF_LENGTH = 1024 # Bytes read to recognize the format from the first line
+
+def detectFormat(file):
+    # Returns "ihex" or "srec" from the first line of a file opened in binary mode, or None for binary images
+    position = file.tell()
+    line = file.readline(SNIFF_LENGTH)
+    file.seek(position)
+
+    if IHEX_LINE.match(line):
+        return "ihex"
+    if SREC_LINE.match(line):
+        return "srec"
+    return None
+
+def parseRecord(text, number):
+    # Returns the bytes of a record's hex digits
+    if len(text) % 2 != 0:
+        raise ValueError("Line {}: record has an odd number of hex digits.".format(number))
+    try:
+        return bytearray(binascii.unhexlify(text))
+    except (TypeError, ValueError):
+        raise ValueError("Line {}: record contains characters which aren't hex digits.".format(number))
+
+def readIntelHex(file):
+    # Yields (line number, address, data) of each data record, one line at a time
+    base = 0
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line[:1] != b':':
+            raise ValueError("Line {}: Intel HEX record doesn't start with ':'.".format(number))
+
+        record = parseRecord(line[1:], number)
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise ValueError("Line {}: record length doesn't match its byte count.".format(number))
+        if sum(record) & 0xFF != 0:
+            raise ValueError("Line {}: record checksum is 0x{:02X}, expected 0x{:02X}.".format(number, record[-1], (record[-1] - sum(record)) & 0xFF))
+
+        kind = record[3]
+        data = record[4:-1]
+        if kind == IHEX_DATA:
+            if len(data) > 0:
+                yield number, base + ((record[1] << 8) | record[2]), data
+        elif kind == IHEX_EOF:
+            return
+        elif kind in [IHEX_SEGMENT, IHEX_LINEAR]:
+            if len(data) != 2:
+                raise ValueError("Line {}: extended address record must hold 2 bytes.".format(number))
+            base = ((data[0] << 8) | data[1]) << (4 if kind == IHEX_SEGMENT else 16)
+        elif kind in [IHEX_START_SEGMENT, IHEX_START_LINEAR]:
+            continue # Execution start address, meaningless for a ROM
+        else:
+            raise ValueError("Line {}: unsupported Intel HEX record type 0x{:02X}.".format(number, kind))
+
+    raise ValueError("File ends without an Intel HEX end of file record.")
+
+def readSRecords(file):
+    # Yields (line number, address, data) of each data record, one line at a time
+    count = 0
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line[:1] != b'S' or len(line) < 2:
+            raise ValueError("Line {}: S-record doesn't start with 'S'.".format(number))
+
+        kind = line[1:2].decode('ascii', 'replace')
+        if not kind in SREC_ADDRESS:
+            raise ValueError("Line {}: unsupported S-record type S{}.".format(number, kind))
+
+        record = parseRecord(line[2:], number)
+        size = SREC_ADDRESS[kind]
+        if len(record) < size + 2 or len(record) != record[0] + 1:
+            raise ValueError("Line {}: record length doesn't match its byte count.".format(number))
+        if sum(record) & 0xFF != 0xFF:
+            raise ValueError("Line {}: record checksum is 0x{:02X}, expected 0x{:02X}.".format(number, record[-1], (0xFF - sum(record[:-1])) & 0xFF))
+
+        address = 0
+        for x in record[1:size + 1]:
+            address = (address << 8) | x
+        data = record[size + 1:-1]
+
+        if kind in '123':
+            count += 1
+            if len(data) > 0:
+                yield number, address, data
+        elif kind in '56':
+            # Record count covers the data records so far
+            if address != count & (0xFFFF if kind == '5' else 0xFFFFFF):
+                raise ValueError("Line {}: record count is {}, but {} data records were read.".format(number, address, count))
+        elif kind in '789':
+            return
+
+    raise ValueError("File ends without an S-record termination record.")
+
+class Segments():
+
+    # Sorted (address, data) segments which don't overlap, records continuing a segment are appended to it
+    def __init__(self):
+        self.starts = []
+        self.segments = []
+
+    def add(self, address, data, number = None):
+        end = address + len(data)
+
+        # Records nearly always follow on from the last one
+        if len(self.segments) > 0 and address >= self.starts[-1]:
+            last = self.segments[-1]
+            lastEnd = last[0] + len(last[1])
+            if address == lastEnd:
+                last[1] += data
+                return True
+            if address > lastEnd:
+                self.starts.append(address)
+                self.segments.append([address, bytearray(data)])
+                return True
+
+        index = bisect.bisect_right(self.starts, address)
+        for neighbour in self.segments[max(0, index - 1):index + 1]:
+            if address < neighbour[0] + len(neighbour[1]) and neighbour[0] < end:
+                raise ValueError("{}Data at 0x{:04X}-0x{:04X} overlaps data already defined at 0x{:04X}-0x{:04X}.".format(
+                    "Line {}: ".format(number) if number is not None else "", address, end - 1, neighbour[0], neighbour[0] + len(neighbour[1]) - 1))
+
+        self.starts.insert(index, address)
+        self.segments.insert(index, [address, bytearray(data)])
+
+        # Join the segments on either side if they touch
+        if index + 1 < len(self.segments) and self.starts[index + 1] == end:
+            self.segments[index][1] += self.segments[index + 1][1]
+            del self.starts[index + 1]
+            del self.segments[index + 1]
+        if index > 0 and self.starts[index - 1] + len(self.segments[index - 1][1]) == address:
+            self.segments[index - 1][1] += self.segments[index][1]
+            del self.starts[index]
+            del self.segments[index]
+
+        return True
+
+    def getSegments(self):
+        return [(address, data) for address, data in self.segments]
+
+def loadSegments(file, format):
+    # Returns sorted list of (address, data) segments from an Intel HEX or S-record file opened in binary mode
+    segments = Segments()
+    records = readIntelHex(file) if format == "ihex" else readSRecords(file)
+    for number, address, data in records:
+        segments.add(address, data, number)
+    return segments.getSegments()
+
+def flattenSegments(segments, startAddress, length, fill = 0xFF):
+    # Image of length bytes from startAddress holding the segments, undefined bytes are filled
+    image = bytearray([fill]) * length
+    for address, data in segments:
+        offset = address - startAddress
+        image[offset:offset + len(data)] = data
+    return image
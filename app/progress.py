@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import json
+import time
+
+# Monotonic clock for durations where available
+clock = getattr(time, 'perf_counter', time.time)
+
+# Progress events are dicts with an "event" of start, block, retry or end, and the "operation" they belong to:
+# - start: total bytes expected
+# - block: address, bytes, send, device and receive times (s) of one block, done and total bytes of the operation
+# - retry: cycle and number of blocks being retried
+# - end: success, bytes done, elapsed time (s) and rate (bytes/s)
+
+def formatRate(rate):
+    if rate >= 1024:
+        return "{:.1f} KB/s".format(rate / 1024.0)
+    return "{:.0f} B/s".format(rate)
+
+class JsonLinesSink():
+
+    # Writes every event as a line of JSON
+    def __init__(self, pathname):
+        self.file = open(pathname, 'a')
+
+    def handleEvent(self, event):
+        self.file.write(json.dumps(event, sort_keys = True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class SummarySink():
+
+    # Collects totals per operation and logs them as a table
+    def __init__(self, view):
+        self.view = view
+        self.operations = {}
+        self.order = []
+
+    def handleEvent(self, event):
+        operation = event["operation"]
+        if not operation in self.operations:
+            self.operations[operation] = {
+                "count": 0,
+                "bytes": 0,
+                "elapsed": 0.0,
+                "blocks": 0,
+                "retries": 0,
+                "send": 0.0,
+                "device": 0.0,
+                "receive": 0.0,
+            }
+            self.order.append(operation)
+        stats = self.operations[operation]
+
+        if event["event"] == "block":
+            stats["blocks"] += 1
+            stats["send"] += event["send"]
+            stats["device"] += event["device"]
+            stats["receive"] += event["receive"]
+        elif event["event"] == "retry":
+            stats["retries"] += event["blocks"]
+        elif event["event"] == "end":
+            stats["count"] += 1
+            stats["bytes"] += event["bytes"]
+            stats["elapsed"] += event["elapsed"]
+
+    def logSummary(self):
+        self.view.LogSuccess("{:<10} {:>8} {:>8} {:>12} {:>7} {:>8} {:>9} {:>9} {:>9}".format("Operation", "Bytes", "Time", "Rate", "Blocks", "Retries", "Send", "Device", "Receive"))
+        for operation in self.order:
+            stats = self.operations[operation]
+            blocks = max(1, stats["blocks"])
+            self.view.LogSuccess("{:<10} {:>8} {:>7.2f}s {:>12} {:>7} {:>8} {:>7.2f}ms {:>7.2f}ms {:>7.2f}ms".format(
+                operation,
+                stats["bytes"],
+                stats["elapsed"],
+                formatRate(stats["bytes"] / stats["elapsed"]) if stats["elapsed"] > 0 else "-",
+                stats["blocks"],
+                stats["retries"],
+                stats["send"] * 1000 / blocks,
+                stats["device"] * 1000 / blocks,
+                stats["receive"] * 1000 / blocks,
+            ))
+        return True
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import struct
+import zlib
+
+# Frame: SYNC, opcode, sequence, length (LE), payload, CRC16 (LE) of opcode through payload
+# Responses echo the sequence number of their command so late replies aren't mistaken for the next one
+FRAME_SYNC = 0xA5
+FRAME_HEADER = 4 # Opcode, sequence and length following sync byte
+FRAME_CRC = 2
+
+# Command payload parameters: start address (LE), data length (LE), line length
+FRAME_PARAMS = struct.Struct('<HHB')
+
+STATUS_OK = 0x00
+STATUS_TIMEOUT = 0x01
+STATUS_OVERFLOW = 0x02
+STATUS_CRC = 0x03
+STATUS_INVALID = 0x04
+STATUS_NOT_BLANK = 0x05
+
+STATUSES = {
+    STATUS_OK: "OK",
+    STATUS_TIMEOUT: "Write cycle timed out, device may be missing or write protected",
+    STATUS_OVERFLOW: "Block is larger than the programmer's buffer",
+    STATUS_CRC: "Command frame was corrupted in transfer",
+    STATUS_INVALID: "Command or data length is invalid",
+    STATUS_NOT_BLANK: "Device is not blank",
+}
+
+# CRC-16/MCRF4XX (reflected CCITT 0x8408, init 0xFFFF), matches avr-libc _crc_ccitt_update
+def _crcTable():
+    table = []
+    for i in range(256):
+        crc = i
+        for bit in range(8):
+            if crc & 0x01:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crcTable()
+
+def crc16(data, crc = 0xFFFF):
+    for x in bytearray(data):
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ x) & 0xFF]
+    return crc
+
+# CRC-32 as computed by the programmer's checksum command
+def crc32(data):
+    return zlib.crc32(bytes(bytearray(data))) & 0xFFFFFFFF
+
+FRAME_MAX_LENGTH = 0xFFFF # Payload length field is 16 bits
+
+def hexReadLength(dataLength, lineLength = 32):
+    # Payload length of the response to a hex read, as computed by the programmer
+    lines = (dataLength + lineLength - 1) // lineLength
+    return 1 + lines * 11 + dataLength * 3 + 2
+
+def maxHexRead(lineLength = 32):
+    # Largest hex read whose response fits in a frame
+    low, high = 0, 0xFFFF
+    while low < high:
+        middle = (low + high + 1) // 2
+        if hexReadLength(middle, lineLength) <= FRAME_MAX_LENGTH:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def packFrame(opcode, payload = b'', sequence = 0):
+    if len(payload) > FRAME_MAX_LENGTH:
+        raise ValueError("Frame payload of {} bytes is longer than {}.".format(len(payload), FRAME_MAX_LENGTH))
+
+    body = bytearray([ord(opcode) if not isinstance(opcode, int) else opcode, sequence & 0xFF])
+    body += bytearray(struct.pack('<H', len(payload)))
+    body += bytearray(payload)
+    return bytearray([FRAME_SYNC]) + body + bytearray(struct.pack('<H', crc16(body)))
+
+def packCommand(opcode, startAddress = None, dataLength = None, lineLength = None, data = None, sequence = 0):
+    payload = bytearray(FRAME_PARAMS.pack(startAddress or 0, dataLength or 0, lineLength or 0))
+    if data is not None:
+        payload += bytearray(data)
+    return packFrame(opcode, payload, sequence)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+import struct
+import time
+
+import serial
+
+from app import progress
+
+# Trace file: magic, then records of monotonic time (s) since recording started, kind and length, followed by the data
+TRACE_MAGIC = b'32u4trace\x01'
+TRACE_RECORD = struct.Struct('<dcI')
+
+TRACE_OPEN = b'O' # Port opened, data is the port name
+TRACE_CLOSE = b'C'
+TRACE_TX = b'T'
+TRACE_RX = b'R' # Result of one read, empty if it timed out
+
+class RecordingSerial():
+
+    # Wraps a serial port and logs every chunk written and read to a trace file
+    def __init__(self, port, pathname):
+        self.__dict__['port_'] = port
+        self.__dict__['file'] = open(pathname, 'wb')
+        self.__dict__['start'] = progress.clock()
+        self.file.write(TRACE_MAGIC)
+
+    def __getattr__(self, name):
+        return getattr(self.port_, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.port_, name, value)
+
+    def record(self, kind, data = b''):
+        self.file.write(TRACE_RECORD.pack(progress.clock() - self.start, kind, len(data)))
+        self.file.write(bytes(data))
+
+    def open(self):
+        self.port_.open()
+        self.record(TRACE_OPEN, self.port_.port.encode('utf-8'))
+
+    def close(self):
+        self.port_.close()
+        self.record(TRACE_CLOSE)
+        self.file.flush()
+
+    def write(self, data):
+        length = self.port_.write(data)
+        self.record(TRACE_TX, data)
+        return length
+
+    def read(self, size = 1):
+        data = self.port_.read(size)
+        self.record(TRACE_RX, data)
+        return data
+
+    def readinto(self, buffer):
+        length = self.port_.readinto(buffer)
+        self.record(TRACE_RX, buffer[:length])
+        return length
+
+    def stop(self):
+        # Returns the wrapped port
+        self.file.close()
+        return self.port_
+
+def loadTrace(pathname):
+    # Returns list of (time, kind, data) records
+    with open(pathname, 'rb') as file:
+        contents = file.read()
+
+    if not contents.startswith(TRACE_MAGIC):
+        raise ValueError("{} is not a serial trace file".format(pathname))
+
+    records = []
+    offset = len(TRACE_MAGIC)
+    while offset + TRACE_RECORD.size <= len(contents):
+        timestamp, kind, length = TRACE_RECORD.unpack_from(contents, offset)
+        offset += TRACE_RECORD.size
+        records.append((timestamp, kind, contents[offset:offset + length]))
+        offset += length
+
+    return records
+
+class ReplaySerial():
+
+    # Stands in for a serial port, answering reads from a recorded trace
+    # Timed replays hold each response back for as long after the preceding write as it took the programmer when recorded
+    def __init__(self, pathname, timed = True):
+        self.records = [record for record in loadTrace(pathname) if record[1] in (TRACE_OPEN, TRACE_TX, TRACE_RX)]
+        self.index = 0
+        self.timed = timed
+
+        self.pending = b'' # Remainder of a recorded read not yet consumed
+        self.sent = None # Recorded and replay time of the last write
+
+        self.port = None
+        self.portname = None
+        for timestamp, kind, data in self.records:
+            if kind == TRACE_OPEN:
+                self.portname = data.decode('utf-8')
+                break
+
+        self.is_open = False
+        self.portstr = self.portname
+        self.baudrate = 19200
+        self.bytesize = 8
+        self.parity = 'N'
+        self.stopbits = 1
+        self.rtscts = False
+        self.xonxoff = False
+        self.timeout = None
+        self.write_timeout = None
+
+    def skipOpen(self):
+        while self.index < len(self.records) and self.records[self.index][1] == TRACE_OPEN:
+            self.index += 1
+
+    def open(self):
+        self.skipOpen()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        return
+
+    def reset_input_buffer(self):
+        self.pending = b''
+
+    def write(self, data):
+        self.skipOpen()
+        if self.index >= len(self.records) or self.records[self.index][1] != TRACE_TX:
+            raise serial.SerialException("Replay diverged from trace, unexpected write.")
+
+        timestamp, kind, expected = self.records[self.index]
+        if bytes(bytearray(data)) != expected:
+            raise serial.SerialException("Replay diverged from trace, written data differs at record {}.".format(self.index))
+
+        self.index += 1
+        self.pending = b''
+        self.sent = (timestamp, progress.clock())
+        return len(data)
+
+    def read(self, size = 1):
+        # Joins recorded reads up to size, an empty recorded read replays a timeout
+        data = b''
+        while len(data) < size:
+            if len(self.pending) <= 0:
+                self.skipOpen()
+                if self.index >= len(self.records) or self.records[self.index][1] != TRACE_RX:
+                    if len(data) > 0:
+                        break
+                    raise serial.SerialException("Replay diverged from trace, unexpected read.")
+
+                timestamp, kind, chunk = self.records[self.index]
+                if len(chunk) <= 0 and len(data) > 0:
+                    break
+                self.index += 1
+
+                if self.timed and self.sent is not None:
+                    delay = (timestamp - self.sent[0]) - (progress.clock() - self.sent[1])
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if len(chunk) <= 0:
+                    break
+                self.pending = chunk
+
+            count = size - len(data)
+            data += self.pending[:count]
+            self.pending = self.pending[count:]
+
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
@@ -6,7 +6,13 @@ import wx.grid
 import wx.adv
 import os
 import re
-import math
+import bisect
+import collections
+import logging
+import logging.handlers
+
+from app import progress
+from app import protocol
 
 ABSPATH = os.path.dirname(os.path.abspath(__file__))
 if ABSPATH.endswith('app'):
@@ -22,18 +28,40 @@ class AppView():
 
         self.defaultDir = '.'
 
+        # Messages are queued from any thread and flushed to the log widget in batches
+        self.logQueue = collections.deque()
+        self.logInterval = 100 # ms between flushes
+        self.logLimit = 1000 # Lines kept in the log widget
+        self.logLines = collections.deque() # Length of each line in the log widget
+        self.logLength = 0
+
+        # Full history is kept on disk
+        self.logPath = os.path.join(os.path.expanduser('~'), '.32u4-programmer.log')
+        self.logger = logging.getLogger('32u4-programmer')
+        self.logger.setLevel(logging.INFO)
+        try:
+            handler = logging.handlers.RotatingFileHandler(self.logPath, maxBytes = 1024 * 1024, backupCount = 3)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            self.logger.addHandler(handler)
+        except (IOError, OSError):
+            self.logger.addHandler(logging.NullHandler())
+
     def run(self):
         self.frame = AppFrame(self, self.controller, None, -1, title = '32u4 Programmer Utility', size = (480, 420), style = self.frameStyle)
         self.frame.Show()
         wx.CallAfter(self.OnLoad)
 
+        self.logTimer = wx.Timer(self.frame)
+        self.frame.Bind(wx.EVT_TIMER, self.flushLog, self.logTimer)
+        self.logTimer.Start(self.logInterval)
+
         self.app.MainLoop()
 
     def OnLoad(self):
-        self.refresh()
+        self.refresh(True)
 
-    def refresh(self):
-        thread = threading.Thread(target=self.frame.refresh)
+    def refresh(self, reconnect = False):
+        thread = threading.Thread(target=self.frame.refresh, args=(reconnect,))
         thread.start()
 
     def update(self):
@@ -43,28 +71,56 @@ class AppView():
         return
 
     def destroy(self):
+        self.logTimer.Stop()
         self.frame.Destroy()
 
     def ShowErrorDialog(self, message, title="Error"):
         with wx.MessageDialog(self.frame, message, title, wx.OK | wx.ICON_ERROR) as dialog:
             dialog.ShowModal()
 
-    def _log(self, message, color = (108, 117, 125)):
-        start = len(self.frame.log.GetValue())
-        self.frame.log.AppendText(message)
-        self.frame.log.SetStyle(start, len(self.frame.log.GetValue()), wx.TextAttr(color))
+    def flushLog(self, event = None):
+        if len(self.logQueue) <= 0:
+            return False
+
+        log = self.frame.log
+        log.Freeze()
+
+        # Append consecutive messages of the same color at once, styled by tracked offsets instead of reading back the text
+        while len(self.logQueue) > 0:
+            message, color = self.logQueue.popleft()
+            lines = [message]
+            while len(self.logQueue) > 0 and self.logQueue[0][1] == color:
+                lines.append(self.logQueue.popleft()[0])
+
+            text = "".join(['\n' + line for line in lines])
+            log.AppendText(text)
+            log.SetStyle(self.logLength, self.logLength + len(text), wx.TextAttr(color))
+            self.logLength += len(text)
+            self.logLines.extend([len(line) + 1 for line in lines])
+
+        # Roll off the oldest lines past the limit
+        if len(self.logLines) > self.logLimit:
+            length = 0
+            while len(self.logLines) > self.logLimit:
+                length += self.logLines.popleft()
+            log.Remove(0, length)
+            self.logLength -= length
+
+        log.ShowPosition(self.logLength)
+        log.Thaw()
         return True
 
-    def Log(self, message, color = (108, 117, 125)):
-        # Use CallAfter to prevent multithreading issues
-        wx.CallAfter(self._log, '\n' + message, color)
+    def Log(self, message, color = (108, 117, 125), level = logging.INFO):
+        # Safe to call from any thread, the widget is only touched by flushLog on the UI thread
+        self.logQueue.append((message, color))
+        self.logger.log(level, message)
         return True
 
     def LogError(self, message, title = "Error"):
-        return self.Log(title + ": " + message, (220, 53, 69))
+        return self.Log(title + ": " + message, (220, 53, 69), logging.ERROR)
 
     def LogWarning(self, message, title = "Warning"):
-        return self.Log(title + ": " + message, (255, 193, 7))
+        return self.Log(title + ": " + message, (255, 193, 7), logging.WARNING)
 
     def LogSuccess(self, message):
         return self.Log(message, (40, 167, 69))
@@ -149,12 +205,12 @@ class AppFrame(wx.Frame):
 
         self.Bind(wx.EVT_MENU, self.OnAbout, aboutItem)
 
-    def refresh(self):
-        self.eepromPanel.refresh()
+    def refresh(self, reconnect = False):
+        self.eepromPanel.refresh(reconnect)
 
     def OnImport(self, event):
         with wx.FileDialog(self, "Choose Hex file",
-            wildcard = "Hex files (*.hex;*.bin)|*.hex;*.bin",
+            wildcard = "ROM files (*.bin;*.hex;*.ihx;*.s19;*.s28;*.s37;*.srec)|*.bin;*.hex;*.ihx;*.s19;*.s28;*.s37;*.srec|All files (*.*)|*.*",
             style = wx.FD_OPEN | wx.FD_FILE_MUST_EXIST,
             defaultDir = self.view.defaultDir) as fileDialog:
 
@@ -242,6 +298,7 @@ class EepromPanel(wx.Panel):
 
         programmerSizer.Add(wx.StaticText(programmerPanel, wx.ID_ANY, "Programmer"), 0, wx.EXPAND | wx.BOTTOM | wx.ALIGN_LEFT, 4)
 
+        self.programmers = []
         self.programmerList = wx.Choice(programmerPanel, choices = [], name = 'Programmer')
         self.programmerList.Bind(wx.EVT_CHOICE, self.onProgrammerSelect)
         programmerSizer.Add(self.programmerList, 0, wx.EXPAND)
@@ -249,11 +306,28 @@ class EepromPanel(wx.Panel):
         programmerPanel.SetSizer(programmerSizer)
         self.sizer.Add(programmerPanel, 0, wx.EXPAND | wx.BOTTOM, 16)
 
+        # Write Options
+        self.diffCheckBox = wx.CheckBox(self.panel, wx.ID_ANY, "Only write bytes that changed on the device")
+        self.sizer.Add(self.diffCheckBox, 0, wx.EXPAND | wx.BOTTOM, 16)
+
+        # Progress of current operation
+        self.gauge = wx.Gauge(self.panel, wx.ID_ANY, range = 100)
+        self.sizer.Add(self.gauge, 0, wx.EXPAND | wx.BOTTOM, 16)
+        self.controller.addSink(ProgressSink(self))
+
         # Action Buttons
 
         buttonPanel = wx.Panel(self.panel)
         buttonSizer = wx.BoxSizer(wx.HORIZONTAL)
 
+        self.blankButton = wx.Button(buttonPanel, wx.ID_ANY, "Blank Check")
+        self.blankButton.Bind(wx.EVT_BUTTON, self.onBlankClick)
+        buttonSizer.Add(self.blankButton, 0, wx.ALIGN_RIGHT | wx.ALIGN_BOTTOM | wx.RIGHT, 8)
+
+        self.eraseButton = wx.Button(buttonPanel, wx.ID_ANY, "Erase")
+        self.eraseButton.Bind(wx.EVT_BUTTON, self.onEraseClick)
+        buttonSizer.Add(self.eraseButton, 0, wx.ALIGN_RIGHT | wx.ALIGN_BOTTOM | wx.RIGHT, 8)
+
         self.readButton = wx.Button(buttonPanel, wx.ID_ANY, "Read")
         self.readButton.Bind(wx.EVT_BUTTON, self.onReadClick)
         buttonSizer.Add(self.readButton, 0, wx.ALIGN_RIGHT | wx.ALIGN_BOTTOM)
@@ -276,10 +350,21 @@ class EepromPanel(wx.Panel):
     def getTitle(self):
         return "EEPROM"
 
-    def refresh(self):
+    def refresh(self, reconnect = False):
         wx.CallAfter(self.disableControls)
-        self.programmerList.SetItems(self.controller.getProgrammers())
-        self.onProgrammerSelect(None)
+
+        # Try the last used programmer before scanning every port
+        programmer = self.controller.reconnectProgrammer() if reconnect else False
+        if programmer != False:
+            self.programmers = [programmer]
+            self.programmerList.SetItems([self.controller.formatProgrammer(programmer)])
+            self.programmerList.SetSelection(0)
+            self.view.LogSuccess("Successfully connected with programmer on {}.".format(programmer["port"]))
+        else:
+            self.programmers = self.controller.findProgrammers()
+            self.programmerList.SetItems([self.controller.formatProgrammer(programmer) for programmer in self.programmers])
+            self.onProgrammerSelect(None)
+
         wx.CallAfter(self.enableControls)
 
     def onDeviceSelect(self, e):
@@ -292,21 +377,12 @@ class EepromPanel(wx.Panel):
 
     def onProgrammerSelect(self, e):
         index = self.programmerList.GetSelection()
-        str = self.programmerList.GetString(index)
-
-        if len(str) <= 0:
+        if index == wx.NOT_FOUND or index >= len(self.programmers):
             return
 
-        if os.name == 'nt':
-            portname = re.search("\[(COM\d+)\]", str).group(1).strip()
-        else:
-            portname = re.search("\[([^\]0-9]+\d+)\]", str).group(1).strip()
-
-        if len(portname) <= 0:
-            self.view.LogWarning("Invalid programmer selected.")
-            return
+        portname = self.programmers[index]["port"]
 
-        if self.controller.setProgrammer(portname):
+        if self.controller.checkProgrammer(portname):
             self.view.LogSuccess("Successfully connected with programmer on {}.".format(portname))
 
     def onReadClick(self, e):
@@ -322,7 +398,7 @@ class EepromPanel(wx.Panel):
         # Read contents of device from programmer
         data = self.controller.readDevice()
 
-        if isinstance(data, list):
+        if isinstance(data, bytearray):
             # Display read data in hex viewer
             wx.CallAfter(self.view.frame.hexPanel.loadContents, data)
 
@@ -347,7 +423,7 @@ class EepromPanel(wx.Panel):
 
         # Select file to import
         with wx.FileDialog(self, "Choose Hex File to Write Device",
-            wildcard = "Hex files (*.hex;*.bin)|*.hex;*.bin",
+            wildcard = "ROM files (*.bin;*.hex;*.ihx;*.s19;*.s28;*.s37;*.srec)|*.bin;*.hex;*.ihx;*.s19;*.s28;*.s37;*.srec|All files (*.*)|*.*",
             style = wx.FD_OPEN | wx.FD_FILE_MUST_EXIST,
             defaultDir = self.view.defaultDir) as fileDialog:
 
@@ -361,34 +437,103 @@ class EepromPanel(wx.Panel):
             self.view.Log("Beginning device write from {}.".format(pathname))
 
             # Thread to perform write and re-enable controls once complete
-            thread = threading.Thread(target = self.performWrite, args = (pathname,))
+            thread = threading.Thread(target = self.performWrite, args = (pathname, self.diffCheckBox.GetValue()))
             thread.start()
 
-    def performWrite(self, pathname):
+    def performWrite(self, pathname, diff = False):
         # Display write data in hex viewer
         data = self.controller.importFile(pathname)
-        if data != False and isinstance(data, list):
+        if isinstance(data, bytearray):
             wx.CallAfter(self.view.frame.hexPanel.loadContents, data)
 
-        # Perform write to Eeprom from Programmer
-        self.controller.writeFile(pathname)
+        # Perform write to Eeprom from Programmer and mark bytes which failed to verify
+        self.controller.writeFile(pathname, diff)
+        wx.CallAfter(self.view.frame.hexPanel.highlightRanges, self.controller.mismatches)
 
         self.view.Log("Device write process completed.")
         self.enableControls()
 
+    def onBlankClick(self, e):
+        self.disableControls()
+
+        self.view.Log("Beginning device blank check.")
+
+        thread = threading.Thread(target = self.performBlankCheck)
+        thread.start()
+
+    def performBlankCheck(self):
+        if self.controller.blankCheckDevice():
+            self.view.LogSuccess("Device is blank.")
+
+        self.enableControls()
+
+    def onEraseClick(self, e):
+        with wx.MessageDialog(self, "Erase all contents of the device?", "Erase Device", wx.YES_NO | wx.NO_DEFAULT | wx.ICON_WARNING) as dialog:
+            if dialog.ShowModal() != wx.ID_YES:
+                return
+
+        self.disableControls()
+
+        self.view.Log("Beginning device erase.")
+
+        thread = threading.Thread(target = self.performErase)
+        thread.start()
+
+    def performErase(self):
+        if self.controller.eraseDevice():
+            self.view.LogSuccess("Device erased.")
+
+        self.enableControls()
+
+    def updateProgress(self, value, message):
+        self.gauge.SetValue(value)
+        self.view.frame.SetStatusText(message)
+
     def disableControls(self):
         # Use CallAfter to prevent multithreading issues
         wx.CallAfter(self.deviceList.Disable)
         wx.CallAfter(self.programmerList.Disable)
+        wx.CallAfter(self.blankButton.Disable)
+        wx.CallAfter(self.eraseButton.Disable)
         wx.CallAfter(self.readButton.Disable)
         wx.CallAfter(self.writeButton.Disable)
+        wx.CallAfter(self.diffCheckBox.Disable)
 
     def enableControls(self):
         # Use CallAfter to prevent multithreading issues
         wx.CallAfter(self.deviceList.Enable)
         wx.CallAfter(self.programmerList.Enable)
+        wx.CallAfter(self.blankButton.Enable)
+        wx.CallAfter(self.eraseButton.Enable)
         wx.CallAfter(self.readButton.Enable)
         wx.CallAfter(self.writeButton.Enable)
+        wx.CallAfter(self.diffCheckBox.Enable)
+
+class ProgressSink():
+
+    # Shows progress events of the controller on the Eeprom panel gauge and status bar
+    def __init__(self, panel):
+        self.panel = panel
+
+    def handleEvent(self, event):
+        operation = event["operation"].capitalize()
+
+        if event["event"] == "start":
+            message = "{} {} bytes...".format(operation, event["bytes"])
+            value = 0
+        elif event["event"] == "block":
+            value = min(100, event["done"] * 100 // max(1, event["total"]))
+            rate = event["done"] / event["elapsed"] if event["elapsed"] > 0 else 0.0
+            eta = (event["total"] - event["done"]) / rate if rate > 0 else 0.0
+            message = "{} {}% at {}, {:.0f}s remaining".format(operation, value, progress.formatRate(rate), eta)
+        elif event["event"] == "end":
+            message = "{} {} in {:.1f}s at {}".format(operation, "completed" if event["success"] else "failed", event["elapsed"], progress.formatRate(event["rate"]))
+            value = 100 if event["success"] else 0
+        else:
+            return
+
+        # Use CallAfter to prevent multithreading issues
+        wx.CallAfter(self.panel.updateProgress, value, message)
 
 class MicroPanel(wx.Panel):
 
@@ -403,6 +548,72 @@ class MicroPanel(wx.Panel):
     def getTitle(self):
         return "Microcontroller"
 
+class HexTable(wx.grid.GridTableBase):
+
+    # Virtual table formatting address, byte and text cells on demand from the image buffer
+    def __init__(self, columns):
+        wx.grid.GridTableBase.__init__(self)
+
+        self.columns = columns
+        self.data = bytearray()
+
+        self.highlights = [] # Offset ranges of bytes marked as mismatched
+        self.highlightStarts = []
+        self.highlightAttr = wx.grid.GridCellAttr()
+        self.highlightAttr.SetBackgroundColour(wx.Colour(248, 215, 218))
+
+    def setData(self, data):
+        self.data = data
+        self.setHighlights([])
+
+    def setHighlights(self, ranges):
+        self.highlights = sorted(ranges)
+        self.highlightStarts = [start for start, end in self.highlights]
+
+    def isHighlighted(self, offset):
+        index = bisect.bisect_right(self.highlightStarts, offset) - 1
+        return index >= 0 and offset < self.highlights[index][1]
+
+    def GetNumberRows(self):
+        return (len(self.data) + self.columns - 1) // self.columns
+
+    def GetNumberCols(self):
+        return self.columns + 2
+
+    def IsEmptyCell(self, row, col):
+        return False
+
+    def GetValue(self, row, col):
+        offset = row * self.columns
+        if col == 0:
+            return "{0:0{1}x}".format(offset, 4)
+
+        if col <= self.columns:
+            offset += col - 1
+            if offset >= len(self.data):
+                return ""
+            return "{0:0{1}x}".format(self.data[offset], 2)
+
+        # Printable characters of row
+        return "".join([chr(x) if x >= 0x20 and x < 0x7f else "." for x in bytearray(self.data[offset:offset + self.columns])])
+
+    def SetValue(self, row, col, value):
+        return
+
+    def GetColLabelValue(self, col):
+        if col == 0:
+            return "Address"
+        if col <= self.columns:
+            return "{0:0{1}x}".format(col - 1, 2)
+        return ""
+
+    def GetAttr(self, row, col, kind):
+        if col < 1 or col > self.columns or not self.isHighlighted(row * self.columns + col - 1):
+            return None
+
+        self.highlightAttr.IncRef()
+        return self.highlightAttr
+
 class HexPanel(wx.Panel):
 
     def __init__(self, parent, view, controller):
@@ -414,16 +625,13 @@ class HexPanel(wx.Panel):
         self.columns = 8
 
         # Setup Grid
+        self.table = HexTable(self.columns)
         self.grid = wx.grid.Grid(self, wx.ID_ANY, style = 0)
-        self.grid.CreateGrid(1, self.columns * 2 + 1)
+        self.grid.SetTable(self.table, True)
         self.grid.EnableEditing(False)
 
         ## Labels
         self.grid.HideRowLabels()
-        for i in range(self.columns):
-            self.grid.SetColLabelValue(i * 2 + 0, "Address")
-            self.grid.SetColLabelValue(i * 2 + 1, "Value")
-        self.grid.SetColLabelValue(self.columns * 2, "")
 
         ## Font
         self.grid.SetDefaultCellAlignment(wx.ALIGN_LEFT, wx.ALIGN_TOP)
@@ -438,44 +646,30 @@ class HexPanel(wx.Panel):
         return "Hex"
 
     def loadContents(self, data):
-        self.grid.ClearGrid()
-        self.grid.GetTable().DeleteRows(0, self.grid.GetNumberRows())
+        if not data or not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytearray()
 
-        if not data or not isinstance(data, list):
-            return False
+        rows = self.table.GetNumberRows()
+        self.table.setData(data)
 
-        self.grid.GetTable().AppendRows(int(math.ceil(float(len(data)) / float(self.columns))))
-
-        # Set Hex Addresses and Values
-        col = 0
-        row = 0
-        for i, x in enumerate(data):
-            self.grid.SetCellValue(row, col * 2 + 0, "{0:0{1}x}".format(i, 4))
-            self.grid.SetCellValue(row, col * 2 + 1, "{0:0{1}x}".format(x, 2))
-
-            col = col + 1
-            if col >= self.columns:
-                col = 0
-                row = row + 1
-
-        # Set String Visualization
-        row = 0
-        val = ""
-        for i, x in enumerate(data):
-            char = " "
-            try:
-                char = chr(x).encode('utf-8').decode('utf-8')
-            except UnicodeDecodeError:
-                char = " "
-
-            val = val + char
-            if len(val) > self.columns or i >= len(data) - 1:
-                self.grid.SetCellValue(row, self.columns * 2, val)
-                val = ""
-                row = row + 1
+        # Notify grid of the change in row count, cells are only formatted when drawn
+        self.grid.BeginBatch()
+        if self.table.GetNumberRows() < rows:
+            self.grid.ProcessTableMessage(wx.grid.GridTableMessage(self.table, wx.grid.GRIDTABLE_NOTIFY_ROWS_DELETED, self.table.GetNumberRows(), rows - self.table.GetNumberRows()))
+        elif self.table.GetNumberRows() > rows:
+            self.grid.ProcessTableMessage(wx.grid.GridTableMessage(self.table, wx.grid.GRIDTABLE_NOTIFY_ROWS_APPENDED, self.table.GetNumberRows() - rows))
+        self.grid.EndBatch()
 
+        self.grid.ForceRefresh()
         self.Layout()
 
+        return len(data) > 0
+
+    def highlightRanges(self, ranges):
+        # Mark value cells of mismatched bytes, clearing the previous marks
+        self.table.setHighlights(ranges)
+        self.grid.ForceRefresh()
+
         return True
 
 class DebugPanel(wx.Panel):
@@ -655,6 +849,13 @@ class DebugPanel(wx.Panel):
         lineLength = self.getHexValue(self.lineLengthField, 2)
         if commandInfo["lineLength"] == False: lineLength = None
 
+        # Hex dumps longer than a response frame are rejected by the programmer
+        if commandInfo["code"] == "R" and dataLength != None:
+            maxLength = protocol.maxHexRead(lineLength or 32)
+            if dataLength > maxLength:
+                self.view.LogWarning("Hex read limited to {} bytes with a line length of {}.".format("0x{0:0{1}x}".format(maxLength, 4), lineLength or 32), "Read Length Limited")
+                dataLength = maxLength
+
         # Request and send data input
         dataInput = ""
         if commandInfo["input"] != False and commandInfo["input"] == "dataLength" and dataLength != None:
@@ -689,28 +890,22 @@ class DebugPanel(wx.Panel):
 
         if dataInput == False or not isinstance(dataInput, str) or (commandInfo["input"] == "dataLength" and dataLength != None and len(dataInput) != dataLength * 2): dataInput = None
 
-        # Send command to programmer
+        # Send command and data input to programmer
         self.view.Log("Sending command to programmer.")
-        if not self.controller.sendCommand(commandInfo["code"], address, dataLength, lineLength):
+        if not self.controller.sendCommand(commandInfo["code"], address, dataLength, lineLength, dataInput if dataInput else None):
             self.view.LogError("Failed to send debug command.")
             return
 
-        if dataInput is not None and isinstance(dataInput, str) and len(dataInput) > 0:
-            self.view.Log("Sending data to programmer.")
-            if not self.controller.writeString(dataInput):
-                self.view.LogError("Failed to send debug input data.")
-                return
-
         # Read programmer results
+        self.view.Log("Reading command response from programmer.")
+        result = self.controller.readCommand(commandInfo, dataLength, lineLength)
+        if result == False:
+            self.view.LogError("Failed to read debug data from programmer.")
+            self.resultField.SetValue("")
+            return
+
         if commandInfo["return"] != False:
-            self.view.Log("Reading command response from programmer.")
-            result = self.controller.readCommand(commandInfo, dataLength, lineLength)
-            if result == False:
-                self.view.LogError("Failed to read debug data from programmer.")
-                self.resultField.SetValue("")
-                return
-            else:
-                self.resultField.SetValue(result)
+            self.resultField.SetValue(result)
         else:
             self.resultField.SetValue("")
 
@@ -732,5 +927,3 @@ class DebugPanel(wx.Panel):
 
         # Convert to integer
         return int(val, base = 16)
-
-# NOTE: Maybe create HexGrid class based on HugeTableGrid example.
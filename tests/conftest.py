@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class BufferPort():
+
+    # Serial port stand-in answering reads from a fixed buffer
+    def __init__(self, data = b''):
+        self.input = bytearray(data)
+        self.output = bytearray()
+        self.port = None
+        self.timeout = None
+        self.is_open = True
+        self.resets = 0
+
+    def open(self):
+        self.is_open = True
+
+    def read(self, size = 1):
+        data = bytes(self.input[:size])
+        del self.input[:size]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.output += data
+        return len(data)
+
+    def flush(self):
+        return
+
+    def reset_input_buffer(self):
+        # Responses are queued up front as if sent after the command, so there is nothing stale to drop
+        self.resets += 1
+
+    def close(self):
+        self.is_open = False
+
+@pytest.fixture
+def port():
+    # Returns the serial port stand-in class
+    return BufferPort
+
+@pytest.fixture
+def memory():
+    # Returns a function creating a controller whose programmer is an in-memory device, its log is kept in controller.view.stream
+    pytest.importorskip('serial')
+
+    from app import protocol
+    from app.cli import CliView
+    from app.controller import AppController
+
+    class MemoryController(AppController):
+
+        def __init__(self, device, image):
+            AppController.__init__(self, lambda controller: CliView(controller, io.StringIO()))
+            self.view.verbose = True
+            assert self.setDevice(device)
+
+            self.startAddress = self.devices[device]["startAddress"]
+            self.memory = bytearray(image) if image is not None else bytearray([0xFF] * self.devices[device]["dataLength"])
+            self.stuck = {} # Offsets which ignore writes
+            self.flaky = {} # Offsets whose next count writes store bit 0 flipped
+            self.written = [] # (address, length) of every block written
+            self.reads = [] # (address, length) of every block read back
+            self.serial = BufferPort()
+
+        def readBlock(self, startAddress, dataLength, buffer = None):
+            self.reads.append((startAddress, dataLength))
+            if buffer is None:
+                buffer = bytearray(dataLength)
+            offset = startAddress - self.startAddress
+            buffer[:] = self.memory[offset:offset + dataLength]
+            return buffer
+
+        def readChecksum(self, startAddress, dataLength):
+            offset = startAddress - self.startAddress
+            return protocol.crc32(self.memory[offset:offset + dataLength])
+
+        def writeBlocks(self, blocks):
+            for address, data in blocks:
+                self.written.append((address, len(data)))
+                offset = address - self.startAddress
+                for i, value in enumerate(data):
+                    if offset + i in self.stuck:
+                        continue
+                    if self.flaky.get(offset + i, 0) > 0:
+                        self.flaky[offset + i] -= 1
+                        value ^= 0x01
+                    self.memory[offset + i] = value
+            return True
+
+        def findNonBlank(self, startAddress, dataLength):
+            offset = startAddress - self.startAddress
+            for i in range(offset, offset + dataLength):
+                if self.memory[i] != 0xFF:
+                    return self.startAddress + i
+            return None
+
+        def fillBlock(self, startAddress, dataLength, value):
+            return self.writeBlocks([(startAddress, bytearray([value] * dataLength))])
+
+        def playTone(self):
+            return True
+
+    def create(device = "AT28C256", image = None):
+        return MemoryController(device, image)
+
+    return create
+
+@pytest.fixture
+def emulator():
+    # Returns a function starting an emulated programmer, closed after the test
+    pytest.importorskip('serial')
+    if sys.platform == 'win32':
+        pytest.skip("emulator requires a POSIX pty")
+
+    from app.emulator import ProgrammerEmulator
+
+    emulators = []
+
+    def start(device = "AT28C256", cls = ProgrammerEmulator, image = None):
+        programmer = cls(device, 0)
+        if image is not None:
+            programmer.loadImage(image)
+        programmer.open()
+        emulators.append(programmer)
+        return programmer
+
+    yield start
+
+    for programmer in emulators:
+        programmer.close()
+
+@pytest.fixture
+def controller():
+    # Returns a function connecting a controller to an emulated programmer, its log is kept in controller.view.stream
+    pytest.importorskip('serial')
+
+    from app.cli import CliView
+    from app.controller import AppController
+
+    controllers = []
+
+    def connect(programmer, device = "AT28C256"):
+        session = AppController(lambda controller: CliView(controller, io.StringIO()))
+        session.cache_programmer = False
+        session.view.verbose = True
+        assert session.setDevice(device)
+        assert session.checkProgrammer(programmer.portname)
+        controllers.append(session)
+        return session
+
+    yield connect
+
+    for session in controllers:
+        session.closeProgrammer()
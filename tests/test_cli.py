@@ -0,0 +1,120 @@
+import io
+import json
+import sys
+
+import pytest
+
+from app import cli
+
+def runCli(argv):
+    stream = io.StringIO()
+    app = cli.CliApp(lambda controller: cli.CliView(controller, stream))
+    app.controller.cache_programmer = False
+    return app.run(argv), stream.getvalue()
+
+def test_log_levels():
+    stream = io.StringIO()
+    view = cli.CliView(None, stream)
+    view.Log("info")
+    view.LogWarning("careful")
+    view.LogSuccess("done")
+    view.LogError("broken", "Write Error")
+    assert stream.getvalue() == "Warning: careful\ndone\nWrite Error: broken\n"
+
+    view.verbose = True
+    view.Log("info")
+    assert stream.getvalue().endswith("info\n")
+
+def test_quiet_only_logs_errors():
+    stream = io.StringIO()
+    view = cli.CliView(None, stream)
+    view.verbose = True
+    view.quiet = True
+    view.Log("info")
+    view.LogWarning("careful")
+    view.LogSuccess("done")
+    view.LogError("broken")
+    assert stream.getvalue() == "Error: broken\n"
+
+def test_unknown_device():
+    with pytest.raises(SystemExit) as e:
+        runCli(['read', '-d', 'AT28C512', 'rom.bin'])
+    assert e.value.code == cli.EXIT_USAGE
+
+def test_no_programmer(tmp_path):
+    image = tmp_path / "image.bin"
+    image.write_bytes(b'\x00')
+    code, log = runCli(['verify', '-d', 'AT28C16', '-p', str(tmp_path / "missing"), str(image)])
+    assert code == cli.EXIT_NO_PROGRAMMER
+    assert "No programmer found on" in log
+
+def test_gang_file_count(tmp_path):
+    image = tmp_path / "image.bin"
+    image.write_bytes(b'\x00')
+    code, log = runCli(['gang', '-d', 'AT28C16', '-p', 'a', '-p', 'b', str(image), str(image), str(image)])
+    assert code == cli.EXIT_USAGE
+    assert "Expected one file or one file per port, got 3 files for 2 ports." in log
+
+def test_write_verify_read(emulator, tmp_path):
+    programmer = emulator("AT28C16")
+    data = bytes(bytearray(range(256)) * 8)
+    image = tmp_path / "image.bin"
+    image.write_bytes(data)
+
+    assert runCli(['write', '-d', 'AT28C16', '-p', programmer.portname, str(image)])[0] == cli.EXIT_OK
+    assert programmer.memory == bytearray(data)
+    assert runCli(['verify', '-d', 'AT28C16', '-p', programmer.portname, str(image)])[0] == cli.EXIT_OK
+
+    output = tmp_path / "output.bin"
+    assert runCli(['read', '-d', 'AT28C16', '-p', programmer.portname, str(output)])[0] == cli.EXIT_OK
+    assert output.read_bytes() == data
+
+def test_verify_failure(emulator, tmp_path):
+    programmer = emulator("AT28C16")
+    image = tmp_path / "image.bin"
+    image.write_bytes(b'\x00' * 0x0800)
+
+    code, log = runCli(['verify', '-d', 'AT28C16', '-p', programmer.portname, str(image)])
+    assert code == cli.EXIT_FAILURE
+    assert "Device contents do not match ROM data in 2048 bytes" in log
+
+def test_write_hex_diff(emulator, tmp_path):
+    programmer = emulator("AT28C16")
+    image = tmp_path / "image.hex"
+    image.write_text(u":040100006162636471\n:00000001FF\n")
+
+    assert runCli(['write', '--diff', '-d', 'AT28C16', '-p', programmer.portname, str(image)])[0] == cli.EXIT_OK
+    assert programmer.memory[0x0100:0x0104] == bytearray(b'abcd')
+    assert programmer.memory[0x0104:] == bytearray([0xFF] * 0x06FC)
+
+def test_write_hex_error(emulator, tmp_path):
+    programmer = emulator("AT28C16")
+    image = tmp_path / "image.hex"
+    image.write_text(u":040100006162636400\n:00000001FF\n")
+
+    code, log = runCli(['write', '-d', 'AT28C16', '-p', programmer.portname, str(image)])
+    assert code == cli.EXIT_FAILURE
+    assert "Line 1: record checksum" in log
+    assert programmer.memory == bytearray([0xFF] * 0x0800)
+
+def test_benchmark(tmp_path):
+    pytest.importorskip('serial')
+    if sys.platform == 'win32':
+        pytest.skip("emulator requires a POSIX pty")
+
+    output = tmp_path / "benchmarks.jsonl"
+    code, log = runCli(['-q', 'benchmark', '-d', 'AT28C16', '-b', '256', '-c', 'similar', '--no-memory', '-o', str(output)])
+    assert code == cli.EXIT_OK
+
+    report = json.loads(output.read_text())
+    assert [result["operation"] for result in report["results"]] == ["importFile", "writeDevice", "readDevice", "verifyDevice", "compareData"]
+    assert all([result["success"] and result["device"] == "AT28C16" and result["block_size"] == 256 for result in report["results"]])
+
+def test_benchmark_block_size_limit():
+    pytest.importorskip('serial')
+    if sys.platform == 'win32':
+        pytest.skip("emulator requires a POSIX pty")
+
+    code, log = runCli(['-q', 'benchmark', '-d', 'AT28C16', '-b', '1024', '-c', 'blank', '--no-memory'])
+    assert code == cli.EXIT_FAILURE
+    assert "Block size of 1024 bytes is larger than the 512 bytes advertised by the programmer." in log
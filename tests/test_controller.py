@@ -0,0 +1,402 @@
+import os
+import random
+import sys
+
+import pytest
+
+from app import protocol
+from app.controller import AppController
+
+def randomImage(length, seed = 1):
+    generator = random.Random(seed)
+    return bytearray(generator.getrandbits(8) for i in range(length))
+
+def getLog(session):
+    return session.view.stream.getvalue()
+
+def test_changed_ranges(memory):
+    session = memory()
+    a = bytearray(64)
+    b = bytearray(a)
+    b[1] = b[3] = 1
+    b[40] = 1
+    assert session.getChangedRanges(a, b) == [(1, 4), (40, 41)]
+
+    session.diff_gap = 0
+    assert session.getChangedRanges(a, b) == [(1, 2), (3, 4), (40, 41)]
+    assert session.getChangedRanges(a, a) == []
+
+def test_write_and_verify(memory):
+    session = memory()
+    data = randomImage(0x8000)
+
+    assert session.writeDevice(data)
+    assert session.memory == data
+    assert session.verifyDevice(data)
+
+    session.memory[0x0100] ^= 0x01
+    assert not session.verifyDevice(data)
+
+def test_diff_only_writes_changes(memory):
+    current = randomImage(0x8000)
+    session = memory(image = current)
+
+    data = bytearray(current)
+    data[0x1000] ^= 0xFF
+    data[0x1004] ^= 0xFF
+    assert session.writeDevice(data, True)
+    assert session.memory == data
+    assert session.written == [(0x1000, 5)]
+
+def test_diff_retries_only_failed_bytes(memory):
+    current = randomImage(0x8000)
+    session = memory(image = current)
+    session.stuck = {0x1002}
+
+    data = bytearray(current)
+    for address in [0x1000, 0x1002, 0x1004]:
+        data[address] ^= 0xFF
+    assert not session.writeDevice(data, True)
+    assert session.written == [(0x1000, 5)] + [(0x1002, 1)] * (session.write_cycles - 1)
+    assert "Unable to verify" in getLog(session)
+
+def test_retry_rewrites_failing_ranges(memory):
+    session = memory()
+    session.stuck = {0x0410}
+    session.block_size = 0x0400
+
+    data = randomImage(0x8000)
+    data[0x0410] = 0x00
+    assert not session.writeDevice(data)
+    assert session.written.count((0x0410, 1)) == session.write_cycles - 1
+    assert len(session.written) == 0x20 + session.write_cycles - 1
+    assert "Unable to verify 1 bytes in 1 ranges written to Eeprom device at 0x0410." in getLog(session)
+    assert session.mismatches == [(0x0410, 0x0411)]
+
+def test_flaky_cell_is_rewritten(memory):
+    session = memory()
+    session.flaky = {0x0020: 1, 0x0021: 1, 0x0500: 1}
+    session.block_size = 0x0400
+
+    data = randomImage(0x8000)
+    assert session.writeDevice(data)
+    assert session.memory == data
+    assert (0x0020, 2) in session.written
+    assert (0x0500, 1) in session.written
+
+def test_format_ranges(memory):
+    session = memory()
+    assert session.formatRanges([(0x0010, 0x0013), (0x0100, 0x0101)]) == "0x0010-0x0012, 0x0100"
+    assert session.formatRanges([(i * 2, i * 2 + 1) for i in range(4)], 2) == "0x0000, 0x0002 and 2 more ranges"
+
+def test_check_status(memory):
+    session = memory()
+    assert session.checkStatus(bytearray([protocol.STATUS_OK]))
+    assert not session.checkStatus(bytearray([protocol.STATUS_TIMEOUT, 0xc0, 0x7f]), "Block Write Error")
+    assert "Block Write Error: Write cycle timed out, device may be missing or write protected at 0x7fc0." in getLog(session)
+    assert not session.checkStatus(bytearray([0x7f]))
+    assert "Unknown programmer error 0x7f." in getLog(session)
+
+def test_configure_programmer(memory):
+    session = memory()
+    assert session.configureProgrammer({'Max Block': '512', 'Window': '2', 'Commands': 'VrwT'})
+    assert session.block_size == 512
+    assert session.window == 2
+    assert session.supportsCommand(u'w')
+    assert not session.supportsCommand(u'P')
+
+    assert session.configureProgrammer({'Max Block': 'many'})
+    assert session.block_size == session.default_block_size
+    assert session.window == 1
+    assert session.supportsCommand(u'P')
+    assert "Invalid block size advertised by programmer" in getLog(session)
+
+    assert not session.configureProgrammer(False)
+    assert session.block_size == session.default_block_size
+
+def test_send_command(memory, port):
+    session = memory()
+    session.serial = port()
+    assert session.sendCommand(u'w', 0x1234, 2, None, b'ab')
+    assert session.serial.output == protocol.packCommand(u'w', 0x1234, 2, 0, b'ab', 1)
+    assert session.serial.resets == 1
+
+    # Sequence number advances with each command
+    assert session.sendCommand(u'w', 0x1234, 2, None, b'ab', pipelined = True)
+    assert session.serial.output[-len(protocol.packCommand(u'w', 0x1234, 2, 0, b'ab', 2)):] == protocol.packCommand(u'w', 0x1234, 2, 0, b'ab', 2)
+    assert session.serial.resets == 1
+
+def test_read_frame(memory, port):
+    session = memory()
+    session.serial = port(b'\x00\xff' + protocol.packFrame(u'r', b'\x00abc'))
+    assert session.readFrame(u'r') == bytearray(b'\x00abc')
+
+    session.serial = port(protocol.packFrame(u'r', b'\x00abc', 7))
+    assert session.readFrame(u'r', sequence = 7) == bytearray(b'\x00abc')
+
+def test_read_block_into_buffer(memory, port):
+    session = memory()
+    session.serial = port(protocol.packFrame(u'r', b'\x00abcd', 1))
+    image = bytearray(8)
+    block = AppController.readBlock(session, 0x0010, 4, memoryview(image)[2:6])
+    assert block is not False
+    assert image == bytearray(b'\x00\x00abcd\x00\x00')
+    assert session.serial.output == protocol.packCommand(u'r', 0x0010, 4, sequence = 1)
+
+    session.serial = port(protocol.packFrame(u'r', b'\x00abc', 1))
+    assert AppController.readBlock(session, 0x0010, 4) is False
+
+def test_read_frame_errors(memory, port):
+    session = memory()
+    frame = protocol.packFrame(u'r', b'\x00abc')
+    frame[5] ^= 0x01
+    session.serial = port(frame)
+    assert session.readFrame(u'r') is False
+    assert "Response from programmer failed CRC check." in getLog(session)
+    assert session.serial.resets == 1
+
+    session.serial = port(protocol.packFrame(u'w', b'\x00'))
+    assert session.readFrame(u'r') is False
+    assert "Unexpected response from programmer." in getLog(session)
+
+    # Late reply to an earlier command
+    session.serial = port(protocol.packFrame(u'r', b'\x00abc', 1))
+    assert session.readFrame(u'r', sequence = 2) is False
+    assert session.serial.resets == 1
+
+    session.serial = port(protocol.packFrame(u'r', b'\x00abc')[:-1])
+    assert session.readFrame(u'r') is False
+    assert "Incomplete response from programmer." in getLog(session)
+
+    session.serial = port()
+    assert session.readFrame(u'r') is False
+    assert "Timed out waiting for response from programmer." in getLog(session)
+
+def test_write_blocks_pipelined(memory, port):
+    session = memory()
+    session.window = 2
+    session.serial = port(b''.join([protocol.packFrame(u'P', b'\x00', sequence) for sequence in [1, 2, 3]]))
+
+    blocks = [(0x0000, b'a' * 64), (0x0040, b'b' * 64), (0x0080, b'c' * 64)]
+    assert AppController.writeBlocks(session, blocks)
+    assert session.serial.output == b''.join([protocol.packCommand(u'P', address, len(data), 64, data, i + 1) for i, (address, data) in enumerate(blocks)])
+    assert len(session.serial.input) == 0
+    assert session.serial.resets == 1
+
+def test_write_blocks_collects_statuses_after_failure(memory, port):
+    session = memory()
+    session.window = 2
+    session.serial = port(protocol.packFrame(u'P', bytearray([protocol.STATUS_TIMEOUT, 0x3f, 0x00]), 1) + protocol.packFrame(u'P', b'\x00', 2))
+
+    blocks = [(0x0000, b'a' * 64), (0x0040, b'b' * 64), (0x0080, b'c' * 64)]
+    assert not AppController.writeBlocks(session, blocks)
+    assert session.serial.output == b''.join([protocol.packCommand(u'P', address, len(data), 64, data, i + 1) for i, (address, data) in enumerate(blocks[:2])])
+    assert len(session.serial.input) == 0
+    assert "Write cycle timed out, device may be missing or write protected at 0x003f." in getLog(session)
+
+def test_verify_reads_back_mismatching_checksums(memory):
+    data = randomImage(0x8000)
+    session = memory(image = data)
+    session.block_size = 0x0400
+
+    assert session.verifyDevice(data)
+    assert session.reads == []
+
+    session.memory[0x0410] ^= 0x01
+    assert not session.verifyDevice(data)
+    assert session.reads == [(0x0400, 0x0400)]
+    assert "Device contents do not match ROM data in 1 bytes at 0x0410." in getLog(session)
+    assert session.mismatches == [(0x0410, 0x0411)]
+
+def test_verify_without_checksum_command(memory):
+    data = randomImage(0x8000)
+    session = memory(image = data)
+    session.block_size = 0x0400
+    session.programmer_commands = u'VrwPT'
+
+    assert session.verifyDevice(data)
+    assert len(session.reads) == 0x20
+
+def test_blank_runs(memory):
+    session = memory()
+    data = [0xFF] * 0x0200
+    data[0x0100] = 0x00
+    data[0x0150] = 0x00
+    assert session.getBlankRuns(data, 0, len(data)) == [(0x0000, 0x0100), (0x0101, 0x0150), (0x0151, 0x0200)]
+    assert session.getBlankRuns(data, 0x0101, 0x0200) == [(0x0101, 0x0150), (0x0151, 0x0200)]
+
+    data[0x0130] = 0x00
+    assert session.getBlankRuns(data, 0, len(data)) == [(0x0000, 0x0100), (0x0151, 0x0200)]
+
+def test_blank_runs_are_skipped(memory):
+    session = memory()
+
+    data = bytearray([0xFF] * 0x8000)
+    data[0x4000:0x4010] = randomImage(16)
+    assert session.writeDevice(data)
+    assert session.memory == data
+    assert session.written == [(0x4000, 16)]
+
+def test_blank_runs_written_where_device_not_erased(memory):
+    session = memory()
+    session.memory[0x6000] = 0x00
+
+    data = bytearray([0xFF] * 0x8000)
+    data[0x4000:0x4010] = randomImage(16)
+    assert session.writeDevice(data)
+    assert session.memory == data
+    assert session.written == [(0x4000, 16), (0x6000, session.blank_run)]
+
+def test_blank_check_and_erase(memory):
+    session = memory("AT28C64", randomImage(0x2000))
+
+    assert not session.blankCheckDevice()
+    assert "Device is not blank at 0x0000." in getLog(session)
+    assert session.eraseDevice()
+    assert session.memory == bytearray([0xFF] * 0x2000)
+    assert session.blankCheckDevice()
+
+def createPorts(monkeypatch, ports):
+    # Replaces the listed serial ports with (device, vid) or (device, vid, serial number, hwid) tuples
+    import serial.tools.list_ports
+    from serial.tools.list_ports_common import ListPortInfo
+
+    infos = []
+    for port in ports:
+        info = ListPortInfo(port[0])
+        info.vid = port[1]
+        if len(port) > 2:
+            info.serial_number, info.hwid = port[2:]
+        infos.append(info)
+    monkeypatch.setattr(serial.tools.list_ports, 'comports', lambda: infos)
+
+def test_find_programmers_filters_ports(memory, monkeypatch):
+    session = memory()
+    createPorts(monkeypatch, [('/dev/ttyS0', None), ('/dev/ttyACM1', 0x239A), ('/dev/ttyACM0', 0x2341), ('/dev/ttyUSB0', 0x0403)])
+    probed = []
+
+    def probeProgrammer(portname):
+        probed.append(portname)
+        return {'Title': '32u4 Programmer', 'Software Version': '0.4'} if portname != '/dev/ttyACM1' else False
+    session.probeProgrammer = probeProgrammer
+
+    assert session.getProgrammers() == ["32u4 Programmer v0.4 [/dev/ttyACM0]"]
+    assert sorted(probed) == ['/dev/ttyACM0', '/dev/ttyACM1']
+
+    del probed[:]
+    assert session.getProgrammerPorts(False) == ['/dev/ttyACM0', '/dev/ttyS0', '/dev/ttyUSB0']
+    assert len(probed) == 4
+
+def test_find_programmers_falls_back_to_every_port(memory, monkeypatch):
+    session = memory()
+    createPorts(monkeypatch, [('/dev/ttyACM0', 0x239A), ('/dev/ttyUSB0', 0x0403)])
+    probed = []
+
+    def probeProgrammer(portname):
+        probed.append(portname)
+        return {'Title': '32u4 Programmer', 'Software Version': '0.4'} if portname == '/dev/ttyUSB0' else False
+    session.probeProgrammer = probeProgrammer
+
+    assert session.getProgrammerPorts() == ['/dev/ttyUSB0']
+    assert sorted(probed) == ['/dev/ttyACM0', '/dev/ttyACM0', '/dev/ttyUSB0']
+
+def test_reconnect_cached_programmer(memory, monkeypatch, tmp_path):
+    session = memory()
+    session.cache_path = str(tmp_path / "cache.json")
+    createPorts(monkeypatch, [('/dev/ttyACM0', 0x239A, 'ABC', 'USB VID:PID=239A:800F SER=ABC')])
+    assert session.saveProgrammerCache('/dev/ttyACM0', {'Software Version': '0.4'})
+
+    checked = []
+    def checkProgrammer(portname, cache = True):
+        assert cache == False
+        checked.append(portname)
+        session.info = {'Title': '32u4 Programmer', 'Software Version': '0.4'}
+        return True
+    session.checkProgrammer = checkProgrammer
+
+    # Found again by serial number after being assigned a new port
+    createPorts(monkeypatch, [('/dev/ttyACM1', 0x239A, 'ABC', 'USB VID:PID=239A:800F SER=ABC')])
+    assert session.reconnectProgrammer()["port"] == '/dev/ttyACM1'
+    assert checked == ['/dev/ttyACM1']
+    assert session.loadProgrammerCache()["port"] == '/dev/ttyACM1'
+
+def test_check_programmer_caches_once_identified(memory, monkeypatch, tmp_path):
+    session = memory()
+    session.cache_path = str(tmp_path / "cache.json")
+    createPorts(monkeypatch, [('/dev/ttyACM0', 0x239A, 'ABC', 'USB VID:PID=239A:800F SER=ABC')])
+
+    info = {}
+    def setProgrammer(portname):
+        session.info = info.copy()
+        return True
+    session.setProgrammer = setProgrammer
+
+    assert session.checkProgrammer('/dev/ttyACM0') is False
+    assert session.loadProgrammerCache() is False
+
+    info.update({'Title': '32u4 Programmer', 'Software Version': '0.4'})
+    assert session.checkProgrammer('/dev/ttyACM0', False) is True
+    assert session.loadProgrammerCache() is False
+
+    assert session.checkProgrammer('/dev/ttyACM0') is True
+    assert session.loadProgrammerCache()["version"] == '0.4'
+
+def test_reconnect_clears_stale_cache(memory, monkeypatch, tmp_path):
+    session = memory()
+    session.cache_path = str(tmp_path / "cache.json")
+    createPorts(monkeypatch, [('/dev/ttyACM0', 0x239A, 'ABC', 'USB VID:PID=239A:800F SER=ABC')])
+    session.checkProgrammer = lambda portname, cache = True: False
+    assert session.reconnectProgrammer() is False
+
+    assert session.saveProgrammerCache('/dev/ttyACM0', {'Software Version': '0.4'})
+    createPorts(monkeypatch, [('/dev/ttyACM0', 0x239A, 'ABC', 'USB VID:PID=239A:8037 SER=ABC')])
+    assert session.reconnectProgrammer() is False
+    assert session.loadProgrammerCache() is False
+
+    assert session.saveProgrammerCache('/dev/ttyACM0', {'Software Version': '0.3'})
+    def checkProgrammer(portname, cache = True):
+        session.info = {'Title': '32u4 Programmer', 'Software Version': '0.4'}
+        return True
+    session.checkProgrammer = checkProgrammer
+    assert session.reconnectProgrammer() is False
+    assert session.loadProgrammerCache() is False
+
+def test_cache_disabled(memory, tmp_path):
+    session = memory()
+    session.cache_path = str(tmp_path / "cache.json")
+    session.cache_programmer = False
+    assert not session.saveProgrammerCache('/dev/ttyACM0', {'Software Version': '0.4'})
+    assert session.loadProgrammerCache() is False
+
+def test_import_export_file(memory, tmp_path):
+    session = memory()
+    data = randomImage(0x8000)
+    pathname = str(tmp_path / "image.bin")
+
+    assert session.exportFile(pathname, data)
+    image = session.importFile(pathname)
+    assert isinstance(image, bytearray)
+    assert image == data
+    assert session.importFile(str(tmp_path / "missing.bin")) is False
+
+def test_compare_data(memory):
+    session = memory()
+    assert session.compareData(bytearray(b'abc'), bytearray(b'abc')) is True
+    assert session.compareData(bytearray(b'abc'), bytearray(b'abd')) is False
+    assert session.compareData(bytearray(b'ab'), bytearray(b'abc')) is False
+    assert session.compareRanges(bytearray(b'abc'), bytearray(b'xbd')) == ([(0, 1), (2, 3)], 2)
+
+def test_probe_is_quiet(memory):
+    if sys.platform == 'win32':
+        pytest.skip("requires a POSIX pty")
+
+    # A terminal which never answers
+    master, slave = os.openpty()
+    try:
+        session = memory()
+        session.view.verbose = False
+        assert session.probeProgrammer(os.ttyname(slave)) is False
+        assert getLog(session) == "Programmer configured to use AT28C256\n"
+    finally:
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from app import diff
+
+def createImages(length, changes, seed = 1):
+    generator = random.Random(seed)
+    a = bytearray(generator.getrandbits(8) for i in range(length))
+    b = bytearray(a)
+    for i in range(changes):
+        b[generator.randrange(length)] ^= 0xFF
+    return a, b
+
+@pytest.mark.parametrize("length, changes", [(0, 0), (1, 1), (255, 3), (2048, 0), (2048, 40), (4096, 4096)])
+def test_numpy_matches_python(length, changes):
+    if diff.numpy is None:
+        pytest.skip("NumPy not installed")
+
+    a, b = createImages(length, changes)
+    expected = diff._comparePython(memoryview(a), memoryview(b))
+    assert diff._compareNumpy(memoryview(a), memoryview(b)) == expected
+
+def test_compare_ranges():
+    a = bytearray(16)
+    b = bytearray(16)
+    b[1] = b[2] = b[3] = 1
+    b[8] = 1
+    b[15] = 1
+    assert diff.compareImages(a, b) == ([(1, 4), (8, 9), (15, 16)], 5)
+
+def test_compare_across_chunks():
+    a = bytearray(diff.CHUNK_SIZE * 2)
+    b = bytearray(a)
+    b[diff.CHUNK_SIZE - 1] = b[diff.CHUNK_SIZE] = 1
+    assert diff.compareImages(a, b) == ([(diff.CHUNK_SIZE - 1, diff.CHUNK_SIZE + 1)], 2)
+
+def test_compare_identical():
+    a, b = createImages(1024, 0)
+    assert diff.compareImages(a, b) == ([], 0)
+
+def test_compare_lengths_differ():
+    assert diff.compareImages(b'abcd', b'abxdef') == ([(2, 3), (4, 6)], 3)
+    assert diff.compareImages(b'abc', b'abcd') == ([(3, 4)], 1)
+
+def test_merge_ranges():
+    assert diff.mergeRanges([(0, 2), (4, 6), (20, 21)], 2) == [(0, 6), (20, 21)]
+    assert diff.mergeRanges([(0, 2), (2, 3)]) == [(0, 3)]
+    assert diff.mergeRanges([]) == []
+
+def test_offset_ranges():
+    assert diff.offsetRanges([(0, 2), (4, 6)], 0x100) == [(0x100, 0x102), (0x104, 0x106)]
+
+def test_compare_without_numpy(monkeypatch):
+    a, b = createImages(2048, 40)
+    expected = diff.compareImages(a, b)
+    monkeypatch.setattr(diff, 'numpy', None)
+    assert diff.compareImages(a, b) == expected
@@ -0,0 +1,233 @@
+import random
+import time
+
+import pytest
+
+from app import protocol
+from app.emulator import ProgrammerEmulator
+
+class RecordingEmulator(ProgrammerEmulator):
+
+    # Keeps (address, length) of every byte or page write the programmer performs
+    def __init__(self, *args, **kw):
+        ProgrammerEmulator.__init__(self, *args, **kw)
+        self.written = []
+
+    def writeBlock(self, startAddress, data):
+        self.written.append((startAddress, len(data)))
+        return ProgrammerEmulator.writeBlock(self, startAddress, data)
+
+    def writePage(self, address, data):
+        self.written.append((address, len(data)))
+        return ProgrammerEmulator.writePage(self, address, data)
+
+class EventSink():
+
+    def __init__(self):
+        self.events = []
+
+    def handleEvent(self, event):
+        self.events.append(event)
+
+def randomImage(length, seed = 1):
+    generator = random.Random(seed)
+    return bytearray(generator.getrandbits(8) for i in range(length))
+
+def getLog(session):
+    return session.view.stream.getvalue()
+
+@pytest.mark.parametrize("device", ["AT28C16", "AT28C64", "AT28C256"])
+def test_write_read_verify(emulator, controller, device):
+    programmer = emulator(device)
+    session = controller(programmer, device)
+    data = randomImage(len(programmer.memory))
+
+    assert session.writeDevice(data)
+    assert programmer.memory == data
+    assert session.verifyDevice(data)
+    assert session.readDevice() == data
+
+def test_negotiates_info(emulator, controller):
+    session = controller(emulator())
+    assert session.info['Software Version'] == "0.5"
+    assert session.block_size == 512
+    assert session.window == 2
+    assert session.supportsCommand(u'C')
+
+def test_verify_reports_mismatches(emulator, controller):
+    data = randomImage(0x8000)
+    programmer = emulator(image = data)
+    session = controller(programmer)
+
+    programmer.memory[0x0100] ^= 0x01
+    programmer.memory[0x4000:0x4003] = bytearray(b'abc')
+    assert not session.verifyDevice(data)
+    assert session.mismatches == [(0x0100, 0x0101), (0x4000, 0x4003)]
+
+def test_diff_only_writes_changes(emulator, controller):
+    current = randomImage(0x8000)
+    programmer = emulator(cls = RecordingEmulator, image = current)
+    session = controller(programmer)
+
+    data = bytearray(current)
+    data[0x1000] ^= 0xFF
+    data[0x1004] ^= 0xFF
+    assert session.writeDevice(data, True)
+    assert programmer.memory == data
+    assert programmer.written == [(0x1000, 5)]
+
+def test_blank_runs_are_skipped(emulator, controller):
+    programmer = emulator(cls = RecordingEmulator)
+    session = controller(programmer)
+
+    data = bytearray([0xFF] * 0x8000)
+    data[0x4000:0x4010] = randomImage(16)
+    assert session.writeDevice(data)
+    assert programmer.memory == data
+    assert programmer.commands.get('B', 0) > 0
+    assert all([address >= 0x4000 and address + length <= 0x4010 for address, length in programmer.written])
+
+def test_blank_check_and_erase(emulator, controller):
+    programmer = emulator(image = randomImage(0x8000))
+    session = controller(programmer)
+
+    assert not session.blankCheckDevice()
+    assert session.eraseDevice()
+    assert programmer.memory == bytearray([0xFF] * 0x8000)
+    assert session.blankCheckDevice()
+
+def test_stuck_cell_fails_verification(emulator, controller):
+    programmer = emulator()
+    programmer.stuck = {0x0010: 0x00}
+    session = controller(programmer)
+
+    # Bit 7 matches the stuck value, so only verification can tell
+    data = randomImage(0x8000)
+    data[0x0010] = 0x01
+    assert not session.writeDevice(data)
+    assert session.mismatches == [(0x0010, 0x0011)]
+    assert "Unable to verify 1 bytes" in getLog(session)
+
+def test_stuck_cell_times_out(emulator, controller):
+    programmer = emulator()
+    programmer.stuck = {0x003F: 0x00}
+    session = controller(programmer)
+
+    # Last byte of the first page is DATA polled and never reads back bit 7
+    data = randomImage(0x8000)
+    data[0x003F] = 0x80
+    assert not session.writeDevice(data)
+    assert protocol.STATUSES[protocol.STATUS_TIMEOUT] + " at 0x003f" in getLog(session)
+
+def test_flaky_cell_is_rewritten(emulator, controller):
+    programmer = emulator()
+    programmer.flaky = {0x0020: 2}
+    session = controller(programmer)
+    sink = EventSink()
+    session.addSink(sink)
+
+    data = randomImage(0x8000)
+    assert session.writeDevice(data)
+    assert programmer.memory == data
+    assert len([event for event in sink.events if event["event"] == "retry"]) == 2
+
+def test_flaky_cell_gives_up(emulator, controller):
+    programmer = emulator()
+    programmer.flaky = {0x0020: 10}
+    session = controller(programmer)
+
+    data = randomImage(0x8000)
+    assert not session.writeDevice(data)
+    assert session.mismatches == [(0x0020, 0x0021)]
+
+def test_write_protected(emulator, controller):
+    programmer = emulator()
+    programmer.protect = True
+    session = controller(programmer)
+
+    assert not session.writeDevice(randomImage(0x8000))
+    assert programmer.memory == bytearray([0xFF] * 0x8000)
+
+def test_corrupt_response(emulator, controller):
+    data = randomImage(0x8000)
+    programmer = emulator(image = data)
+    session = controller(programmer)
+
+    programmer.corrupt = {programmer.responses + 3}
+    assert session.readDevice() is False
+    assert "failed CRC check" in getLog(session)
+
+    # Later frames are still in sync
+    assert session.readDevice() == data
+
+def test_dropped_response(emulator, controller):
+    data = randomImage(0x8000)
+    programmer = emulator(image = data)
+    session = controller(programmer)
+    session.block_timeout = 0.5
+
+    programmer.drop = {programmer.responses + 2}
+    assert session.readDevice() is False
+    assert "Timed out waiting for response" in getLog(session)
+    assert session.readDevice() == data
+
+def test_oversized_hex_read(emulator, controller):
+    programmer = emulator(image = bytearray(b'abcd'))
+    session = controller(programmer)
+
+    assert session.sendCommand(u'R', 0x0000, 0x8000, 32)
+    assert session.readCommand(session.commands["R"]) is False
+    assert "Command or data length is invalid at 0x0000." in getLog(session)
+
+    # Emulator keeps serving
+    assert session.sendCommand(u'R', 0x0000, 4, 32)
+    assert session.readCommand(session.commands["R"]) == "\r\n0x0000 : 61 62 63 64 \r\n"
+
+def test_late_reply_is_discarded(emulator, controller):
+    data = randomImage(0x8000)
+    programmer = emulator(image = data)
+    session = controller(programmer)
+
+    # Reply to a command whose response was never read
+    assert session.sendCommand(u'r', 0x0000, 16)
+    time.sleep(0.1)
+    assert session.readBlock(0x0010, 16) == data[0x0010:0x0020]
+
+    # Only the reply to the last command sent is accepted
+    assert session.sendCommand(u'r', 0x0000, 16)
+    assert session.readFrame(u'r', sequence = session.sequences[session.serial] - 1) is False
+    assert "Unexpected response from programmer." in getLog(session)
+    assert session.readDevice() == data
+
+def test_segments_leave_device_untouched(emulator, controller):
+    current = randomImage(0x8000)
+    programmer = emulator(cls = RecordingEmulator, image = current)
+    session = controller(programmer)
+
+    segments = [(0x0100, bytearray(b'abc')), (0x4000, bytearray(b'xyz'))]
+    assert session.writeSegments(segments)
+    assert programmer.written == [(0x0100, 3), (0x4000, 3)]
+
+    expected = bytearray(current)
+    expected[0x0100:0x0103] = b'abc'
+    expected[0x4000:0x4003] = b'xyz'
+    assert programmer.memory == expected
+    assert session.verifySegments(segments)
+
+def test_segments_diff_reads_only_segments(emulator, controller):
+    current = randomImage(0x8000)
+    programmer = emulator(cls = RecordingEmulator, image = current)
+    session = controller(programmer)
+
+    segments = [(0x0100, current[0x0100:0x0110]), (0x2000, bytearray(b'changed'))]
+    before = programmer.commands.get('r', 0)
+    assert session.writeSegments(segments, True)
+    assert programmer.commands.get('r', 0) - before == 2
+    assert programmer.written == [(0x2000, 7)]
+
+def test_segments_outside_device(emulator, controller):
+    programmer = emulator("AT28C16")
+    session = controller(programmer, "AT28C16")
+
+    assert not session.writeSegments([(0x0800, bytearray(b'x'))])
+    assert "outside of the device's address range" in getLog(session)
@@ -0,0 +1,36 @@
+import random
+
+from app.gang import GangController
+
+def randomImage(length, seed = 1):
+    generator = random.Random(seed)
+    return bytearray(generator.getrandbits(8) for i in range(length))
+
+def test_write_devices(memory):
+    gang = GangController(memory())
+    gang.sessions = {'a': memory(), 'b': memory()}
+
+    images = {'a': randomImage(0x8000, 1), 'b': randomImage(0x8000, 2)}
+    results = gang.writeDevices(images)
+    assert sorted(results) == ['a', 'b']
+    assert all([result["success"] for result in results.values()])
+    assert gang.sessions['a'].memory == images['a']
+    assert gang.sessions['b'].memory == images['b']
+    assert "Programmed 2 devices" in gang.view.stream.getvalue()
+
+def test_write_devices_reports_failures(memory):
+    gang = GangController(memory())
+    gang.sessions = {'a': memory(), 'b': memory()}
+    gang.sessions['b'].stuck = {0x0000}
+
+    data = randomImage(0x8000)
+    data[0x0000] = 0x00
+    results = gang.writeDevices({'a': data, 'b': data})
+    assert results['a']["success"]
+    assert not results['b']["success"]
+    assert "Failed to program 1 of 2 devices on b." in gang.view.stream.getvalue()
+
+def test_write_devices_without_session(memory):
+    gang = GangController(memory())
+    assert gang.writeDevices({'a': randomImage(0x8000)}) is False
+    assert "No programmer session open on a." in gang.view.stream.getvalue()
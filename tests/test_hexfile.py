@@ -0,0 +1,119 @@
+import binascii
+import io
+
+import pytest
+
+from app import hexfile
+
+def ihexRecord(kind, address, data = b''):
+    record = bytearray([len(data), address >> 8, address & 0xFF, kind]) + bytearray(data)
+    record.append(-sum(record) & 0xFF)
+    return b':' + binascii.hexlify(bytes(record)).upper() + b'\n'
+
+def srecRecord(kind, address, data = b''):
+    size = hexfile.SREC_ADDRESS[kind]
+    record = bytearray([size + len(data) + 1]) + bytearray((address >> (8 * i)) & 0xFF for i in reversed(range(size))) + bytearray(data)
+    record.append(0xFF - (sum(record) & 0xFF))
+    return b'S' + kind.encode('ascii') + binascii.hexlify(bytes(record)).upper() + b'\r\n'
+
+def load(contents):
+    file = io.BytesIO(contents)
+    return hexfile.loadSegments(file, hexfile.detectFormat(file))
+
+def test_detect_format():
+    assert hexfile.detectFormat(io.BytesIO(ihexRecord(hexfile.IHEX_EOF, 0))) == "ihex"
+    assert hexfile.detectFormat(io.BytesIO(srecRecord('9', 0))) == "srec"
+    assert hexfile.detectFormat(io.BytesIO(bytes(bytearray(range(256))))) is None
+    assert hexfile.detectFormat(io.BytesIO(b':not hex\n')) is None
+
+def test_intel_hex_joins_records():
+    contents = ihexRecord(0, 0x0100, b'abcd') + ihexRecord(0, 0x0104, b'ef') + ihexRecord(0, 0x0200, b'gh') + ihexRecord(hexfile.IHEX_EOF, 0)
+    assert load(contents) == [(0x0100, bytearray(b'abcdef')), (0x0200, bytearray(b'gh'))]
+
+def test_intel_hex_out_of_order():
+    contents = ihexRecord(0, 0x0204, b'ef') + ihexRecord(0, 0x0200, b'ab') + ihexRecord(0, 0x0202, b'cd') + ihexRecord(hexfile.IHEX_EOF, 0)
+    assert load(contents) == [(0x0200, bytearray(b'abcdef'))]
+
+def test_intel_hex_extended_segment_address():
+    contents = ihexRecord(hexfile.IHEX_SEGMENT, 0, b'\x10\x00') + ihexRecord(0, 0x0010, b'x') + ihexRecord(hexfile.IHEX_EOF, 0)
+    assert load(contents) == [(0x10010, bytearray(b'x'))]
+
+def test_intel_hex_extended_linear_address():
+    contents = ihexRecord(0, 0x0000, b'a') + ihexRecord(hexfile.IHEX_LINEAR, 0, b'\x00\x02') + ihexRecord(0, 0x0010, b'b') + ihexRecord(hexfile.IHEX_EOF, 0)
+    assert load(contents) == [(0x0000, bytearray(b'a')), (0x20010, bytearray(b'b'))]
+
+def test_intel_hex_ignores_start_address():
+    contents = ihexRecord(0, 0, b'a') + ihexRecord(hexfile.IHEX_START_LINEAR, 0, b'\x00\x00\x01\x00') + ihexRecord(hexfile.IHEX_EOF, 0)
+    assert load(contents) == [(0, bytearray(b'a'))]
+
+def test_intel_hex_stops_at_eof():
+    contents = ihexRecord(0, 0, b'a') + ihexRecord(hexfile.IHEX_EOF, 0) + b'trailing text\n'
+    assert load(contents) == [(0, bytearray(b'a'))]
+
+def test_intel_hex_bad_checksum():
+    record = bytearray(ihexRecord(0, 0x0100, b'abcd'))
+    record[-3:-1] = b'00' if record[-3:-1] != b'00' else b'01'
+    with pytest.raises(ValueError, match = "Line 1: record checksum"):
+        load(bytes(record) + ihexRecord(hexfile.IHEX_EOF, 0))
+
+def test_intel_hex_overlap():
+    contents = ihexRecord(0, 0x0010, b'abcd') + ihexRecord(0, 0x0012, b'xy') + ihexRecord(hexfile.IHEX_EOF, 0)
+    with pytest.raises(ValueError, match = "Line 2: .*overlaps data already defined at 0x0010-0x0013"):
+        load(contents)
+
+def test_intel_hex_overlap_before():
+    contents = ihexRecord(0, 0x0020, b'abcd') + ihexRecord(0, 0x0010, b'x' * 17) + ihexRecord(hexfile.IHEX_EOF, 0)
+    with pytest.raises(ValueError, match = "overlaps"):
+        load(contents)
+
+def test_intel_hex_missing_eof():
+    with pytest.raises(ValueError, match = "end of file record"):
+        load(ihexRecord(0, 0, b'abcd'))
+
+def test_intel_hex_length_mismatch():
+    with pytest.raises(ValueError, match = "byte count"):
+        load(b':0500000061626364FF\n')
+
+def test_intel_hex_unsupported_type():
+    with pytest.raises(ValueError, match = "record type 0x06"):
+        load(ihexRecord(6, 0) + ihexRecord(hexfile.IHEX_EOF, 0))
+
+@pytest.mark.parametrize("kind, terminator", [('1', '9'), ('2', '8'), ('3', '7')])
+def test_srecord_address_sizes(kind, terminator):
+    contents = srecRecord('0', 0, b'HDR') + srecRecord(kind, 0x0200, b'abcd') + srecRecord(kind, 0x0204, b'ef') + srecRecord(terminator, 0)
+    assert load(contents) == [(0x0200, bytearray(b'abcdef'))]
+
+def test_srecord_count():
+    contents = srecRecord('1', 0, b'ab') + srecRecord('1', 2, b'cd') + srecRecord('5', 2) + srecRecord('9', 0)
+    assert load(contents) == [(0, bytearray(b'abcd'))]
+
+def test_srecord_bad_count():
+    contents = srecRecord('1', 0, b'ab') + srecRecord('5', 2) + srecRecord('9', 0)
+    with pytest.raises(ValueError, match = "Line 2: record count is 2, but 1 data records were read"):
+        load(contents)
+
+def test_srecord_bad_checksum():
+    record = bytearray(srecRecord('1', 0x0100, b'abcd'))
+    record[-4:-2] = b'00' if record[-4:-2] != b'00' else b'01'
+    with pytest.raises(ValueError, match = "Line 1: record checksum"):
+        load(bytes(record) + srecRecord('9', 0))
+
+def test_srecord_overlap():
+    contents = srecRecord('1', 0x10, b'abcd') + srecRecord('1', 0x13, b'x') + srecRecord('9', 0)
+    with pytest.raises(ValueError, match = "overlaps"):
+        load(contents)
+
+def test_srecord_missing_termination():
+    with pytest.raises(ValueError, match = "termination record"):
+        load(srecRecord('1', 0, b'ab'))
+
+def test_segments_join_neighbours():
+    segments = hexfile.Segments()
+    segments.add(0, b'ab')
+    segments.add(4, b'ef')
+    segments.add(2, b'cd')
+    assert segments.getSegments() == [(0, bytearray(b'abcdef'))]
+
+def test_flatten_segments():
+    image = hexfile.flattenSegments([(0x10, bytearray(b'ab')), (0x14, bytearray(b'c'))], 0x10, 6)
+    assert image == bytearray(b'ab\xff\xffc\xff')
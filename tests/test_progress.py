@@ -0,0 +1,75 @@
+import json
+import random
+
+from app import progress
+
+class EventSink():
+
+    def __init__(self):
+        self.events = []
+
+    def handleEvent(self, event):
+        self.events.append(event)
+
+def randomImage(length, seed = 1):
+    generator = random.Random(seed)
+    return bytearray(generator.getrandbits(8) for i in range(length))
+
+def test_write_events(memory):
+    session = memory()
+    session.flaky = {0x0020: 1}
+    sink = EventSink()
+    session.addSink(sink)
+
+    assert session.writeDevice(randomImage(0x8000))
+    events = [event for event in sink.events if event["operation"] == u'write']
+    assert [event["event"] for event in events] == ["start", "retry", "end"]
+    assert events[0]["bytes"] == 0x8000
+    assert events[1]["cycle"] == 1
+    assert events[1]["blocks"] == 1
+    assert events[2]["success"] == True
+
+    assert session.removeSink(sink)
+    assert not session.removeSink(sink)
+
+def test_read_events(memory):
+    session = memory()
+    session.block_size = 0x1000
+    sink = EventSink()
+    session.addSink(sink)
+
+    assert session.readDevice() == session.memory
+    blocks = [event for event in sink.events if event["event"] == "block"]
+    assert len(blocks) == 8
+    assert blocks[-1]["done"] == blocks[-1]["total"] == 0x8000
+    assert sink.events[-1]["event"] == "end"
+    assert sink.events[-1]["bytes"] == 0x8000
+
+def test_summary_sink(memory):
+    session = memory()
+    summary = progress.SummarySink(session.view)
+    session.addSink(summary)
+
+    assert session.readDevice() is not False
+    assert summary.operations[u'read']["count"] == 1
+    assert summary.operations[u'read']["bytes"] == 0x8000
+
+    summary.logSummary()
+    lines = session.view.stream.getvalue().splitlines()
+    assert lines[-2].split()[:3] == ["Operation", "Bytes", "Time"]
+    assert lines[-1].split()[:2] == ["read", "32768"]
+
+def test_json_lines_sink(tmp_path):
+    pathname = str(tmp_path / "events.jsonl")
+    sink = progress.JsonLinesSink(pathname)
+    sink.handleEvent({"event": "start", "operation": "read", "bytes": 2048})
+    sink.handleEvent({"event": "end", "operation": "read", "success": True})
+    sink.close()
+
+    with open(pathname) as file:
+        events = [json.loads(line) for line in file]
+    assert [event["event"] for event in events] == ["start", "end"]
+
+def test_format_rate():
+    assert progress.formatRate(512) == "512 B/s"
+    assert progress.formatRate(2048) == "2.0 KB/s"
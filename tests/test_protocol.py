@@ -0,0 +1,59 @@
+import random
+import zlib
+
+import pytest
+
+from app import protocol
+
+def crc_ccitt_update(crc, data):
+    # avr-libc _crc_ccitt_update, as used by the firmware
+    data ^= crc & 0xFF
+    data = (data ^ (data << 4)) & 0xFF
+    return (((data << 8) | (crc >> 8)) ^ (data >> 4) ^ (data << 3)) & 0xFFFF
+
+def reference(data, crc = 0xFFFF):
+    for x in bytearray(data):
+        crc = crc_ccitt_update(crc, x)
+    return crc
+
+def test_crc16_check_value():
+    # CRC-16/MCRF4XX check value
+    assert protocol.crc16(b'123456789') == 0x6F91
+
+def test_crc16_matches_avr_libc():
+    generator = random.Random(1)
+    for length in [0, 1, 2, 5, 64, 517]:
+        data = bytearray(generator.getrandbits(8) for i in range(length))
+        assert protocol.crc16(data) == reference(data)
+
+def test_crc16_continues_running_crc():
+    data = b'32u4 Programmer'
+    assert protocol.crc16(data[5:], protocol.crc16(data[:5])) == protocol.crc16(data)
+
+def test_crc32_matches_zlib():
+    data = bytearray(range(256)) * 4
+    assert protocol.crc32(data) == zlib.crc32(bytes(data)) & 0xFFFFFFFF
+    assert protocol.crc32([0x31, 0x32, 0x33]) == zlib.crc32(b'123') & 0xFFFFFFFF
+
+def test_pack_frame():
+    frame = protocol.packFrame(u'T', sequence = 0x12)
+    assert frame == bytearray([protocol.FRAME_SYNC, ord('T'), 0x12, 0, 0]) + frame[5:]
+    assert frame[5] | (frame[6] << 8) == reference(frame[1:5])
+
+def test_pack_command():
+    frame = protocol.packCommand('w', 0x1234, 2, 0, b'\xAB\xCD', 0x101)
+    assert frame[0] == protocol.FRAME_SYNC
+    assert frame[1:5] == bytearray([ord('w'), 0x01, 7, 0])
+    assert frame[5:12] == bytearray([0x34, 0x12, 0x02, 0x00, 0x00, 0xAB, 0xCD])
+    assert frame[12] | (frame[13] << 8) == reference(frame[1:12])
+
+def test_max_hex_read():
+    assert protocol.hexReadLength(4, 2) == 1 + 2 * 11 + 4 * 3 + 2
+    for lineLength in [1, 16, 32, 255]:
+        length = protocol.maxHexRead(lineLength)
+        assert protocol.hexReadLength(length, lineLength) <= protocol.FRAME_MAX_LENGTH
+        assert protocol.hexReadLength(length + 1, lineLength) > protocol.FRAME_MAX_LENGTH
+
+def test_pack_frame_too_long():
+    with pytest.raises(ValueError):
+        protocol.packFrame(u'R', bytearray(protocol.FRAME_MAX_LENGTH + 1))
@@ -0,0 +1,63 @@
+import pytest
+
+from app import protocol
+from app import trace
+from app.controller import AppController
+
+def record(session, port, pathname):
+    session.serial = port(protocol.packFrame(u'r', b'\x00abcd', 1))
+    session.serial.port = '/dev/ttyACM0'
+    assert session.recordTraffic(pathname)
+    session.serial.open()
+    assert AppController.readBlock(session, 0x0010, 4) == bytearray(b'abcd')
+    session.serial.close()
+    assert session.stopTraffic()
+
+def test_record_trace(memory, port, tmp_path):
+    session = memory()
+    pathname = str(tmp_path / "read.trace")
+    record(session, port, pathname)
+
+    assert isinstance(session.serial, port)
+    records = trace.loadTrace(pathname)
+    assert [records[0][1], records[1][1], records[-1][1]] == [trace.TRACE_OPEN, trace.TRACE_TX, trace.TRACE_CLOSE]
+    assert records[0][2] == b'/dev/ttyACM0'
+    assert records[1][2] == bytes(protocol.packCommand(u'r', 0x0010, 4, sequence = 1))
+    assert b''.join([data for timestamp, kind, data in records if kind == trace.TRACE_RX]) == bytes(protocol.packFrame(u'r', b'\x00abcd', 1))
+
+def test_replay_trace(memory, port, tmp_path):
+    session = memory()
+    pathname = str(tmp_path / "read.trace")
+    record(session, port, pathname)
+
+    assert session.replayTraffic(pathname, False) == '/dev/ttyACM0'
+    assert not session.cache_programmer
+    session.serial.open()
+    assert AppController.readBlock(session, 0x0010, 4) == bytearray(b'abcd')
+
+    # Anything not in the trace stops the replay
+    assert AppController.readBlock(session, 0x0010, 4) is False
+    assert "Replay diverged from trace, unexpected write." in session.view.stream.getvalue()
+
+    assert session.stopTraffic()
+    assert session.cache_programmer
+
+def test_replay_diverged(memory, port, tmp_path):
+    session = memory()
+    pathname = str(tmp_path / "read.trace")
+    record(session, port, pathname)
+
+    assert session.replayTraffic(pathname, False)
+    session.serial.open()
+    assert AppController.readBlock(session, 0x0020, 4) is False
+    assert "Replay diverged from trace, written data differs at record 1." in session.view.stream.getvalue()
+
+def test_replay_invalid_trace(memory, tmp_path):
+    session = memory()
+    pathname = tmp_path / "invalid.trace"
+    pathname.write_bytes(b'not a trace')
+    assert session.replayTraffic(str(pathname)) is False
+    assert "is not a serial trace file" in session.view.stream.getvalue()
+
+    with pytest.raises(ValueError):
+        trace.loadTrace(str(pathname))